@@ -0,0 +1,47 @@
+from rest_framework.exceptions import ValidationError
+
+INCLUDE_PARAM = 'include'
+
+
+def parse_include(request, allowed):
+    """
+    Relaciones pedidas con ?include=a,b
+
+    Returns:
+        set | None: None si el parámetro no está (la respuesta conserva el
+        formato anidado); un conjunto, posiblemente vacío, si está
+    """
+    value = request.query_params.get(INCLUDE_PARAM)
+    if value is None:
+        return None
+    includes = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = includes - set(allowed)
+    if unknown:
+        raise ValidationError({
+            INCLUDE_PARAM: f"Relaciones no soportadas: {', '.join(sorted(unknown))}. "
+                           f"Disponibles: {', '.join(allowed)}"
+        })
+    return includes
+
+
+class IncludedResources:
+    """
+    Sección `included` de un documento compuesto: recursos agrupados por
+    tipo, cada uno una sola vez y sin repetir los recursos principales
+    """
+
+    def __init__(self, primary_type=None, primary_ids=()):
+        self.resources = {}
+        self.primary_type = primary_type
+        self.primary_ids = set(primary_ids)
+
+    def add(self, resource_type, rows):
+        bucket = self.resources.setdefault(resource_type, {})
+        for row in rows:
+            if resource_type == self.primary_type and row['id'] in self.primary_ids:
+                continue
+            bucket.setdefault(row['id'], row)
+
+    @property
+    def data(self):
+        return {resource_type: list(rows.values()) for resource_type, rows in self.resources.items()}
@@ -0,0 +1,68 @@
+import hashlib
+from functools import wraps
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+CONDITIONAL_METHODS = ('GET', 'HEAD')
+
+
+def build_validators(*parts):
+    """
+    ETag débil y Last-Modified a partir de valores ya agregados en la base de
+    datos (ids, conteos, MAX(updated_at)...), sin serializar nada
+
+    Returns:
+        tuple: (etag, last_modified como timestamp o None)
+    """
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    timestamps = [part.timestamp() for part in parts if hasattr(part, 'timestamp')]
+    return f'W/"{digest}"', int(max(timestamps)) if timestamps else None
+
+
+def not_modified_response(request, etag, last_modified):
+    """304 (o 412) si las cabeceras condicionales del cliente siguen vigentes"""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validator_headers(response, etag, last_modified):
+    if etag and not response.has_header('ETag'):
+        response['ETag'] = etag
+    if last_modified and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(last_modified)
+
+
+def get_validator_headers(response):
+    """(etag, last_modified) de una respuesta ya emitida, para reutilizarlos desde caché"""
+    return response.get('ETag'), parse_http_date_safe(response.get('Last-Modified', ''))
+
+
+def conditional_response(validators_method):
+    """
+    Soporte de GET condicional (If-None-Match / If-Modified-Since) para una
+    acción de un ViewSet
+
+    `validators_method` es el nombre de un método del ViewSet que recibe los
+    mismos argumentos que la acción y devuelve el resultado de
+    build_validators(), o None si no aplica (p. ej. el objeto no existe y la
+    acción responderá 404). Se evalúa antes que la acción, así que un 304 no
+    ejecuta serializers.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in CONDITIONAL_METHODS:
+                return view_method(self, request, *args, **kwargs)
+
+            validators = getattr(self, validators_method)(request, *args, **kwargs)
+            if validators is None:
+                return view_method(self, request, *args, **kwargs)
+
+            etag, last_modified = validators
+            response = not_modified_response(request, etag, last_modified)
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                set_validator_headers(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
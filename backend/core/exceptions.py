@@ -187,6 +187,15 @@ class InvalidImageException(CustomAPIException):
         super().__init__(message, status.HTTP_400_BAD_REQUEST)
 
 
+class StorageObjectNotFound(CustomAPIException):
+    """
+    Excepción para archivos que no existen en el bucket
+    """
+    def __init__(self, file_path):
+        message = f'No existe el archivo "{file_path}"'
+        super().__init__(message, status.HTTP_404_NOT_FOUND)
+
+
 class DuplicateSlugException(CustomAPIException):
     """
     Excepción para slugs duplicados
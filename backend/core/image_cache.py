@@ -0,0 +1,224 @@
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: la coalescencia queda limitada al proceso
+    fcntl = None
+
+# Al superar el tope se desaloja hasta esta fracción, para no desalojar en cada escritura
+EVICT_TO = 0.9
+
+_cache = None
+
+
+class ImageDiskCache:
+    """
+    Caché en disco de imágenes renderizadas, con tope de bytes y desalojo
+    LRU: cada acierto actualiza el mtime del archivo y se borran primero los
+    de mtime más antiguo
+
+    Los archivos son <directorio>/<2 primeros caracteres de la clave>/<clave>.<ext>
+    y se escriben con un rename atómico: otro proceso nunca lee uno a medias.
+    El total de bytes lo comparten todos los procesos en locks/size (ver
+    update_size), así el tope vale para la caché entera y no por proceso.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # Sin fcntl (Windows) excluyen solo entre hilos del proceso
+        self.size_lock = threading.Lock()
+        self.evict_lock = threading.Lock()
+        self.flights = {}
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256('\0'.join(map(str, parts)).encode()).hexdigest()
+
+    def path(self, key, extension):
+        return os.path.join(self.directory, key[:2], f'{key}.{extension}')
+
+    def get(self, key, extension):
+        """Contenido guardado o None; un acierto lo marca como usado recientemente"""
+        path = self.path(key, extension)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return content
+
+    def set(self, key, extension, content):
+        path = self.path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.added(len(content))
+
+    def get_or_render(self, key, extension, render):
+        """
+        Contenido de la clave, renderizándolo con `render()` si falta
+
+        Las peticiones simultáneas de la misma clave esperan a la primera y
+        leen su resultado en vez de renderizar cada una.
+
+        Returns:
+            tuple: (contenido, True si venía de la caché)
+        """
+        content = self.get(key, extension)
+        if content is not None:
+            return content, True
+        with self.single_flight(key):
+            content = self.get(key, extension)
+            if content is not None:
+                return content, True
+            content = render()
+            self.set(key, extension, content)
+            return content, False
+
+    @contextmanager
+    def single_flight(self, key):
+        # Hilos del proceso: un lock por clave, con contador para poder soltarlo
+        with self.lock:
+            flight = self.flights.setdefault(key, [threading.Lock(), 0])
+            flight[1] += 1
+        try:
+            with flight[0], self.process_lock(key):
+                yield
+        finally:
+            with self.lock:
+                flight[1] -= 1
+                if not flight[1]:
+                    del self.flights[key]
+
+    def process_lock(self, key):
+        # Entre procesos: flock sobre uno de 256 archivos según la clave
+        return self.file_lock(f'{key[:2]}.lock')
+
+    @contextmanager
+    def file_lock(self, name, blocking=True):
+        """
+        flock exclusivo sobre locks/<name>, que nunca se borra (borrar un
+        archivo bloqueado rompe la exclusión). Entrega el archivo abierto, o
+        None si `blocking` es False y otro proceso lo tiene
+        """
+        directory = os.path.join(self.directory, 'locks')
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), 'a+') as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield None
+                    return
+            try:
+                yield f
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def update_size(self, update):
+        """
+        Aplica `update(total)` al total de bytes compartido (locks/size) bajo
+        su flock y devuelve el nuevo total; `total` es None si aún no se contó
+        """
+        with self.size_lock, self.file_lock('size') as f:
+            f.seek(0)
+            content = f.read().strip()
+            size = update(int(content) if content else None)
+            f.seek(0)
+            f.truncate()
+            f.write(str(size))
+        return size
+
+    @property
+    def size(self):
+        """Total de bytes compartido (None si aún no se contó)"""
+        try:
+            with open(os.path.join(self.directory, 'locks', 'size')) as f:
+                content = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return int(content) if content else None
+
+    def scan_size(self):
+        return sum(size for _, _, size in self.entries())
+
+    def added(self, nbytes):
+        size = self.update_size(lambda size: self.scan_size() if size is None else size + nbytes)
+        if size > self.max_bytes:
+            self.evict(int(self.max_bytes * EVICT_TO))
+
+    def entries(self):
+        """(mtime, ruta, bytes) de cada imagen guardada"""
+        try:
+            shards = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for shard in shards:
+            if shard.name == 'locks' or not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, entry.path, stat.st_size
+
+    def evict(self, target):
+        """
+        Borra las menos usadas hasta quedar en `target` bytes y devuelve el
+        tamaño final (None si ya estaba desalojando otro hilo o proceso)
+
+        El recorrido y los borrados no retienen el lock del total: las demás
+        escrituras siguen mientras tanto. Al terminar, el total se rehace con
+        lo recorrido, más lo que se escribió en el intervalo, y así se corrige
+        lo que se hubiera desviado.
+        """
+        if not self.evict_lock.acquire(blocking=False):
+            return None
+        try:
+            with self.file_lock('evict.lock', blocking=False) as f:
+                if f is None:
+                    return None
+                start = self.update_size(lambda size: size if size is not None else self.scan_size())
+                entries = sorted(self.entries())
+                total = sum(size for _, _, size in entries)
+                for _, path, size in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                return self.update_size(lambda size: total + max(size - start, 0))
+        finally:
+            self.evict_lock.release()
+
+
+def get_image_cache():
+    """Caché de IMAGE_RESIZE_CACHE_DIR compartida por el proceso"""
+    global _cache
+    config = (str(settings.IMAGE_RESIZE_CACHE_DIR), settings.IMAGE_RESIZE_CACHE_MAX_BYTES)
+    if _cache is None or (_cache.directory, _cache.max_bytes) != config:
+        _cache = ImageDiskCache(*config)
+    return _cache
@@ -0,0 +1,165 @@
+import atexit
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# formato de la variante -> (formato de Pillow, content type, extensión)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+
+_pool = None
+# Un hueco por proceso del pool (ver build_variants)
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def render_variants(content, widths, formats, quality):
+    """
+    Decodifica la imagen una vez y genera las variantes redimensionadas
+
+    Se ejecuta en el pool de procesos: recibe y devuelve solo tipos simples.
+    No amplía: los anchos mayores que el original se omiten y, si no queda
+    ninguno, se usa el ancho original.
+
+    Args:
+        content: Bytes de la imagen original
+        widths: Anchos en px de las variantes
+        formats: Claves de VARIANT_FORMATS
+        quality: Calidad de compresión (1-100)
+
+    Returns:
+        list: [{'width', 'height', 'format', 'content'}] de menor a mayor ancho
+    """
+    with Image.open(io.BytesIO(content)) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    targets = sorted({width for width in widths if width < image.width}) or [image.width]
+    variants = []
+    # De mayor a menor: cada variante se reduce desde la anterior, no desde el original
+    current = image
+    for width in reversed(targets):
+        height = max(1, round(image.height * width / image.width))
+        if current.size != (width, height):
+            current = current.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        encoded = []
+        for name in formats:
+            pillow_format = VARIANT_FORMATS[name][0]
+            frame = current.convert('RGB') if pillow_format == 'JPEG' else current
+            buffer = io.BytesIO()
+            frame.save(buffer, pillow_format, quality=quality, optimize=pillow_format == 'JPEG')
+            encoded.append({'width': width, 'height': height, 'format': name, 'content': buffer.getvalue()})
+        variants[:0] = encoded
+    return variants
+
+
+def get_pool():
+    """Pool de procesos compartido (None si IMAGE_VARIANT_WORKERS es 0)"""
+    global _pool, _pool_slots
+    if _pool is None and settings.IMAGE_VARIANT_WORKERS > 0:
+        with _pool_lock:
+            if _pool is None:
+                _pool_slots = threading.BoundedSemaphore(settings.IMAGE_VARIANT_WORKERS)
+                # spawn: el worker no hereda conexiones ni hilos del proceso web
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.IMAGE_VARIANT_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+    return _pool
+
+
+def build_variants(content, widths=None, formats=None, quality=None):
+    """
+    Variantes de una imagen, por defecto las configuradas (IMAGE_VARIANT_WIDTHS
+    x IMAGE_VARIANT_FORMATS); el redimensionado corre en el pool para no
+    ocupar el worker
+
+    Solo se envía al pool con un proceso libre: el resto espera su hueco sin
+    límite, de modo que IMAGE_VARIANT_TIMEOUT mide el redimensionado y no el
+    tiempo en cola detrás de otros hilos.
+    """
+    args = (
+        content,
+        widths or settings.IMAGE_VARIANT_WIDTHS,
+        formats or settings.IMAGE_VARIANT_FORMATS,
+        quality or settings.IMAGE_VARIANT_QUALITY,
+    )
+    pool = get_pool()
+    if pool is None:
+        return render_variants(*args)
+    slots = _pool_slots
+    slots.acquire()
+    try:
+        future = pool.submit(render_variants, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # El hueco se libera cuando el proceso termina, aunque aquí se agote la espera
+    future.add_done_callback(lambda _: slots.release())
+    return future.result(timeout=settings.IMAGE_VARIANT_TIMEOUT)
+
+
+def build_srcset(image_url, variants):
+    """
+    srcset por formato a partir de las variantes guardadas de `image_url`
+
+    Solo cuentan las variantes subidas junto a ese original (<nombre>_<ancho>.<ext>):
+    si la URL se cambió a mano, las anteriores ya no le corresponden.
+
+    Returns:
+        dict: {'webp': 'url 160w, url 320w', 'jpeg': ...}; vacío sin variantes
+    """
+    if not image_url or not variants:
+        return {}
+    stem = f'{os.path.splitext(image_url)[0]}_'
+    srcset = {}
+    for variant in sorted(variants, key=lambda variant: variant['width']):
+        if variant['url'].startswith(stem):
+            srcset.setdefault(variant['format'], []).append(f"{variant['url']} {variant['width']}w")
+    return {name: ', '.join(candidates) for name, candidates in srcset.items()}
+
+
+def parse_resize_params(params, accept=''):
+    """
+    (ancho, formato, calidad) de ?w=&fmt=&q= para el redimensionado bajo demanda
+
+    El ancho se redondea hacia arriba a IMAGE_RESIZE_WIDTH_STEP y la calidad
+    al múltiplo más cercano de IMAGE_RESIZE_QUALITY_STEP para acotar las
+    variantes que puede generar un cliente. Sin `fmt` se elige WebP si
+    el navegador lo acepta (cabecera Accept).
+
+    Raises:
+        ValueError: Parámetro ausente o fuera de rango
+    """
+    try:
+        width = int(params['w'])
+    except (KeyError, ValueError):
+        raise ValueError('El parámetro w (ancho en px) es requerido')
+    if not 1 <= width <= settings.IMAGE_RESIZE_MAX_WIDTH:
+        raise ValueError(f'El ancho debe estar entre 1 y {settings.IMAGE_RESIZE_MAX_WIDTH}')
+    step = settings.IMAGE_RESIZE_WIDTH_STEP
+    width = min(-(-width // step) * step, settings.IMAGE_RESIZE_MAX_WIDTH)
+
+    image_format = params.get('fmt') or ('webp' if 'image/webp' in accept else 'jpeg')
+    if image_format not in VARIANT_FORMATS:
+        raise ValueError(f'Formato no soportado. Formatos: {", ".join(VARIANT_FORMATS)}')
+
+    low, high = settings.IMAGE_RESIZE_QUALITY_RANGE
+    try:
+        quality = int(params.get('q', settings.IMAGE_VARIANT_QUALITY))
+    except ValueError:
+        raise ValueError('La calidad (q) debe ser un entero')
+    if not low <= quality <= high:
+        raise ValueError(f'La calidad debe estar entre {low} y {high}')
+    step = settings.IMAGE_RESIZE_QUALITY_STEP
+    quality = min(max(round(quality / step) * step, low), high)
+    return width, image_format, quality
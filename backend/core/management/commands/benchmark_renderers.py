@@ -0,0 +1,105 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from core.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+
+
+def product_payload(i):
+    """Un producto con la forma de ProductSerializer (precios y fechas ya como texto)"""
+    return {
+        'id': i,
+        'name': f'Producto de prueba {i}',
+        'slug': f'producto-de-prueba-{i}',
+        'description': 'Descripción con tildes, eñes y comillas "dobles" ' * 4,
+        'price': f'{10 + i % 90}.99',
+        'stock': i % 7,
+        'category': i % 12,
+        'category_name': 'Electrónicos',
+        'main_image_url': '',
+        'main_image': f'https://cdn.example.com/products/{i}-0.jpg',
+        'is_active': True,
+        'is_featured': i % 5 == 0,
+        'is_in_stock': i % 7 > 0,
+        'images': [
+            {
+                'id': i * 3 + order,
+                'image_url': f'https://cdn.example.com/products/{i}-{order}.jpg',
+                'alt_text': f'Producto de prueba {i}',
+                'is_main': order == 0,
+                'order': order,
+                'created_at': '2024-05-01T12:30:15.123456Z',
+            }
+            for order in range(3)
+        ],
+        'created_at': '2024-05-01T12:30:15.123456Z',
+        'updated_at': '2024-05-02T08:00:00Z',
+    }
+
+
+def order_payload(items):
+    """Una orden con la forma de OrderSerializer; total_price llega como Decimal"""
+    return {
+        'id': 1,
+        'order_number': 'ORD-1A2B3C4D',
+        'user': 7,
+        'user_email': 'cliente@example.com',
+        'status': 'pending',
+        'status_display': 'Pendiente',
+        'total': '1234.50',
+        'total_items': items * 2,
+        'shipping_address': 'Calle Falsa 123',
+        'shipping_city': 'Ciudad de México',
+        'shipping_postal_code': '01000',
+        'shipping_phone': '+525512345678',
+        'items': [
+            {
+                'id': i,
+                'product': product_payload(i),
+                'quantity': 2,
+                'price': f'{10 + i % 90}.99',
+                'total_price': Decimal(f'{10 + i % 90}.99') * 2,
+            }
+            for i in range(items)
+        ],
+        'created_at': '2024-05-01T12:30:15.123456Z',
+        'updated_at': '2024-05-02T08:00:00Z',
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compara el tiempo de codificación de los renderers de la API (JSON de DRF, orjson y MessagePack)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200, help='Codificaciones por caso')
+        parser.add_argument('--products', type=int, default=100, help='Productos de la página')
+        parser.add_argument('--items', type=int, default=50, help='Items de la orden')
+
+    def handle(self, *args, **options):
+        payloads = [
+            (f'página de {options["products"]} productos', {
+                'next': 'https://api.example.com/api/products/?cursor=abc',
+                'previous': None,
+                'results': [product_payload(i) for i in range(options['products'])],
+            }),
+            (f'orden de {options["items"]} items', order_payload(options['items'])),
+        ]
+        renderers = [('DRF JSONRenderer', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('FastJSONRenderer (orjson)', FastJSONRenderer()))
+        if msgpack is not None:
+            renderers.append(('MessagePackRenderer', MessagePackRenderer()))
+
+        for title, payload in payloads:
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            baseline = None
+            for name, renderer in renderers:
+                content = renderer.render(payload)
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    renderer.render(payload)
+                elapsed = (time.perf_counter() - started) / options['repeat'] * 1000
+                baseline = baseline or elapsed
+                self.stdout.write(
+                    f'  {name:<28} {elapsed:8.3f} ms  {len(content):>8} bytes  x{baseline / elapsed:.1f}'
+                )
@@ -0,0 +1,189 @@
+import base64
+import datetime
+import decimal
+import json
+from collections import OrderedDict
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, OrderBy, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por cursor opaco (keyset / seek)
+
+    En lugar de OFFSET y COUNT(*), cada página filtra a partir de los valores
+    de ordenación de la última fila vista, con `id` como desempate, así que
+    el costo de una página no depende de su profundidad. Respeta el orden que
+    haya dejado OrderingFilter en el queryset (`-created_at`, `price`,
+    `name`, ...).
+
+    Enviar `?page=` conserva la paginación por número de página (con su
+    `count`) para el panel de administración.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    tiebreaker = 'id'
+    page_number_pagination_class = PageNumberPagination
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.delegate = None
+        if request.query_params.get(self.page_number_pagination_class.page_query_param) is not None:
+            self.delegate = self.page_number_pagination_class()
+            return self.delegate.paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['reverse'])
+
+        ordering = self.reverse_ordering(self.ordering) if reverse else self.ordering
+        if cursor:
+            queryset = queryset.filter(self.build_keyset_filter(queryset, ordering, cursor['values']))
+        queryset = queryset.order_by(*[
+            f'-{name}' if descending else name for name, descending in ordering
+        ])
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return self.page
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, queryset):
+        """Orden efectivo del queryset como [(campo, descendente)], con el desempate al final"""
+        ordering = []
+        for item in queryset.query.order_by or queryset.model._meta.ordering:
+            if isinstance(item, OrderBy) and isinstance(item.expression, F):
+                ordering.append((item.expression.name, item.descending))
+            elif isinstance(item, str):
+                ordering.append((item.lstrip('-'), item.startswith('-')))
+            else:
+                raise TypeError(f'Orden no soportado por la paginación keyset: {item!r}')
+
+        if self.tiebreaker not in {name for name, _ in ordering}:
+            descending = ordering[0][1] if ordering else False
+            ordering.append((self.tiebreaker, descending))
+        return ordering
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return [(name, not descending) for name, descending in ordering]
+
+    def build_keyset_filter(self, queryset, ordering, values):
+        """
+        (a, b, id) > (va, vb, vid) expandido para direcciones mixtas:
+        a >= va AND (a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND id > vid))
+
+        La cota `a >= va` es redundante pero es la que permite al planificador
+        buscar en el índice por la primera columna en vez de recorrerlo entero.
+        """
+        if len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        values = [
+            self.parse_value(queryset.model, name, value)
+            for (name, _), value in zip(ordering, values)
+        ]
+        condition = Q()
+        equal_prefix = Q()
+        for (name, descending), value in zip(ordering, values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal_prefix & Q(**{f'{name}__{lookup}': value})
+            equal_prefix &= Q(**{name: value})
+        (name, descending), value = ordering[0], values[0]
+        return Q(**{f'{name}__{"lte" if descending else "gte"}': value}) & condition
+
+    def parse_value(self, model, name, value):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Anotaciones (p. ej. search_rank): el valor ya viene en JSON nativo
+            return value
+        try:
+            return field.to_python(value)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def row_values(self, row):
+        values = []
+        for name, _ in self.ordering:
+            # Filas de modelo o de .values() (ValuesListMixin)
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            if isinstance(value, (decimal.Decimal, datetime.date, datetime.time)):
+                value = str(value) if isinstance(value, decimal.Decimal) else value.isoformat()
+            values.append(value)
+        return values
+
+    def encode_cursor(self, row, reverse):
+        payload = json.dumps({'v': self.row_values(row), 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            return {'values': list(payload['v']), 'reverse': bool(payload['r'])}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.delegate is not None:
+            return self.delegate.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_results(self, data):
+        return data['results']
@@ -0,0 +1,78 @@
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dependencia opcional
+    msgpack = None
+
+# Los tipos que el codificador no maneja de forma nativa (Decimal, fechas,
+# lazy strings, QuerySet...) pasan por el mismo default() que usa DRF, así
+# que la salida es la de JSONRenderer
+drf_encoder = encoders.JSONEncoder()
+
+
+def vary_on_accept(renderer_context):
+    """El formato depende de Accept: las cachés HTTP deben distinguirlo"""
+    response = (renderer_context or {}).get('response')
+    if response is not None:
+        patch_vary_headers(response, ('Accept',))
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer con orjson: mismos bytes que el renderer de DRF (separadores
+    compactos, UTF-8 sin escapar, U+2028/U+2029 escapados)
+
+    Con sangría (Accept con `indent` o la API navegable), sin orjson o si
+    orjson no puede codificar algo (claves que no son texto, enteros de más
+    de 64 bits) se usa el renderer de DRF.
+    """
+    # Fechas y dataclasses pasan por default(), como en DRF. Las claves que
+    # no son texto hacen fallar a orjson y se usa el renderer de DRF
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        vary_on_accept(renderer_context)
+        if data is None:
+            return b''
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=drf_encoder.default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # b'\xe2' es el primer byte de U+2028/U+2029: buscar un solo byte es mucho más rápido
+        if b'\xe2' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack (Accept: application/msgpack o ?format=msgpack), con los
+    mismos valores que la respuesta JSON: decimales como número y fechas
+    como texto ISO 8601
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        vary_on_accept(renderer_context)
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=drf_encoder.default, use_bin_type=True)
+
@@ -0,0 +1,184 @@
+from operator import itemgetter
+from rest_framework import serializers
+from rest_framework.relations import RelatedField
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def parse_field_paths(value):
+    """
+    'id,name,images.image_url' -> {'id': {}, 'name': {}, 'images': {'image_url': {}}}
+
+    Un nodo vacío significa "el campo completo".
+    """
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class FieldSelection:
+    """
+    Campos pedidos con ?fields= y ?omit= (rutas con puntos para los anidados)
+
+    Ejemplos:
+        ?fields=id,name,main_image              solo esos campos
+        ?fields=id,images.image_url             imágenes con solo su URL
+        ?omit=description,images                todo menos esos campos
+        ?omit=items.product.images              en los items del carrito
+    """
+
+    def __init__(self, include=None, omit=None):
+        # include None = todos los campos; omit {} = ninguno
+        self.include = include or None
+        self.omit = omit or {}
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None:
+            return cls()
+        params = request.query_params
+        return cls(parse_field_paths(params.get(FIELDS_PARAM)), parse_field_paths(params.get(OMIT_PARAM)))
+
+    def keeps(self, name):
+        if self.include is not None and name not in self.include:
+            return False
+        return not (name in self.omit and not self.omit[name])
+
+    def keeps_any(self, *names):
+        return any(self.keeps(name) for name in names)
+
+    def nested(self, name):
+        """Selección para los campos de un serializer anidado"""
+        include = self.include.get(name) if self.include is not None else None
+        return FieldSelection(include, self.omit.get(name))
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer que admite ?fields= / ?omit=: los campos descartados se quitan
+    antes de serializar, así que tampoco se calculan
+
+    El serializer raíz lee la selección de la petición y la propaga a sus
+    serializers anidados. `relation_fields` indica qué relación necesita cada
+    campo, para que la vista precargue solo las de los campos pedidos (ver
+    `requested_relations`).
+    """
+    relation_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        self.field_selection = kwargs.pop('field_selection', None)
+        super().__init__(*args, **kwargs)
+
+    def get_field_selection(self):
+        if self.field_selection is None:
+            parent = self.parent
+            if isinstance(parent, serializers.ListSerializer):
+                parent = parent.parent
+            # Solo la raíz lee la petición; los anidados reciben su parte
+            request = self.context.get('request') if parent is None else None
+            self.field_selection = FieldSelection.from_request(request)
+        return self.field_selection
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.get_field_selection()
+        for name in list(fields):
+            if not selection.keeps(name):
+                del fields[name]
+                continue
+            nested = getattr(fields[name], 'child', fields[name])
+            if isinstance(nested, SparseFieldsetMixin):
+                nested.field_selection = selection.nested(name)
+        return fields
+
+    def nested_selection(self, name):
+        """Selección de un campo calculado que serializa otros objetos (SerializerMethodField)"""
+        return self.get_field_selection().nested(name)
+
+    @classmethod
+    def requested_relations(cls, selection):
+        """Relaciones (claves de `relation_fields`) que necesita alguno de los campos pedidos"""
+        return {
+            relation for relation, names in cls.relation_fields.items()
+            if selection.keeps_any(*names)
+        }
+
+
+def requested_relations(serializer_class, request):
+    """
+    Relaciones que necesita la respuesta de `serializer_class` para esta
+    petición, o None (todas) si el serializer no admite selección de campos
+    """
+    if not issubclass(serializer_class, SparseFieldsetMixin):
+        return None
+    return serializer_class.requested_relations(FieldSelection.from_request(request))
+
+
+class ValuesSerializer:
+    """
+    Serialización de solo lectura desde filas de .values(), con la misma
+    salida que `serializer_class` pero sin instanciar modelos ni recorrer la
+    maquinaria de campos de DRF por fila
+
+    Los campos que son columnas se compilan una vez en accesores (columna +
+    to_representation del campo de DRF). Los demás (métodos, propiedades,
+    anidados) se declaran en `computed_fields` y los resuelve
+    `get_<campo>(row)`; `prepare(rows)` carga en bloque lo que necesiten.
+    """
+    serializer_class = None
+    computed_fields = ()
+    # Columnas que usan los campos calculados
+    extra_columns = ('id',)
+
+    def __init__(self, context=None, **kwargs):
+        self.context = context or {}
+        self.serializer = self.serializer_class(context=self.context, **kwargs)
+        self.fields = {name: field for name, field in self.serializer.fields.items() if not field.write_only}
+        self.columns = list(self.extra_columns)
+        self.accessors = []
+        for name, field in self.fields.items():
+            if name in self.computed_fields:
+                self.accessors.append((name, getattr(self, f'get_{name}'), None, False))
+                continue
+            column = '__'.join(field.source_attrs)
+            # Las relaciones por pk ya vienen como id en la fila
+            convert = None if isinstance(field, RelatedField) else field.to_representation
+            self.columns.append(column)
+            self.accessors.append((name, itemgetter(column), convert, len(field.source_attrs) > 1))
+        self.columns = list(dict.fromkeys(self.columns))
+
+    def values(self, queryset):
+        """
+        queryset.values() con las columnas de los campos, más las anotaciones
+        y las columnas de ordenación (las necesita el cursor de la paginación)
+        """
+        names = list(self.columns)
+        for item in queryset.query.order_by or queryset.model._meta.ordering:
+            if isinstance(item, str):
+                names.append(item.lstrip('-'))
+        names.extend(queryset.query.annotations)
+        return queryset.prefetch_related(None).values(*dict.fromkeys(names))
+
+    def prepare(self, rows):
+        """Carga en bloque lo que necesiten los campos calculados"""
+
+    def to_representation(self, row):
+        data = {}
+        for name, get, convert, related in self.accessors:
+            value = get(row)
+            if value is None:
+                # Como DRF: si la relación intermedia es nula, el campo se omite
+                if not related:
+                    data[name] = None
+            else:
+                data[name] = convert(value) if convert else value
+        return data
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.prepare(rows)
+        return [self.to_representation(row) for row in rows]
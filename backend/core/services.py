@@ -1,9 +1,30 @@
 from supabase import create_client, Client
+from storage3.utils import StorageException
 import uuid
 from django.conf import settings
 from django.core.files.uploadedfile import InMemoryUploadedFile
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List
+from .exceptions import StorageObjectNotFound
+from .imaging import VARIANT_FORMATS, build_variants
+
+_upload_pool = None
+_upload_pool_lock = threading.Lock()
+
+
+def get_upload_pool():
+    """Pool de hilos compartido para subidas en paralelo (IMAGE_UPLOAD_WORKERS)"""
+    global _upload_pool
+    if _upload_pool is None:
+        with _upload_pool_lock:
+            if _upload_pool is None:
+                _upload_pool = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_UPLOAD_WORKERS,
+                    thread_name_prefix='image-upload'
+                )
+    return _upload_pool
 
 
 class SupabaseStorageService:
@@ -47,35 +68,105 @@ class SupabaseStorageService:
             # Obtener content_type de manera segura
             content_type = self._get_content_type(file)
             
-            # Leer el contenido del archivo
-            if isinstance(file, InMemoryUploadedFile):
-                file_content = file.read()
-            else:
-                # Para ImageFieldFile y otros tipos
-                if hasattr(file, 'read'):
-                    file_content = file.read()
-                else:
-                    with open(file.path, 'rb') as f:
-                        file_content = f.read()
-            
-            # Subir archivo a Supabase Storage
-            response = self.client.storage.from_(self.bucket).upload(
-                file_path, 
-                file_content,
-                file_options={"content-type": content_type}
-            )
-            
-            # Verificar si la respuesta contiene error
-            if hasattr(response, 'error') and response.error:
-                raise Exception(f"Error al subir archivo: {response.error}")
-            
-            # Si no hay error, obtener URL pública
-            public_url = self.get_public_url(file_path)
-            return public_url
+            return self.upload_bytes(self._read_file(file), file_path, content_type)
                 
         except Exception as e:
             raise Exception(f"Error en upload_image: {str(e)}")
     
+    def upload_image_with_variants(self, file, folder='products'):
+        """
+        Sube la imagen original y sus variantes redimensionadas (WebP/JPEG),
+        junto al original: products/<uuid>.jpg, products/<uuid>_320.webp...
+        
+        La imagen se decodifica una sola vez (core.imaging.build_variants)
+        
+        Args:
+            file: Archivo de imagen
+            folder: Carpeta donde guardar
+        
+        Returns:
+            dict: {'image_url': URL del original, 'variants': [{'url', 'width', 'height', 'format'}]}
+        """
+        try:
+            file_content = self._read_file(file)
+            name = f"{folder}/{uuid.uuid4()}"
+            image_url = self.upload_bytes(
+                file_content,
+                f"{name}{os.path.splitext(file.name)[1]}",
+                self._get_content_type(file)
+            )
+            variants = []
+            for variant in build_variants(file_content):
+                _, content_type, extension = VARIANT_FORMATS[variant['format']]
+                url = self.upload_bytes(variant['content'], f"{name}_{variant['width']}.{extension}", content_type)
+                variants.append({
+                    'url': url,
+                    'width': variant['width'],
+                    'height': variant['height'],
+                    'format': variant['format'],
+                })
+            return {'image_url': image_url, 'variants': variants}
+        
+        except Exception as e:
+            raise Exception(f"Error en upload_image_with_variants: {str(e)}")
+    
+    def upload_images(self, files, folder='products'):
+        """
+        Sube varias imágenes con sus variantes en paralelo
+        
+        La espera es de red: los hilos del pool (acotado por IMAGE_UPLOAD_WORKERS)
+        se reparten las subidas mientras el redimensionado corre en el pool de
+        procesos de core.imaging
+        
+        Args:
+            files: Archivos de imagen
+            folder: Carpeta donde guardar
+        
+        Returns:
+            list: (resultado de upload_image_with_variants, None) o (None, mensaje de error)
+            por archivo, en el mismo orden que `files`
+        """
+        futures = [get_upload_pool().submit(self.upload_image_with_variants, file, folder) for file in files]
+        results = []
+        for future in futures:
+            try:
+                results.append((future.result(), None))
+            except Exception as e:
+                results.append((None, str(e)))
+        return results
+    
+    def upload_bytes(self, content, file_path, content_type):
+        """
+        Sube contenido ya leído a una ruta del bucket
+        
+        Returns:
+            str: URL pública del archivo
+        """
+        response = self.client.storage.from_(self.bucket).upload(
+            file_path,
+            content,
+            file_options={"content-type": content_type}
+        )
+        
+        # Verificar si la respuesta contiene error
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Error al subir archivo: {response.error}")
+        
+        return self.get_public_url(file_path)
+    
+    def _read_file(self, file):
+        """Contenido completo del archivo (subido o ImageFieldFile)"""
+        if isinstance(file, InMemoryUploadedFile):
+            file.seek(0)
+            return file.read()
+        # Para ImageFieldFile y otros tipos
+        if hasattr(file, 'read'):
+            if hasattr(file, 'seek'):
+                file.seek(0)
+            return file.read()
+        with open(file.path, 'rb') as f:
+            return f.read()
+    
     def get_public_url(self, file_path):
         """
         Obtiene la URL pública de un archivo
@@ -92,6 +183,40 @@ class SupabaseStorageService:
         except Exception as e:
             raise Exception(f"Error al obtener URL pública: {str(e)}")
     
+    def download_image(self, file_path):
+        """
+        Descarga un archivo del bucket
+        
+        Args:
+            file_path: Ruta del archivo en el bucket
+        
+        Returns:
+            bytes: Contenido del archivo
+        
+        Raises:
+            StorageObjectNotFound: Si el archivo no existe
+            Exception: Cualquier otro fallo (red, credenciales...)
+        """
+        try:
+            return self.client.storage.from_(self.bucket).download(file_path)
+        except StorageException as e:
+            if self._is_not_found(e):
+                raise StorageObjectNotFound(file_path)
+            raise Exception(f"Error al descargar archivo: {str(e)}")
+        except Exception as e:
+            raise Exception(f"Error al descargar archivo: {str(e)}")
+    
+    def _is_not_found(self, error):
+        """
+        Si el error de Storage indica un archivo inexistente: según la versión
+        responde 404 o 400 con {'error': 'not_found'} en el cuerpo
+        """
+        detail = error.args[0] if error.args and isinstance(error.args[0], dict) else {}
+        return (
+            str(detail.get('statusCode')) == '404'
+            or str(detail.get('error', '')).lower().replace(' ', '_') == 'not_found'
+        )
+    
     def delete_image(self, file_path):
         """
         Elimina una imagen de Supabase Storage
@@ -0,0 +1,160 @@
+import re
+from django.core.exceptions import ValidationError
+from django.db.models import Case, CharField, F, IntegerField, Max, Q, Value, When
+from django.db.models.functions import Cast, Substr
+from django.utils.text import slugify
+
+# Espacio reservado al final del slug para el sufijo numérico ('-12345')
+SUFFIX_LENGTH = 6
+
+
+def taken_slugs(models, condition, exclude=None):
+    """
+    Slugs que cumplen `condition` en cualquiera de los modelos, con una sola
+    consulta (UNION)
+
+    Args:
+        models: Modelos que comparten el espacio de slugs
+        condition: Q sobre el campo slug
+        exclude: Instancia a ignorar (la que se está guardando)
+    """
+    querysets = []
+    for model in models:
+        queryset = model._default_manager.filter(condition)
+        if isinstance(exclude, model) and exclude.pk is not None:
+            queryset = queryset.exclude(pk=exclude.pk)
+        querysets.append(queryset.order_by().values_list('slug', flat=True))
+    first, *rest = querysets
+    return set(first.union(*rest, all=True) if rest else first)
+
+
+def slug_base(value, model):
+    """slugify(value) recortado al campo; el nombre del modelo si no queda nada"""
+    max_length = model._meta.get_field('slug').max_length
+    return (slugify(value) or model._meta.model_name)[:max_length].strip('-')
+
+
+def numbered_slug(base, number, model):
+    """'base-N', recortando la base para que quepa en el campo"""
+    suffix = f'-{number}'
+    return f'{base[:model._meta.get_field("slug").max_length - len(suffix)].rstrip("-")}{suffix}'
+
+
+def numbered_patterns(base, model):
+    """
+    (raíz, regex) de los slugs 'base-N' que puede generar numbered_slug: con
+    una base larga la raíz se recorta según los dígitos de N
+    """
+    max_length = model._meta.get_field('slug').max_length
+    stems = {}
+    for digits in range(1, SUFFIX_LENGTH):
+        stems.setdefault(base[:max_length - digits - 1].rstrip('-'), []).append(digits)
+    return [
+        (stem, rf'^{re.escape(stem)}-[1-9][0-9]{{{min(digits) - 1},{max(digits) - 1}}}$')
+        for stem, digits in stems.items()
+    ]
+
+
+def max_suffixes(models, bases, model, exclude=None):
+    """
+    Por cada base, si el slug exacto está ocupado y el mayor N de los 'base-N'
+    ocupados (0 si no hay), con una sola consulta (UNION) que devuelve una
+    fila por base y modelo en vez de todos los slugs numerados
+
+    Returns:
+        dict: {base: (ocupado, mayor N)}
+    """
+    condition = Q(slug__in=set(bases))
+    groups = [When(slug=base, then=Value(base)) for base in bases]
+    numbers = []
+    for base in bases:
+        for stem, pattern in numbered_patterns(base, model):
+            match = Q(slug__startswith=f'{stem}-', slug__regex=pattern)
+            condition |= match
+            # Después de los exactos: 'a-2' cuenta como ocupado para la base 'a-2', no como N de 'a'
+            groups.append(When(match, then=Value(base)))
+            numbers.append(When(match, then=Cast(Substr('slug', len(stem) + 2), IntegerField())))
+
+    querysets = []
+    for candidate in models:
+        queryset = candidate._default_manager.filter(condition)
+        if isinstance(exclude, candidate) and exclude.pk is not None:
+            queryset = queryset.exclude(pk=exclude.pk)
+        querysets.append(queryset.order_by().annotate(
+            base=Case(*groups, output_field=CharField())
+        ).values('base').annotate(
+            exact=Max(Case(When(slug=F('base'), then=Value(1)), default=Value(0))),
+            top=Max(Case(*numbers, default=Value(0), output_field=IntegerField()))
+        ).values_list('base', 'exact', 'top'))
+    first, *rest = querysets
+    found = dict.fromkeys(bases, (False, 0))
+    for base, exact, top in (first.union(*rest, all=True) if rest else first):
+        taken, highest = found[base]
+        found[base] = (taken or bool(exact), max(highest, top))
+    return found
+
+
+def next_free_slug(base, taken, highest, model, used=()):
+    """'base' si está libre; si no 'base-N' tras el mayor N ocupado, saltando los de `used`"""
+    if not taken and base not in used:
+        return base
+    number = max(highest, 1)
+    while True:
+        number += 1
+        slug = numbered_slug(base, number, model)
+        if slug not in used:
+            return slug
+
+
+def unique_slug(instance, value, models):
+    """
+    Slug libre para `instance` a partir de `value`, con sufijo numérico si
+    ya existe, resuelto con una sola consulta (ver max_suffixes)
+
+    Args:
+        instance: Instancia que se va a guardar
+        value: Texto del que sale el slug (normalmente el nombre)
+        models: Modelos que comparten el espacio de slugs
+    """
+    model = type(instance)
+    base = slug_base(value, model)
+    taken, highest = max_suffixes(models, [base], model, exclude=instance)[base]
+    return next_free_slug(base, taken, highest, model)
+
+
+def unique_slugs(model, values, models, reserved=()):
+    """
+    Versión por lotes de unique_slug: un slug libre por valor, sin repetirse
+    dentro del lote ni con `reserved` (p. ej. slugs explícitos del mismo lote)
+
+    Una consulta con los slugs exactos y, solo para los que chocan, otra con
+    el mayor sufijo de cada uno.
+
+    Returns:
+        list: Slugs en el mismo orden que `values`
+    """
+    if not values:
+        return []
+    bases = [slug_base(value, model) for value in values]
+    used = taken_slugs(models, Q(slug__in=set(bases))) | set(reserved)
+    clashing, seen = set(), set()
+    for base in bases:
+        if base in used or base in seen:
+            clashing.add(base)
+        seen.add(base)
+    highest = {base: top for base, (_, top) in max_suffixes(models, clashing, model).items()} if clashing else {}
+
+    slugs = []
+    for base in bases:
+        slug = next_free_slug(base, False, highest.get(base, 0), model, used)
+        used.add(slug)
+        if slug != base:
+            highest[base] = max(highest.get(base, 0), int(slug.rsplit('-', 1)[1]))
+        slugs.append(slug)
+    return slugs
+
+
+def validate_slug_available(instance, slug, models):
+    """Valida con una sola consulta que ningún otro registro de `models` use el slug"""
+    if taken_slugs(models, Q(slug=slug), exclude=instance):
+        raise ValidationError({'slug': f'Ya existe un registro con el slug "{slug}"'})
@@ -1,15 +1,44 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.utils.translation import gettext_lazy
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from django.urls import reverse
 from products.models import Category, Product
 from core.validators import (
     validate_positive_price, validate_non_negative_stock,
     validate_phone_number, validate_url_format
 )
 from core.permissions import IsAdminOrReadOnly, IsOwnerOrReadOnly
-from core.exceptions import InsufficientStockException
+from core.exceptions import InsufficientStockException, StorageObjectNotFound
+from core.serializers import FieldSelection, parse_field_paths
+from core.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+from core.parsers import FastJSONParser, MessagePackParser
+from core.slugs import unique_slug, unique_slugs, validate_slug_available
+from core import imaging
+from core.image_cache import ImageDiskCache
+from core.services import SupabaseStorageService
+from core.imaging import build_srcset, build_variants, render_variants
+from PIL import Image
+from storage3.utils import StorageException
 
 User = get_user_model()
 
@@ -133,6 +162,35 @@ class ExceptionsTestCase(TestCase):
         self.assertIn('10', str(exception))
 
 
+class FieldSelectionTestCase(TestCase):
+    """Tests para la selección de campos (?fields= / ?omit=)"""
+    
+    def test_parse_field_paths(self):
+        """Test rutas con puntos se convierten en un árbol"""
+        self.assertEqual(
+            parse_field_paths('id, name,images.image_url,,images.order'),
+            {'id': {}, 'name': {}, 'images': {'image_url': {}, 'order': {}}}
+        )
+        self.assertEqual(parse_field_paths(None), {})
+    
+    def test_keeps_and_nested(self):
+        """Test campos incluidos, omitidos y selección anidada"""
+        selection = FieldSelection(parse_field_paths('id,items.product'), parse_field_paths('items.price'))
+        self.assertTrue(selection.keeps('id'))
+        self.assertFalse(selection.keeps('total'))
+        items = selection.nested('items')
+        self.assertTrue(items.keeps('product'))
+        self.assertFalse(items.keeps('price'))
+        # Un campo pedido sin subcampos se sirve completo
+        self.assertTrue(items.nested('product').keeps('name'))
+    
+    def test_empty_selection_keeps_everything(self):
+        """Test sin parámetros se conservan todos los campos"""
+        selection = FieldSelection()
+        self.assertTrue(selection.keeps_any('id', 'images'))
+        self.assertTrue(selection.nested('images').keeps('image_url'))
+
+
 class ModelValidationTestCase(TestCase):
     """Tests para validaciones en modelos"""
     
@@ -179,3 +237,332 @@ class ModelValidationTestCase(TestCase):
         
         with self.assertRaises(ValidationError):
             product.full_clean()
+
+
+@skipUnless(orjson, 'orjson no está instalado')
+class RenderersTestCase(APITestCase):
+    """Tests para los renderers y parsers rápidos de core"""
+    
+    payload = OrderedDict([
+        ('price', Decimal('10.50')),
+        ('total', Decimal('1234567.89')),
+        ('created_at', datetime.datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)),
+        ('naive', datetime.datetime(2024, 5, 1, 12, 30)),
+        ('date', datetime.date(2024, 5, 1)),
+        ('time', datetime.time(8, 15)),
+        ('duration', datetime.timedelta(minutes=90)),
+        ('uuid', uuid.UUID('12345678-1234-5678-1234-567812345678')),
+        ('lazy', gettext_lazy('Producto')),
+        ('text', 'Ñandú «€» \u2028 \u2029 "comillas"'),
+        ('nested', [{'id': 1, 'tags': ('a', 'b')}, None, True, 1.5]),
+    ])
+    
+    def test_json_matches_drf(self):
+        """Test mismos bytes que JSONRenderer de DRF"""
+        self.assertEqual(FastJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+    
+    def test_json_fallbacks(self):
+        """Test claves no textuales, enteros grandes y sangría usan el renderer de DRF"""
+        for data in [{1: 'uno'}, {'big': 2 ** 70}]:
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = 'application/json; indent=4'
+        self.assertEqual(
+            FastJSONRenderer().render(self.payload, indented),
+            JSONRenderer().render(self.payload, indented)
+        )
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+    
+    def test_json_parser(self):
+        """Test el parser JSON acepta cuerpos válidos y rechaza los inválidos"""
+        parser = FastJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO('{"a": [1, "ñ"]}'.encode())), {'a': [1, 'ñ']})
+        for body in [b'{"a": ', b'{"a": NaN}']:
+            with self.assertRaises(ParseError):
+                parser.parse(io.BytesIO(body))
+    
+    @skipUnless(msgpack, 'msgpack no está instalado')
+    def test_msgpack_matches_json_values(self):
+        """Test MessagePack lleva los mismos valores que la respuesta JSON"""
+        content = MessagePackRenderer().render(self.payload)
+        self.assertEqual(msgpack.unpackb(content), json.loads(JSONRenderer().render(self.payload)))
+        self.assertEqual(MessagePackParser().parse(io.BytesIO(content))['price'], 10.5)
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(io.BytesIO(b'\xc1'))
+    
+    @skipUnless(msgpack, 'msgpack no está instalado')
+    def test_msgpack_negotiated_by_accept(self):
+        """Test la API responde MessagePack según Accept y varía por Accept"""
+        category = Category.objects.create(name='Electrónicos')
+        Product.objects.create(name='Laptop', description='Portátil', price=Decimal('999.99'), stock=3, category=category)
+        url = reverse('products:product-list')
+        json_response = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(json_response.content))
+    
+    @skipUnless(msgpack, 'msgpack no está instalado')
+    def test_msgpack_request_body(self):
+        """Test la API acepta cuerpos MessagePack"""
+        User.objects.create_user(email='test@example.com', password='testpass123')
+        response = self.client.post(
+            reverse('accounts:login'),
+            data=msgpack.packb({'email': 'test@example.com', 'password': 'testpass123'}),
+            content_type='application/msgpack'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class SlugAllocatorTestCase(TestCase):
+    """Tests para la asignación de slugs con sufijo numérico"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Electrónicos')
+        self.models = (Product, Category)
+    
+    def create_product(self, name, **kwargs):
+        return Product.objects.create(
+            name=name,
+            description='Test',
+            price=Decimal('10.00'),
+            stock=1,
+            category=self.category,
+            **kwargs
+        )
+    
+    def test_unique_slug_single_query(self):
+        """Test el slug libre se resuelve con una consulta aunque haya varios ocupados"""
+        self.create_product('Laptop')
+        self.create_product('Laptop', slug='laptop-2')
+        self.create_product('Laptop gamer')
+        with self.assertNumQueries(1):
+            slug = unique_slug(Product(name='Laptop'), 'Laptop', self.models)
+        self.assertEqual(slug, 'laptop-3')
+    
+    def test_unique_slug_reads_only_max_suffix(self):
+        """Test con muchos 'base-N' se toma el siguiente al mayor sin traer cada slug"""
+        Product.objects.bulk_create([
+            Product(name='Laptop', slug=slug, description='Test', price=Decimal('10.00'), stock=1, category=self.category)
+            for slug in ['laptop'] + [f'laptop-{number}' for number in range(2, 40)]
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            slug = unique_slug(Product(name='Laptop'), 'Laptop', self.models)
+        self.assertEqual(slug, 'laptop-40')
+        self.assertEqual(len(queries), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(queries[0]['sql'])
+            self.assertLessEqual(len(cursor.fetchall()), len(self.models))
+    
+    def test_unique_slug_free_base_with_numbered_siblings(self):
+        """Test si la base está libre se usa aunque existan 'base-N'"""
+        self.create_product('Laptop', slug='laptop-2')
+        self.assertEqual(unique_slug(Product(name='Laptop'), 'Laptop', self.models), 'laptop')
+    
+    def test_unique_slug_shared_with_categories(self):
+        """Test productos y categorías no comparten slug"""
+        self.assertEqual(unique_slug(Product(), 'Electrónicos', self.models), 'electronicos-2')
+    
+    def test_unique_slug_ignores_own_instance(self):
+        """Test al recalcular el slug de un registro guardado no choca consigo mismo"""
+        product = self.create_product('Laptop')
+        self.assertEqual(unique_slug(product, 'Laptop', self.models), 'laptop')
+    
+    def test_unique_slug_respects_max_length(self):
+        """Test el sufijo recorta la base para no superar el largo del campo"""
+        name = 'x' * 100
+        Category.objects.create(name=name)
+        slug = unique_slug(Category(), name, self.models)
+        self.assertEqual(slug, 'x' * 98 + '-2')
+    
+    def test_unique_slugs_batch(self):
+        """Test en lote los repetidos del propio lote y de la base reciben sufijos distintos"""
+        self.create_product('Mouse')
+        with self.assertNumQueries(2):
+            slugs = unique_slugs(Product, ['Mouse', 'Teclado', 'Mouse', 'Teclado', 'Monitor'], self.models)
+        self.assertEqual(slugs, ['mouse-2', 'teclado', 'mouse-3', 'teclado-2', 'monitor'])
+    
+    def test_unique_slugs_skip_reserved(self):
+        """Test en lote se saltan los slugs reservados y los 'base-N' ya guardados"""
+        self.create_product('Mouse')
+        self.create_product('Mouse', slug='mouse-4')
+        slugs = unique_slugs(Product, ['Mouse', 'Mouse', 'Teclado'], self.models, reserved={'mouse-5', 'teclado'})
+        self.assertEqual(slugs, ['mouse-6', 'mouse-7', 'teclado-2'])
+    
+    def test_validate_slug_available(self):
+        """Test valida con una consulta que el slug no esté en uso"""
+        product = self.create_product('Laptop')
+        with self.assertNumQueries(1):
+            validate_slug_available(product, 'laptop', self.models)
+        with self.assertRaises(ValidationError):
+            validate_slug_available(Product(), 'electronicos', self.models)
+
+
+def make_image_bytes(width, height, image_format='PNG', mode='RGB'):
+    buffer = io.BytesIO()
+    Image.new(mode, (width, height), 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class ImageVariantsTestCase(TestCase):
+    """Tests para las variantes responsive de core.imaging"""
+    
+    def test_render_variants_sizes_and_formats(self):
+        """Test una variante por ancho y formato, sin ampliar el original"""
+        variants = render_variants(make_image_bytes(1000, 500), [160, 320, 640, 1280], ['webp', 'jpeg'], 80)
+        self.assertEqual(
+            [(variant['width'], variant['height'], variant['format']) for variant in variants],
+            [(160, 80, 'webp'), (160, 80, 'jpeg'), (320, 160, 'webp'), (320, 160, 'jpeg'),
+             (640, 320, 'webp'), (640, 320, 'jpeg')]
+        )
+        for variant in variants:
+            with Image.open(io.BytesIO(variant['content'])) as image:
+                self.assertEqual(image.format, variant['format'].upper())
+                self.assertEqual(image.size, (variant['width'], variant['height']))
+    
+    def test_render_variants_small_image(self):
+        """Test una imagen menor que todos los anchos conserva su tamaño"""
+        variants = render_variants(make_image_bytes(100, 50, 'PNG', 'RGBA'), [160, 320], ['jpeg'], 80)
+        self.assertEqual([(variant['width'], variant['height']) for variant in variants], [(100, 50)])
+    
+    @override_settings(IMAGE_VARIANT_WIDTHS=[64], IMAGE_VARIANT_FORMATS=['webp'], IMAGE_VARIANT_WORKERS=1)
+    def test_build_variants_in_process_pool(self):
+        """Test el redimensionado corre en el pool de procesos"""
+        self.addCleanup(setattr, imaging, '_pool', None)
+        pool = imaging.get_pool()
+        self.addCleanup(pool.shutdown)
+        variants = build_variants(make_image_bytes(200, 100))
+        self.assertEqual([(variant['width'], variant['height']) for variant in variants], [(64, 32)])
+    
+    @override_settings(IMAGE_VARIANT_TIMEOUT=0.5)
+    def test_build_variants_timeout_excludes_queue(self):
+        """Test con más hilos que procesos, la espera en cola no cuenta para el timeout"""
+        def slow_render(*args):
+            time.sleep(0.3)
+            return []
+        # Un pool de un hilo hace de pool de un proceso y admite el render parcheado
+        with ThreadPoolExecutor(max_workers=1) as pool, \
+                mock.patch.object(imaging, '_pool', pool), \
+                mock.patch.object(imaging, '_pool_slots', threading.BoundedSemaphore(1)), \
+                mock.patch.object(imaging, 'render_variants', slow_render):
+            with ThreadPoolExecutor(max_workers=3) as uploads:
+                futures = [uploads.submit(build_variants, b'imagen') for _ in range(3)]
+                # El tercero espera 0.6 s a los dos primeros: sin huecos agotaría los 0.5 s
+                self.assertEqual([future.result() for future in futures], [[], [], []])
+    
+    def test_build_srcset(self):
+        """Test srcset por formato, ordenado por ancho, solo con variantes del original"""
+        variants = [
+            {'url': 'https://cdn.test/p/a_640.webp', 'width': 640, 'height': 320, 'format': 'webp'},
+            {'url': 'https://cdn.test/p/a_160.webp', 'width': 160, 'height': 80, 'format': 'webp'},
+            {'url': 'https://cdn.test/p/a_160.jpg', 'width': 160, 'height': 80, 'format': 'jpeg'},
+            {'url': 'https://cdn.test/p/b_160.webp', 'width': 160, 'height': 80, 'format': 'webp'},
+        ]
+        self.assertEqual(build_srcset('https://cdn.test/p/a.png', variants), {
+            'webp': 'https://cdn.test/p/a_160.webp 160w, https://cdn.test/p/a_640.webp 640w',
+            'jpeg': 'https://cdn.test/p/a_160.jpg 160w',
+        })
+        self.assertEqual(build_srcset('https://cdn.test/p/c.png', variants), {})
+        self.assertEqual(build_srcset(None, variants), {})
+
+
+class StorageServiceTestCase(TestCase):
+    """Tests para los errores de descarga de SupabaseStorageService"""
+    
+    def download_raising(self, error):
+        service = SupabaseStorageService()
+        service._client = mock.Mock()
+        service._client.storage.from_.return_value.download.side_effect = error
+        return service.download_image('products/foto.jpg')
+    
+    def test_missing_object(self):
+        """Test un archivo inexistente se distingue de los demás fallos"""
+        for detail in ({'statusCode': 404}, {'statusCode': 400, 'error': 'not_found', 'message': 'Object not found'}):
+            with self.assertRaises(StorageObjectNotFound):
+                self.download_raising(StorageException(detail))
+    
+    def test_other_failures(self):
+        """Test credenciales o red caída no cuentan como archivo inexistente"""
+        for error in (StorageException({'statusCode': 403, 'error': 'Unauthorized'}), ConnectionError('timed out')):
+            with self.assertRaises(Exception) as context:
+                self.download_raising(error)
+            self.assertNotIsInstance(context.exception, StorageObjectNotFound)
+
+
+class ImageDiskCacheTestCase(TestCase):
+    """Tests para la caché en disco de imágenes redimensionadas"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+    
+    def store(self, cache, key, nbytes, age):
+        cache.set(key, 'webp', b'x' * nbytes)
+        # mtime explícito: el orden LRU no depende de la resolución del reloj
+        stamp = time.time() - age
+        os.utime(cache.path(key, 'webp'), (stamp, stamp))
+    
+    def test_get_or_render_caches(self):
+        """Test la segunda lectura sale de disco sin renderizar"""
+        cache = ImageDiskCache(self.directory, 1024)
+        key = cache.make_key('products/a.jpg', 320, 'webp', 80)
+        self.assertEqual(cache.get_or_render(key, 'webp', lambda: b'imagen'), (b'imagen', False))
+        self.assertEqual(cache.get_or_render(key, 'webp', self.fail), (b'imagen', True))
+    
+    def test_lru_eviction(self):
+        """Test al superar el tope se borran las menos usadas recientemente"""
+        cache = ImageDiskCache(self.directory, 250)
+        self.store(cache, 'aa1', 100, age=30)
+        self.store(cache, 'bb2', 100, age=20)
+        # Un acierto renueva la entrada más antigua
+        cache.get('aa1', 'webp')
+        cache.set('cc3', 'webp', b'x' * 100)
+        
+        self.assertIsNotNone(cache.get('aa1', 'webp'))
+        self.assertIsNone(cache.get('bb2', 'webp'))
+        self.assertIsNotNone(cache.get('cc3', 'webp'))
+        self.assertEqual(cache.size, 200)
+    
+    def test_cap_shared_between_processes(self):
+        """Test dos cachés sobre el mismo directorio (dos workers) respetan un único tope"""
+        first = ImageDiskCache(self.directory, 250)
+        second = ImageDiskCache(self.directory, 250)
+        for index in range(6):
+            self.store(first if index % 2 else second, f'{index}{index}k', 100, age=60 - index)
+        
+        self.assertLessEqual(first.scan_size(), 250)
+        self.assertEqual(first.size, first.scan_size())
+        self.assertEqual(second.size, first.size)
+    
+    def test_evict_corrects_drifted_size(self):
+        """Test el desalojo rehace el total con lo que hay en disco"""
+        cache = ImageDiskCache(self.directory, 1024)
+        self.store(cache, 'aa1', 100, age=10)
+        # Borrado por fuera: el total compartido se desvía
+        os.remove(cache.path('aa1', 'webp'))
+        self.assertEqual(cache.size, 100)
+        
+        self.assertEqual(cache.evict(1024), 0)
+        self.assertEqual(cache.size, 0)
+    
+    def test_concurrent_requests_render_once(self):
+        """Test peticiones simultáneas de la misma clave renderizan una sola vez"""
+        cache = ImageDiskCache(self.directory, 1024)
+        renders = []
+        
+        def render():
+            renders.append(1)
+            time.sleep(0.2)
+            return b'imagen'
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_render('dd4', 'webp', render)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(renders), 1)
+        self.assertEqual(sorted(hit for _, hit in results), [False, True, True, True])
+        self.assertEqual(cache.flights, {})
@@ -45,18 +45,6 @@ def validate_secure_password(password):
         raise ValidationError('La contraseña debe contener al menos un número')
 
 
-def validate_unique_slug(value, model_class, instance=None):
-    """
-    Valida que el slug sea único
-    """
-    queryset = model_class.objects.filter(slug=value)
-    if instance:
-        queryset = queryset.exclude(pk=instance.pk)
-    
-    if queryset.exists():
-        raise ValidationError(f'Ya existe un registro con el slug "{value}"')
-
-
 def validate_image_file(file):
     """
     Valida que el archivo sea una imagen válida
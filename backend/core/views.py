@@ -1,3 +1,27 @@
-from django.shortcuts import render
+from django.conf import settings
+from rest_framework.response import Response
 
-# Create your views here.
+
+class ValuesListMixin:
+    """
+    list() servido desde filas de .values() con `values_serializer_class`
+    (ver core.serializers.ValuesSerializer): misma respuesta que el
+    serializer del ViewSet sin instanciar modelos
+
+    Se desactiva con FAST_LIST_SERIALIZATION = False.
+    """
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        return self.values_list_response(self.filter_queryset(self.get_queryset()))
+
+    def values_list_response(self, queryset, values_serializer_class=None):
+        values_serializer_class = values_serializer_class or self.values_serializer_class
+        serializer = values_serializer_class(context=self.get_serializer_context())
+        rows = serializer.values(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from decouple import config
 from datetime import timedelta
+from importlib.util import find_spec
 import os
 import dj_database_url
 
@@ -178,7 +179,24 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'accounts.User'
 
 # Django REST Framework Configuration
+# Renderers y parsers de core (orjson; sin él, el codificador de DRF).
+# MessagePack se ofrece por Accept solo si la librería está instalada
+API_RENDERER_CLASSES = [
+    'core.renderers.FastJSONRenderer',
+    'rest_framework.renderers.BrowsableAPIRenderer',
+]
+API_PARSER_CLASSES = [
+    'core.parsers.FastJSONParser',
+    'rest_framework.parsers.FormParser',
+    'rest_framework.parsers.MultiPartParser',
+]
+if find_spec('msgpack'):
+    API_RENDERER_CLASSES.insert(1, 'core.renderers.MessagePackRenderer')
+    API_PARSER_CLASSES.insert(1, 'core.parsers.MessagePackParser')
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': API_RENDERER_CLASSES,
+    'DEFAULT_PARSER_CLASSES': API_PARSER_CLASSES,
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
@@ -224,10 +242,94 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/webp']
 
+# Variantes responsive generadas al subir imágenes (core.imaging)
+IMAGE_VARIANT_WIDTHS = [160, 320, 640, 1280]
+IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+IMAGE_VARIANT_QUALITY = config('IMAGE_VARIANT_QUALITY', default=80, cast=int)
+# Procesos del pool de redimensionado; 0 redimensiona en el propio worker
+IMAGE_VARIANT_WORKERS = config('IMAGE_VARIANT_WORKERS', default=2, cast=int)
+IMAGE_VARIANT_TIMEOUT = config('IMAGE_VARIANT_TIMEOUT', default=30, cast=int)
+
+# Subida de varias imágenes por petición (/api/products/upload_images/)
+IMAGE_UPLOAD_BATCH_MAX_FILES = config('IMAGE_UPLOAD_BATCH_MAX_FILES', default=20, cast=int)
+# Hilos por proceso que suben a Supabase Storage en paralelo
+IMAGE_UPLOAD_WORKERS = config('IMAGE_UPLOAD_WORKERS', default=4, cast=int)
+
+# Redimensionado bajo demanda (/api/images/resize/<ruta>?w=&fmt=&q=)
+IMAGE_RESIZE_CACHE_DIR = config('IMAGE_RESIZE_CACHE_DIR', default=str(BASE_DIR / 'var' / 'image_cache'))
+IMAGE_RESIZE_CACHE_MAX_BYTES = config('IMAGE_RESIZE_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+IMAGE_RESIZE_MAX_WIDTH = 2560
+# Los anchos pedidos se redondean hacia arriba a múltiplos de este paso (limita las variantes posibles)
+IMAGE_RESIZE_WIDTH_STEP = 40
+IMAGE_RESIZE_QUALITY_RANGE = (30, 95)
+# La calidad pedida se redondea al múltiplo más cercano de este paso (mismo motivo)
+IMAGE_RESIZE_QUALITY_STEP = 5
+# Las rutas del bucket llevan un uuid: el contenido de una URL no cambia nunca
+IMAGE_RESIZE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Product search
+# 'database': full-text de PostgreSQL (icontains en SQLite)
+# 'bm25': índice invertido en memoria de products.search_engine
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='database')
+PRODUCT_SEARCH_INDEX_PATH = config(
+    'PRODUCT_SEARCH_INDEX_PATH',
+    default=str(BASE_DIR / 'var' / 'product_search_index.pickle')
+)
+PRODUCT_SEARCH_MAX_RESULTS = config('PRODUCT_SEARCH_MAX_RESULTS', default=200, cast=int)
+# Cada worker aplica al índice los productos modificados (updated_at) cuando
+# cambia la versión del catálogo o, como mínimo, cada este número de segundos
+PRODUCT_SEARCH_SYNC_INTERVAL = config('PRODUCT_SEARCH_SYNC_INTERVAL', default=30, cast=int)
+# Ventana que se vuelve a leer en cada sincronización (transacciones que confirman tarde)
+PRODUCT_SEARCH_SYNC_LAG = config('PRODUCT_SEARCH_SYNC_LAG', default=60, cast=int)
+
+# Product facets (/api/products/facets/)
+PRODUCT_FACET_PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000]
+PRODUCT_FACETS_CACHE_TIMEOUT = config('PRODUCT_FACETS_CACHE_TIMEOUT', default=300, cast=int)
+
+# Relacionados por categoría precalculados (products.CategoryRelatedProduct)
+RELATED_PRODUCTS_LIMIT = config('RELATED_PRODUCTS_LIMIT', default=4, cast=int)
+# Estado de "comprados juntos" (orders.recommendations) entre ejecuciones incrementales
+PRODUCT_RECOMMENDATIONS_STATE_PATH = config(
+    'PRODUCT_RECOMMENDATIONS_STATE_PATH',
+    default=str(BASE_DIR / 'var' / 'bought_together.npz')
+)
+# Cada ejecución incremental relee las órdenes modificadas en estos segundos
+# previos a la anterior, para sumar las que se confirmaron tarde
+PRODUCT_RECOMMENDATIONS_LAG = config('PRODUCT_RECOMMENDATIONS_LAG', default=300, cast=int)
+# Estado de la similitud TF-IDF (products.similarity) entre ejecuciones incrementales
+PRODUCT_SIMILARITY_STATE_PATH = config(
+    'PRODUCT_SIMILARITY_STATE_PATH',
+    default=str(BASE_DIR / 'var' / 'product_similarity.npz')
+)
+# Igual que PRODUCT_RECOMMENDATIONS_LAG, para los productos modificados
+PRODUCT_SIMILARITY_LAG = config('PRODUCT_SIMILARITY_LAG', default=300, cast=int)
+
+# Altas y actualizaciones en bloque (/api/products/bulk/, solo administradores)
+PRODUCT_BULK_MAX_ITEMS = config('PRODUCT_BULK_MAX_ITEMS', default=5000, cast=int)
+# Filas por sentencia INSERT/UPDATE dentro de la transacción de la petición
+PRODUCT_BULK_BATCH_SIZE = config('PRODUCT_BULK_BATCH_SIZE', default=500, cast=int)
+
+# Cache
+# LocMemCache es por proceso; con varios workers usar
+# django.core.cache.backends.filebased.FileBasedCache y una ruta en CACHE_LOCATION
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ecommerce-backend'),
+    }
+}
+# Respuestas del catálogo (destacados, últimos, categorías): se invalidan al
+# cambiar la versión del catálogo, el TTL solo limpia entradas huérfanas
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=86400, cast=int)
+
+# Listados de productos, categorías y órdenes serializados desde .values()
+# (core.views.ValuesListMixin); False vuelve a los serializers de DRF
+FAST_LIST_SERIALIZATION = config('FAST_LIST_SERIALIZATION', default=True, cast=bool)
+
 # Static files configuration (moved above)
 
 # Logging Configuration
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_backend.settings')
 
 application = get_wsgi_application()
+
+# Con el buscador BM25 el índice se carga (o se construye) al arrancar el
+# worker, nunca dentro de la primera petición
+from products.search import uses_search_index  # noqa: E402
+
+if uses_search_index():
+    from products.search_engine import warm_search_index
+    warm_search_index()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from orders.recommendations import MIN_SUPPORT, TOP_N, build_bought_together
+
+
+class Command(BaseCommand):
+    help = 'Calcula los productos "comprados juntos" a partir de los items de las órdenes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recalcular desde cero en lugar de sumar solo las órdenes modificadas')
+        parser.add_argument('--path', help='Archivo .npz con el estado entre ejecuciones')
+        parser.add_argument('--top', type=int, default=TOP_N, help='Relacionados por producto')
+        parser.add_argument('--min-support', type=int, default=MIN_SUPPORT, help='Mínimo de órdenes en común')
+    
+    def handle(self, *args, **options):
+        result = build_bought_together(
+            full=options['full'],
+            path=options['path'],
+            top_n=options['top'],
+            min_support=options['min_support']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Órdenes procesadas: {result['orders']}, canceladas descontadas: {result['cancelled']}, "
+            f"productos recalculados: {result['products']}, "
+            f"enlaces guardados: {result['links']}"
+        ))
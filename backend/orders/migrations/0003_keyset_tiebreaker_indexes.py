@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_created',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_status_created',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status', '-created_at', '-id'], name='order_user_status_created'),
+        ),
+    ]
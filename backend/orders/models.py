@@ -80,6 +80,14 @@ class Order(models.Model):
         verbose_name = 'Orden'
         verbose_name_plural = 'Órdenes'
         ordering = ['-created_at']
+        indexes = [
+            # Historial del usuario (my_orders), con y sin filtro de estado; `-id`
+            # es el desempate de KeysetPagination
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created'),
+            models.Index(fields=['user', 'status', '-created_at', '-id'], name='order_user_status_created'),
+            # Órdenes modificadas desde la última ejecución de orders.recommendations
+            models.Index(fields=['updated_at'], name='order_updated_at'),
+        ]
     
     def __str__(self):
         return f'Orden {self.order_number}'
@@ -0,0 +1,239 @@
+import os
+from datetime import timedelta
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from products.models import Product, RelatedProduct
+from .models import OrderItem
+
+# Pares comprados juntos menos veces que esto se descartan (el lift es ruido)
+MIN_SUPPORT = 2
+TOP_N = 8
+
+
+class CooccurrenceState:
+    """
+    Matriz simétrica producto × producto con el número de órdenes en que
+    aparecen juntos (la diagonal es el número de órdenes de cada producto),
+    más el total de órdenes, los ids de las órdenes sumadas y el momento de
+    la última ejecución
+    """
+
+    def __init__(self, product_ids=None, matrix=None, orders=0, counted=None, synced_at=None):
+        self.product_ids = np.asarray(product_ids if product_ids is not None else [], dtype=np.int64)
+        size = len(self.product_ids)
+        self.matrix = matrix if matrix is not None else sparse.csr_matrix((size, size), dtype=np.int64)
+        self.orders = int(orders)
+        # Ordenado: las órdenes que se cancelen después se restan solo si se habían sumado
+        self.counted = np.asarray(counted if counted is not None else [], dtype=np.int64)
+        self.synced_at = synced_at
+
+    def merge(self, product_ids, matrix, orders):
+        """Suma (o resta, con conteos negativos) los de un lote de órdenes, alineando ambos índices de productos"""
+        all_ids = np.union1d(self.product_ids, product_ids)
+        self.matrix = (
+            reindex(self.matrix, np.searchsorted(all_ids, self.product_ids), len(all_ids))
+            + reindex(matrix, np.searchsorted(all_ids, product_ids), len(all_ids))
+        ).tocsr()
+        self.matrix.eliminate_zeros()
+        self.product_ids = all_ids
+        self.orders += orders
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        matrix = self.matrix.tocsr()
+        temporary_path = f'{path}.tmp.npz'
+        np.savez_compressed(
+            temporary_path,
+            product_ids=self.product_ids,
+            data=matrix.data,
+            indices=matrix.indices,
+            indptr=matrix.indptr,
+            totals=np.array([self.orders], dtype=np.int64),
+            counted=self.counted,
+            synced_at=np.array([self.synced_at.isoformat() if self.synced_at else '']),
+        )
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        if not path or not os.path.exists(path):
+            return cls()
+        with np.load(path) as stored:
+            if 'counted' not in stored:
+                # Formato anterior (marca de agua por id): se reconstruye desde cero
+                return cls()
+            size = len(stored['product_ids'])
+            matrix = sparse.csr_matrix(
+                (stored['data'], stored['indices'], stored['indptr']), shape=(size, size)
+            )
+            synced_at = parse_datetime(str(stored['synced_at'][0])) if stored['synced_at'][0] else None
+            return cls(stored['product_ids'], matrix, stored['totals'][0], stored['counted'], synced_at)
+
+
+def reindex(matrix, positions, size):
+    """Reubica filas y columnas de `matrix` en un índice de productos mayor"""
+    coo = matrix.tocoo()
+    return sparse.csr_matrix(
+        (coo.data, (positions[coo.row], positions[coo.col])), shape=(size, size)
+    )
+
+
+def load_order_items(since=None):
+    """
+    (order_id, product_id, cancelada) de los items de las órdenes modificadas
+    desde `since` (todas si es None), como un array de numpy de forma (n, 3)
+
+    Las órdenes se seleccionan por updated_at: así entran tanto las nuevas
+    como las que se cancelaron después de sumarse.
+    """
+    items = OrderItem.objects.order_by()
+    if since is not None:
+        items = items.filter(order__updated_at__gte=since)
+    rows = items.annotate(
+        cancelled=Case(When(order__status='cancelled', then=Value(1)), default=Value(0))
+    ).values_list('order_id', 'product_id', 'cancelled').iterator(chunk_size=10000)
+    return np.fromiter(rows, dtype=np.dtype((np.int64, 3))).reshape(-1, 3)
+
+
+def cooccurrence_counts(pairs):
+    """
+    Conteos de co-ocurrencia de un lote: con B la matriz binaria orden ×
+    producto, BᵀB cuenta en cuántas órdenes aparece cada par
+
+    Returns:
+        tuple: (ids de producto, matriz de conteos, número de órdenes)
+    """
+    order_ids, order_index = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, product_index = np.unique(pairs[:, 1], return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int64), (order_index, product_index)),
+        shape=(len(order_ids), len(product_ids))
+    )
+    # Un producto repetido en la misma orden cuenta una vez
+    baskets.data[:] = 1
+    return product_ids, (baskets.T @ baskets).tocsr(), len(order_ids)
+
+
+def score_pairs(state, min_support=MIN_SUPPORT, top_n=TOP_N, product_ids=None):
+    """
+    Top-N de productos comprados junto a cada producto
+
+    Se descartan los pares con soporte menor a `min_support` o con lift <= 1
+    (aparecen juntos menos de lo que cabría esperar por azar) y el resto se
+    ordena por confianza P(B | A), desempatando por lift.
+
+    Args:
+        product_ids: Limitar el resultado a estos productos (todos si es None)
+
+    Returns:
+        tuple: arrays (producto, relacionado, posición, confianza)
+    """
+    coo = state.matrix.tocoo()
+    counts = state.matrix.diagonal().astype(np.float64)
+    keep = (coo.row != coo.col) & (coo.data >= min_support)
+    if product_ids is not None:
+        keep &= np.isin(state.product_ids[coo.row], product_ids)
+    rows, cols = coo.row[keep], coo.col[keep]
+    together = coo.data[keep].astype(np.float64)
+
+    confidence = together / counts[rows]
+    lift = confidence * state.orders / counts[cols]
+    positive = lift > 1
+    rows, cols, confidence, lift = rows[positive], cols[positive], confidence[positive], lift[positive]
+
+    # Orden por producto y dentro de cada producto por confianza y lift, descendentes
+    order = np.lexsort((-lift, -confidence, rows))
+    rows, cols, confidence = rows[order], cols[order], confidence[order]
+    if not len(rows):
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty, np.array([], dtype=np.float64)
+
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    top = rank < top_n
+    return (
+        state.product_ids[rows[top]],
+        state.product_ids[cols[top]],
+        rank[top],
+        confidence[top],
+    )
+
+
+def store_bought_together(products, related, ranks, scores, product_ids=None):
+    """Reemplaza las filas 'bought_together' (de `product_ids`, o todas) en una transacción"""
+    existing = np.fromiter(Product.objects.values_list('id', flat=True).iterator(), dtype=np.int64)
+    alive = np.isin(products, existing) & np.isin(related, existing)
+
+    links = [
+        RelatedProduct(
+            product_id=product_id,
+            related_id=related_id,
+            kind=RelatedProduct.KIND_BOUGHT_TOGETHER,
+            rank=rank,
+            score=score
+        )
+        for product_id, related_id, rank, score in zip(
+            products[alive].tolist(), related[alive].tolist(), ranks[alive].tolist(), scores[alive].tolist()
+        )
+    ]
+    stale = RelatedProduct.objects.filter(kind=RelatedProduct.KIND_BOUGHT_TOGETHER)
+    if product_ids is not None:
+        stale = stale.filter(product_id__in=product_ids.tolist())
+    with transaction.atomic():
+        stale.delete()
+        RelatedProduct.objects.bulk_create(links, batch_size=2000)
+    return len(links)
+
+
+def build_bought_together(full=False, path=None, top_n=TOP_N, min_support=MIN_SUPPORT):
+    """
+    Construye (o actualiza) los "comprados juntos" a partir de OrderItem
+
+    En modo incremental se releen las órdenes modificadas desde la ejecución
+    anterior menos PRODUCT_RECOMMENDATIONS_LAG segundos, para no perder las
+    que se confirmaron tarde. Las que aún no se habían sumado se suman, las
+    sumadas que ahora están canceladas se restan y se recalculan los
+    productos que aparecen en ellas. Los demás productos conservan su top-N
+    aunque el total de órdenes (y por tanto el lift) haya cambiado un poco;
+    una ejecución con `full=True` lo recalcula todo.
+
+    Returns:
+        dict: Órdenes sumadas, órdenes restadas, productos recalculados y enlaces guardados
+    """
+    path = path or settings.PRODUCT_RECOMMENDATIONS_STATE_PATH
+    state = CooccurrenceState() if full else CooccurrenceState.load(path)
+    full = full or state.synced_at is None
+
+    started = timezone.now()
+    since = None if full else state.synced_at - timedelta(seconds=settings.PRODUCT_RECOMMENDATIONS_LAG)
+    items = load_order_items(since)
+    cancelled = items[:, 2].astype(bool)
+    counted = np.isin(items[:, 0], state.counted)
+    added, removed = items[~cancelled & ~counted, :2], items[cancelled & counted, :2]
+    if not len(added) and not len(removed) and not full:
+        return {'orders': 0, 'cancelled': 0, 'products': 0, 'links': 0}
+
+    product_ids = np.array([], dtype=np.int64)
+    totals = {}
+    for key, pairs, sign in (('orders', added, 1), ('cancelled', removed, -1)):
+        totals[key] = 0
+        if len(pairs):
+            ids, counts, orders = cooccurrence_counts(pairs)
+            state.merge(ids, counts * sign, orders * sign)
+            product_ids = np.union1d(product_ids, ids)
+            totals[key] = orders
+    state.counted = np.union1d(np.setdiff1d(state.counted, removed[:, 0]), added[:, 0])
+    state.synced_at = started
+
+    affected = None if full else product_ids
+    links = store_bought_together(*score_pairs(state, min_support, top_n, affected), product_ids=affected)
+    # El estado se guarda después de confirmar las filas: si falla el guardado,
+    # la próxima ejecución parte del estado anterior y vuelve a sumar las mismas
+    # órdenes; si fallan las filas, el estado no llega a avanzar
+    state.save(path)
+    return {**totals, 'products': len(product_ids), 'links': links}
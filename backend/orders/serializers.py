@@ -1,16 +1,22 @@
+from collections import defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from rest_framework import serializers
 from .models import Cart, CartItem, Order, OrderItem
-from products.models import Product
-from products.serializers import ProductSerializer
+from products.models import VALIDATE_TRUSTED, Product
+from products.serializers import ProductSerializer, ProductValuesSerializer
+from core.serializers import FieldSelection, SparseFieldsetMixin, ValuesSerializer
 from core.validators import validate_stock_availability
 from core.exceptions import InsufficientStockException
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
     total_price = serializers.SerializerMethodField()
     
+    relation_fields = {'product': ['product']}
+    
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'product_id', 'quantity', 'price', 'total_price', 'created_at']
@@ -48,11 +54,14 @@ class CartItemSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_items = serializers.SerializerMethodField()
     total_price = serializers.SerializerMethodField()
     
+    # Los totales se calculan sobre los items precargados
+    relation_fields = {'items': ['items', 'total_items', 'total_price']}
+    
     class Meta:
         model = Cart
         fields = ['id', 'user', 'items', 'total_items', 'total_price', 'created_at', 'updated_at']
@@ -92,10 +101,12 @@ class AddToCartSerializer(serializers.Serializer):
         return attrs
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     total_price = serializers.SerializerMethodField()
     
+    relation_fields = {'product': ['product']}
+    
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'quantity', 'price', 'total_price']
@@ -104,12 +115,17 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return obj.get_total_price()
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user_email = serializers.CharField(source='user.email', read_only=True)
     total_items = serializers.SerializerMethodField()
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     
+    relation_fields = {
+        'items': ['items', 'total_items'],
+        'user': ['user_email'],
+    }
+    
     class Meta:
         model = Order
         fields = [
@@ -127,6 +143,76 @@ class OrderSerializer(serializers.ModelSerializer):
         return obj.total_items
 
 
+class OrderItemValuesSerializer(ValuesSerializer):
+    serializer_class = OrderItemSerializer
+    computed_fields = ('product', 'total_price')
+    extra_columns = ('id', 'order_id', 'product_id', 'quantity', 'price')
+    
+    def prepare(self, rows):
+        self.products = {}
+        if 'product' in self.fields:
+            product_serializer = ProductValuesSerializer(
+                self.context,
+                field_selection=self.fields['product'].get_field_selection()
+            )
+            products = product_serializer.serialize(Product.objects.filter(
+                id__in={row['product_id'] for row in rows}
+            ).values(*product_serializer.columns))
+            self.products = {product['id']: product for product in products}
+    
+    def get_product(self, row):
+        return self.products[row['product_id']]
+    
+    def get_total_price(self, row):
+        return row['quantity'] * row['price']
+
+
+class OrderValuesSerializer(ValuesSerializer):
+    """
+    OrderSerializer para listados desde .values(): items, productos e
+    imágenes de toda la página con una consulta cada uno
+    """
+    serializer_class = OrderSerializer
+    computed_fields = ('status_display', 'total_items', 'items')
+    extra_columns = ('id', 'status')
+    status_labels = dict(Order.STATUS_CHOICES)
+    
+    def prepare(self, rows):
+        self.items = defaultdict(list)
+        if 'items' not in self.fields and 'total_items' not in self.fields:
+            return
+        selection = self.fields['items'].child.get_field_selection() if 'items' in self.fields else FieldSelection()
+        self.item_serializer = OrderItemValuesSerializer(self.context, field_selection=selection)
+        items = list(OrderItem.objects.filter(
+            order_id__in=[row['id'] for row in rows]
+        ).order_by('id').values(*self.item_serializer.columns))
+        if 'items' in self.fields:
+            self.item_serializer.prepare(items)
+        for item in items:
+            self.items[item['order_id']].append(item)
+    
+    def get_status_display(self, row):
+        return self.status_labels.get(row['status'], row['status'])
+    
+    def get_total_items(self, row):
+        return sum(item['quantity'] for item in self.items[row['id']])
+    
+    def get_items(self, row):
+        return [self.item_serializer.to_representation(item) for item in self.items[row['id']]]
+
+
+class OrderItemResourceSerializer(OrderItemSerializer):
+    """Item con el producto como id, para documentos compuestos (?include=)"""
+    product = serializers.PrimaryKeyRelatedField(read_only=True)
+    
+    relation_fields = {}
+
+
+class OrderResourceSerializer(OrderSerializer):
+    """Orden cuyos items referencian el producto por id (ver OrderViewSet.get_includes)"""
+    items = OrderItemResourceSerializer(many=True, read_only=True)
+
+
 class CreateOrderSerializer(serializers.ModelSerializer):
     """Serializer para crear una orden desde el carrito"""
     
@@ -163,29 +249,35 @@ class CreateOrderSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         cart = user.cart
         
-        # Crear la orden
-        order = Order.objects.create(
-            user=user,
-            total=cart.total_price,
-            **validated_data
-        )
-        
-        # Crear los items de la orden
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.price
-            )
-            
-            # Reducir stock del producto
-            product = cart_item.product
-            product.stock -= cart_item.quantity
-            product.save()
-        
-        # Limpiar el carrito
-        cart.clear()
+        try:
+            with transaction.atomic():
+                # Crear la orden
+                order = Order.objects.create(
+                    user=user,
+                    total=cart.total_price,
+                    **validated_data
+                )
+                
+                # Crear los items de la orden
+                for cart_item in cart.items.select_related('product'):
+                    OrderItem.objects.create(
+                        order=order,
+                        product=cart_item.product,
+                        quantity=cart_item.quantity,
+                        price=cart_item.price
+                    )
+                    
+                    # Reducir stock: un solo UPDATE atómico, sin volver a validar el producto
+                    product = cart_item.product
+                    product.stock = F('stock') - cart_item.quantity
+                    product.save(update_fields=['stock', 'updated_at'], validation=VALIDATE_TRUSTED)
+                
+                # Limpiar el carrito
+                cart.clear()
+        except IntegrityError:
+            # El stock no puede quedar negativo (restricción de la columna):
+            # otra orden se llevó las unidades después de validar
+            raise serializers.ValidationError("Stock insuficiente para completar la orden")
         
         return order
 
@@ -1,4 +1,11 @@
-from django.test import TestCase
+import os
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APITestCase
@@ -6,8 +13,9 @@ from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from decimal import Decimal
 from .models import Cart, CartItem, Order, OrderItem
-from products.models import Category, Product
+from products.models import Category, Product, ProductImage, RelatedProduct
 from .serializers import CartSerializer, OrderSerializer
+from .recommendations import build_bought_together
 
 User = get_user_model()
 
@@ -448,6 +456,46 @@ class OrderAPITest(APITestCase):
         self.assertIsNotNone(response.data['order_number'])
         self.assertEqual(len(response.data['items']), 1)
     
+    def test_create_order_decrements_stock_with_single_update(self):
+        """Test el stock se descuenta con un UPDATE por producto, sin revalidarlo"""
+        self.client.force_authenticate(user=self.user)
+        data = {
+            'shipping_address': 'Calle 123',
+            'shipping_city': 'Ciudad',
+            'shipping_postal_code': '12345',
+            'shipping_phone': '+1234567890'
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('orders:order-list'), data)
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 9)
+        product_queries = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('UPDATE "products_product"') or '"products_product"."slug" ' in query['sql']
+        ]
+        self.assertEqual(len(product_queries), 1)
+        self.assertIn('"stock" = ("products_product"."stock" - 1)', product_queries[0])
+    
+    def test_create_order_without_stock_rolls_back(self):
+        """Test si el stock se agotó tras validar, la orden no se crea"""
+        self.client.force_authenticate(user=self.user)
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+        data = {
+            'shipping_address': 'Calle 123',
+            'shipping_city': 'Ciudad',
+            'shipping_postal_code': '12345',
+            'shipping_phone': '+1234567890'
+        }
+        # La validación previa ya pasó (otra orden se llevó el stock entre medias)
+        with mock.patch('orders.serializers.validate_stock_availability'):
+            response = self.client.post(reverse('orders:order-list'), data)
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(self.cart.items.exists())
+    
     def test_update_order_status_requires_admin(self):
         """Test actualizar estado de orden requiere permisos de admin"""
         # Crear orden
@@ -479,3 +527,512 @@ class OrderAPITest(APITestCase):
         response = self.client.patch(url, data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['status'], 'processing')
+    
+    def test_my_orders_keyset_pagination(self):
+        """Test my_orders pagina por cursor sin COUNT(*)"""
+        for _ in range(3):
+            Order.objects.create(
+                user=self.user,
+                total=Decimal('10.00'),
+                shipping_address='Calle 123',
+                shipping_city='Ciudad',
+                shipping_postal_code='12345',
+                shipping_phone='+1234567890'
+            )
+        self.client.force_authenticate(user=self.user)
+        
+        url = reverse('orders:order-my-orders')
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        ids = [order['id'] for order in response.data['results']]
+        
+        response = self.client.get(response.data['next'])
+        ids += [order['id'] for order in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(ids, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'El formato de EXPLAIN depende del motor')
+class OrderIndexPlanTest(APITestCase):
+    """Tests de los índices del historial de órdenes (plan de consulta de SQLite)"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            User.objects.create_user(email=f'user{number}@example.com', password='testpass123')
+            for number in range(20)
+        ]
+        cls.user = users[0]
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        Order.objects.bulk_create([
+            Order(
+                user=users[number % 20],
+                order_number=f'ORD-{number:08d}',
+                status=statuses[number % len(statuses)],
+                total=Decimal('10.00'),
+                shipping_address='Calle 123',
+                shipping_city='Ciudad',
+                shipping_postal_code='12345',
+                shipping_phone='+1234567890'
+            )
+            for number in range(1000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    
+    def assertPagesUseIndex(self, params, *index_names):
+        """
+        Plan de la consulta de my_orders en la primera página y en la siguiente
+        (con cursor): buscar en alguno de `index_names` sin ordenar en memoria
+        """
+        self.client.force_authenticate(user=self.user)
+        url = reverse('orders:order-my-orders')
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for page_url, page_params in ((url, params), (response.data['next'], None)):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(page_url, page_params)
+            sql = next(query['sql'] for query in queries if 'FROM "orders_order"' in query['sql'])
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+            self.assertRegex(plan, rf'SEARCH orders_order USING INDEX ({"|".join(index_names)}) ')
+            self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_user_orders_use_index(self):
+        """Test historial del usuario paginado con cursor sin ordenar en memoria"""
+        self.assertPagesUseIndex({'page_size': 10}, 'order_user_created')
+    
+    def test_user_orders_by_status_use_index(self):
+        """Test historial del usuario filtrado por estado (con cursor SQLite puede preferir acotar la fecha)"""
+        params = {'status': 'pending', 'page_size': 5}
+        self.assertPagesUseIndex(params, 'order_user_status_created', 'order_user_created')
+
+
+class ConditionalGetTest(APITestCase):
+    """Tests de GET condicional (ETag / Last-Modified) en carrito y órdenes"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(email='test@example.com', password='testpass123')
+        self.other_user = User.objects.create_user(email='other@example.com', password='testpass123')
+        self.admin_user = User.objects.create_superuser(email='admin@example.com', password='adminpass123')
+        self.category = Category.objects.create(name='Electrónicos')
+        self.product = Product.objects.create(
+            name='iPhone 15',
+            description='Último modelo de iPhone',
+            price=Decimal('999.99'),
+            stock=10,
+            category=self.category
+        )
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.order = Order.objects.create(
+            user=self.user,
+            total=Decimal('999.99'),
+            shipping_address='Calle 123',
+            shipping_city='Ciudad',
+            shipping_postal_code='12345',
+            shipping_phone='+1234567890'
+        )
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=self.product.price)
+        self.cart_url = reverse('orders:cart-list')
+        self.order_url = reverse('orders:order-detail', kwargs={'pk': self.order.pk})
+        self.authenticate(self.user)
+    
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def test_cart_not_modified(self):
+        """Test el carrito sin cambios responde 304 con una sola consulta"""
+        response = self.client.get(self.cart_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        
+        with self.assertNumQueries(2):  # usuario del token y validadores
+            response = self.client.get(self.cart_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+    
+    def test_cart_item_change_modifies_etag(self):
+        """Test cambiar un item invalida el ETag del carrito"""
+        etag = self.client.get(self.cart_url)['ETag']
+        self.client.post(reverse('orders:cart-add-item'), {'product_id': self.product.id, 'quantity': 1})
+        response = self.client.get(self.cart_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['items'][0]['quantity'], 2)
+    
+    def test_order_not_modified(self):
+        """Test la orden sin cambios responde 304"""
+        response = self.client.get(self.order_url)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(self.order_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_order_status_change_modifies_etag(self):
+        """Test cambiar el estado invalida el ETag de la orden"""
+        etag = self.client.get(self.order_url)['ETag']
+        self.order.status = 'shipped'
+        self.order.save()
+        response = self.client.get(self.order_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'shipped')
+    
+    def test_order_product_change_modifies_etag(self):
+        """Test los datos del producto anidado también cuentan"""
+        etag = self.client.get(self.order_url)['ETag']
+        self.product.name = 'iPhone 15 Pro'
+        self.product.save()
+        response = self.client.get(self.order_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_other_users_order_is_not_found(self):
+        """Test los validadores no exponen órdenes ajenas"""
+        self.authenticate(self.other_user)
+        response = self.client.get(self.order_url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BoughtTogetherTest(APITestCase):
+    """Tests para los productos "comprados juntos" a partir de las órdenes"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(email='test@example.com', password='testpass123')
+        self.category = Category.objects.create(name='Electrónicos')
+        self.products = {
+            name: Product.objects.create(
+                name=name,
+                description='Test',
+                price=Decimal('10.00'),
+                stock=10,
+                category=self.category
+            )
+            for name in ['A', 'B', 'C', 'D', 'E']
+        }
+        for basket in ['AB', 'AB', 'AB', 'AC', 'CD', 'CD', 'E', 'E', 'ABC']:
+            self.create_order(basket)
+        
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'bought_together.npz')
+    
+    def create_order(self, basket, status='pending'):
+        order = Order.objects.create(
+            user=self.user,
+            status=status,
+            total=Decimal('10.00'),
+            shipping_address='Calle 123',
+            shipping_city='Ciudad',
+            shipping_postal_code='12345',
+            shipping_phone='+1234567890'
+        )
+        for name in basket:
+            OrderItem.objects.create(order=order, product=self.products[name], quantity=1, price=Decimal('10.00'))
+        return order
+    
+    def bought_with(self, name):
+        return {
+            link.related.name for link in RelatedProduct.objects.filter(
+                product=self.products[name],
+                kind=RelatedProduct.KIND_BOUGHT_TOGETHER
+            ).select_related('related')
+        }
+    
+    def test_support_and_lift_filters(self):
+        """Test solo pares con soporte mínimo y lift mayor a 1"""
+        result = build_bought_together(path=self.path)
+        self.assertEqual(result['orders'], 9)
+        # A-C aparece 2 veces pero por debajo de lo esperado por azar (lift 0.9); B-C solo una vez
+        self.assertEqual(self.bought_with('A'), {'B'})
+        self.assertEqual(self.bought_with('B'), {'A'})
+        self.assertEqual(self.bought_with('C'), {'D'})
+        self.assertEqual(self.bought_with('E'), set())
+        link = RelatedProduct.objects.get(product=self.products['A'], kind=RelatedProduct.KIND_BOUGHT_TOGETHER)
+        self.assertAlmostEqual(link.score, 0.8)  # confianza: 4 de las 5 órdenes con A
+    
+    def test_incremental_run_folds_new_orders(self):
+        """Test el modo incremental solo lee las órdenes nuevas"""
+        build_bought_together(path=self.path)
+        self.create_order('DE')
+        self.create_order('DE')
+        self.create_order('DE', status='cancelled')
+        
+        result = build_bought_together(path=self.path)
+        self.assertEqual(result['orders'], 2)
+        self.assertEqual(self.bought_with('E'), {'D'})
+        self.assertEqual(self.bought_with('D'), {'C', 'E'})
+        # Productos sin órdenes nuevas conservan sus filas
+        self.assertEqual(self.bought_with('A'), {'B'})
+        self.assertEqual(build_bought_together(path=self.path)['orders'], 0)
+    
+    def test_late_commit_is_counted(self):
+        """Test una orden con id menor que otras ya sumadas (confirmada tarde) se suma igual"""
+        late = self.create_order('DE')
+        committed = self.create_order('DE')
+        # Simula que `late` aún no era visible en la primera ejecución
+        items = OrderItem.objects.filter(order=late)
+        saved = list(items.values_list('product_id', flat=True))
+        items.delete()
+        build_bought_together(path=self.path)
+        self.assertEqual(self.bought_with('E'), set())
+        
+        for product_id in saved:
+            OrderItem.objects.create(order=late, product_id=product_id, quantity=1, price=Decimal('10.00'))
+        Order.objects.filter(pk=late.pk).update(updated_at=committed.updated_at)
+        result = build_bought_together(path=self.path)
+        self.assertEqual(result['orders'], 1)
+        self.assertEqual(self.bought_with('E'), {'D'})
+    
+    def test_cancelled_after_counting_is_subtracted(self):
+        """Test una orden cancelada después de sumarse se descuenta de la matriz"""
+        build_bought_together(path=self.path)
+        order = self.create_order('DE')
+        self.create_order('DE')
+        build_bought_together(path=self.path)
+        self.assertEqual(self.bought_with('E'), {'D'})
+        
+        order.status = 'cancelled'
+        order.save()
+        result = build_bought_together(path=self.path)
+        self.assertEqual((result['orders'], result['cancelled']), (0, 1))
+        self.assertEqual(self.bought_with('E'), set())
+        incremental = self.bought_with('D')
+        build_bought_together(full=True, path=self.path)
+        self.assertEqual(self.bought_with('D'), incremental)
+    
+    def test_state_saved_after_commit(self):
+        """Test si falla guardar los enlaces el estado no avanza"""
+        with mock.patch('orders.recommendations.store_bought_together', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                build_bought_together(path=self.path)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(build_bought_together(path=self.path)['orders'], 9)
+    
+    def test_full_run_matches_incremental(self):
+        """Test recalcular desde cero da el mismo resultado para los productos afectados"""
+        build_bought_together(path=self.path)
+        self.create_order('DE')
+        self.create_order('DE')
+        build_bought_together(path=self.path)
+        incremental = self.bought_with('D')
+        build_bought_together(full=True, path=self.path)
+        self.assertEqual(self.bought_with('D'), incremental)
+    
+    def test_command(self):
+        """Test el comando de gestión"""
+        out = StringIO()
+        call_command('build_bought_together', '--path', self.path, stdout=out)
+        self.assertIn('Órdenes procesadas: 9', out.getvalue())
+    
+    def test_frequently_bought_with_action(self):
+        """Test el endpoint devuelve los productos en una consulta (más sus imágenes)"""
+        build_bought_together(path=self.path)
+        url = reverse('products:product-frequently-bought-with', kwargs={'slug': self.products['C'].slug})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data], ['D'])
+    
+    def test_frequently_bought_with_unknown_product(self):
+        """Test un producto inexistente responde 404 y uno sin enlaces una lista vacía"""
+        build_bought_together(path=self.path)
+        url = reverse('products:product-frequently-bought-with', kwargs={'slug': 'no-existe'})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        url = reverse('products:product-frequently-bought-with', kwargs={'slug': self.products['E'].slug})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+
+class SparseFieldsetTest(APITestCase):
+    """Tests de ?fields= / ?omit= en carrito y órdenes"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(email='test@example.com', password='testpass123')
+        self.category = Category.objects.create(name='Electrónicos')
+        self.cart = Cart.objects.create(user=self.user)
+        self.order = Order.objects.create(
+            user=self.user,
+            total=Decimal('30.00'),
+            shipping_address='Calle 123',
+            shipping_city='Ciudad',
+            shipping_postal_code='12345',
+            shipping_phone='+1234567890'
+        )
+        for i in range(3):
+            self.add_product(i)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def add_product(self, i):
+        product = Product.objects.create(
+            name=f'Producto {i}',
+            description='Descripción',
+            price=Decimal('10.00'),
+            stock=10,
+            category=self.category
+        )
+        ProductImage.objects.create(product=product, image_url=f'https://example.com/{i}.jpg', is_main=True)
+        CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+        OrderItem.objects.create(order=self.order, product=product, quantity=1, price=product.price)
+    
+    def test_cart_nested_fields(self):
+        """Test el carrito con los items reducidos a nombre de producto y cantidad"""
+        params = {'fields': 'total_price,items.quantity,items.product.name'}
+        # usuario, validadores, carrito e items con su producto (sin imágenes)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('orders:cart-list'), params)
+        self.assertEqual(response.data['total_price'], Decimal('30.00'))
+        self.assertEqual(response.data['items'][0], {'quantity': 1, 'product': {'name': 'Producto 0'}})
+    
+    def test_cart_query_budget_is_constant(self):
+        """Test el carrito completo no consulta por item"""
+        url = reverse('orders:cart-list')
+        # usuario, validadores, carrito, items con producto y categoría, imágenes
+        with self.assertNumQueries(5):
+            self.client.get(url)
+        self.add_product(3)
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.data['items'][0]['product']['main_image'], 'https://example.com/0.jpg')
+    
+    def test_order_list_omit_items(self):
+        """Test ?omit=items no carga los items de las órdenes"""
+        with self.assertNumQueries(3):  # usuario, COUNT de la página y órdenes con su usuario
+            response = self.client.get(reverse('orders:order-list'), {'omit': 'items,total_items'})
+        order = response.data['results'][0]
+        self.assertNotIn('items', order)
+        self.assertEqual(order['user_email'], 'test@example.com')
+    
+    def test_order_detail_omit_product_images(self):
+        """Test ?omit= con rutas anidadas en el detalle de la orden"""
+        url = reverse('orders:order-detail', kwargs={'pk': self.order.pk})
+        response = self.client.get(url, {'omit': 'items.product.images,items.product.description'})
+        product = response.data['items'][0]['product']
+        self.assertNotIn('images', product)
+        self.assertNotIn('description', product)
+        self.assertEqual(product['main_image'], 'https://example.com/0.jpg')
+
+
+class CompoundDocumentTest(APITestCase):
+    """Tests de documentos compuestos (?include=) en órdenes"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(email='test@example.com', password='testpass123')
+        self.category = Category.objects.create(name='Electrónicos')
+        self.products = [
+            Product.objects.create(
+                name=f'Producto {i}',
+                description='Descripción',
+                price=Decimal('10.00'),
+                stock=10,
+                category=self.category
+            )
+            for i in range(2)
+        ]
+        ProductImage.objects.create(product=self.products[0], image_url='https://example.com/0.jpg')
+        self.orders = []
+        for products in (self.products, self.products[:1]):
+            order = Order.objects.create(
+                user=self.user,
+                total=Decimal('20.00'),
+                shipping_address='Calle 123',
+                shipping_city='Ciudad',
+                shipping_postal_code='12345',
+                shipping_phone='+1234567890'
+            )
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+            self.orders.append(order)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def test_list_includes_products_once(self):
+        """Test los productos repetidos entre órdenes se incluyen una vez"""
+        # usuario, COUNT, órdenes, items, productos, categorías e imágenes
+        with self.assertNumQueries(7):
+            response = self.client.get(
+                reverse('orders:order-list'),
+                {'include': 'products,products.category,products.images'}
+            )
+        order = response.data['results'][0]
+        self.assertEqual(order['items'][0]['product'], self.products[0].id)
+        
+        included = response.data['included']
+        self.assertEqual(sorted(product['id'] for product in included['products']), [p.id for p in self.products])
+        self.assertEqual(len(included['categories']), 1)
+        self.assertEqual(len(included['images']), 1)
+    
+    def test_detail_ids_only(self):
+        """Test ?include= vacío en el detalle: items con ids de producto"""
+        url = reverse('orders:order-detail', kwargs={'pk': self.orders[0].pk})
+        response = self.client.get(url, {'include': ''})
+        self.assertEqual(response.data['included'], {})
+        self.assertEqual(
+            [item['product'] for item in response.data['data']['items']],
+            [product.id for product in self.products]
+        )
+    
+    def test_my_orders_compound(self):
+        """Test mis órdenes también admite ?include="""
+        response = self.client.get(reverse('orders:order-my-orders'), {'include': 'products'})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(len(response.data['included']['products']), 2)
+
+
+class ValuesListParityTest(APITestCase):
+    """Tests de paridad del listado de órdenes desde .values()"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(email='test@example.com', password='testpass123')
+        category = Category.objects.create(name='Electrónicos')
+        products = []
+        for i in range(3):
+            product = Product.objects.create(
+                name=f'Producto {i}',
+                description='Descripción',
+                price=Decimal('9.99') + i,
+                stock=10,
+                category=category
+            )
+            ProductImage.objects.create(product=product, image_url=f'https://example.com/{i}.jpg', is_main=True)
+            products.append(product)
+        for status_value, items in [('pending', products), ('shipped', products[1:]), ('cancelled', [])]:
+            order = Order.objects.create(
+                user=self.user,
+                status=status_value,
+                total=Decimal('30.00'),
+                shipping_address='Calle 123',
+                shipping_city='Ciudad',
+                shipping_postal_code='12345',
+                shipping_phone='+1234567890'
+            )
+            for quantity, product in enumerate(items, start=1):
+                OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def assert_parity(self, url, params=None):
+        with override_settings(FAST_LIST_SERIALIZATION=False):
+            expected = self.client.get(url, params)
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, expected.content)
+    
+    def test_order_list_parity(self):
+        """Test listado y mis órdenes: misma respuesta byte a byte"""
+        self.assert_parity(reverse('orders:order-list'))
+        self.assert_parity(reverse('orders:order-list'), {'status': 'shipped'})
+        self.assert_parity(reverse('orders:order-my-orders'))
+        self.assert_parity(reverse('orders:order-my-orders'), {'page_size': 1})
+    
+    def test_order_list_fields_parity(self):
+        """Test la selección de campos también coincide"""
+        self.assert_parity(reverse('orders:order-list'), {'fields': 'id,status_display,total_items'})
+        self.assert_parity(reverse('orders:order-list'), {'omit': 'items.product.images,user_email'})
+    
+    def test_order_list_query_budget(self):
+        """Test usuario, COUNT, órdenes, items, productos e imágenes"""
+        with self.assertNumQueries(6):
+            self.client.get(reverse('orders:order-list'))
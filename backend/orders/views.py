@@ -1,18 +1,55 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.db.models import Count, Max, Prefetch, prefetch_related_objects
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from .models import Cart, CartItem, Order, OrderItem
 from core.permissions import IsOwnerOrReadOnly, IsOwnerOrAdmin
+from core.pagination import KeysetPagination
+from core.conditional import build_validators, conditional_response
+from core.compound import IncludedResources, parse_include
+from core.serializers import FieldSelection, requested_relations
+from core.views import ValuesListMixin
 from core.validators import validate_stock_availability
 from core.exceptions import InsufficientStockException
 from .serializers import (
     CartSerializer, CartItemSerializer, AddToCartSerializer,
-    OrderSerializer, CreateOrderSerializer, UpdateOrderStatusSerializer
+    OrderSerializer, OrderItemSerializer, CreateOrderSerializer, UpdateOrderStatusSerializer,
+    OrderResourceSerializer, OrderItemResourceSerializer, OrderValuesSerializer
 )
-from products.models import Product
+from products.compound import include_product_relations, serialize_resources
+from products.models import Product, ProductImage
+from products.serializers import ProductSerializer
+
+ORDER_INCLUDES = ('products', 'products.category', 'products.images')
+
+
+def items_prefetches(item_model, item_serializer_class, selection):
+    """
+    Precargas de los items de un carrito u orden con su producto (categoría
+    e imágenes), limitadas a lo que piden los campos seleccionados
+
+    Args:
+        selection: FieldSelection de los items (p. ej. ?fields=items.product.name)
+    """
+    items = item_model.objects.order_by('id')
+    if 'product' not in item_serializer_class.requested_relations(selection):
+        return [Prefetch('items', queryset=items)]
+    
+    relations = ProductSerializer.requested_relations(selection.nested('product'))
+    items = items.select_related('product').defer('product__search_vector')
+    if 'category' in relations:
+        items = items.select_related('product__category')
+    lookups = [Prefetch('items', queryset=items)]
+    if 'images' in relations:
+        lookups.append(Prefetch(
+            'items__product__images',
+            queryset=ProductImage.objects.order_by('order', 'created_at')
+        ))
+    return lookups
 
 
 class CartViewSet(viewsets.ModelViewSet):
@@ -28,12 +65,30 @@ class CartViewSet(viewsets.ModelViewSet):
         cart, created = Cart.objects.get_or_create(user=self.request.user)
         return cart
     
+    @conditional_response('get_cart_validators')
     def list(self, request):
         """Obtener el carrito del usuario"""
         cart = self.get_object()
+        selection = FieldSelection.from_request(request)
+        if 'items' in CartSerializer.requested_relations(selection):
+            prefetch_related_objects([cart], *items_prefetches(CartItem, CartItemSerializer, selection.nested('items')))
         serializer = self.get_serializer(cart)
         return Response(serializer.data)
     
+    def get_cart_validators(self, request):
+        # Los items anidan el producto completo (con su categoría)
+        summary = Cart.objects.filter(user=request.user).aggregate(
+            cart_id=Max('id'),
+            cart_modified=Max('updated_at'),
+            item_count=Count('items'),
+            items_modified=Max('items__updated_at'),
+            products_modified=Max('items__product__updated_at'),
+            categories_modified=Max('items__product__category__updated_at')
+        )
+        if summary['cart_id'] is None:
+            return None
+        return build_validators('cart', *summary.values())
+    
     @action(detail=False, methods=['post'])
     def add_item(self, request):
         """Agregar un producto al carrito"""
@@ -143,25 +198,112 @@ class CartViewSet(viewsets.ModelViewSet):
         return Response(cart_serializer.data)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ValuesListMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar las órdenes"""
     serializer_class = OrderSerializer
+    values_serializer_class = OrderValuesSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status']
     ordering_fields = ['created_at', 'total']
     ordering = ['-created_at']
     
+    def get_includes(self):
+        """Relaciones de ?include=, o None si la respuesta usa el formato anidado"""
+        if self.action not in ('list', 'retrieve', 'my_orders'):
+            return None
+        return parse_include(self.request, ORDER_INCLUDES)
+    
+    def get_document(self, orders, includes):
+        """
+        Órdenes con sus items referenciando productos por id y en `included`
+        los productos (con su categoría e imágenes si se piden), cada uno una
+        sola vez aunque aparezca en varias órdenes
+        
+        Returns:
+            tuple: (filas de las órdenes, sección included)
+        """
+        context = self.get_serializer_context()
+        orders = list(orders)
+        rows = OrderResourceSerializer(orders, many=True, context=context).data
+        included = IncludedResources()
+        if includes:
+            product_ids = {item.product_id for order in orders for item in order.items.all()}
+            products = list(Product.objects.filter(id__in=product_ids).order_by('id'))
+            product_rows = serialize_resources(products, context)
+            included.add('products', product_rows)
+            include_product_relations(
+                products,
+                product_rows,
+                {name.split('.', 1)[1] for name in includes if '.' in name},
+                included,
+                context
+            )
+        return rows, included.data
+    
     def get_queryset(self):
         if self.request.user.is_staff:
-            return Order.objects.all()
-        return Order.objects.filter(user=self.request.user)
+            queryset = Order.objects.all()
+        else:
+            queryset = Order.objects.filter(user=self.request.user)
+        
+        # Items, productos y usuario en bloque, solo si la respuesta los incluye
+        relations = requested_relations(self.get_serializer_class(), self.request)
+        if relations is None:
+            return queryset
+        if 'user' in relations:
+            queryset = queryset.select_related('user')
+        includes = self.get_includes()
+        # Los productos de ?include= salen de los items de cada orden
+        if 'items' in relations or includes:
+            item_serializer_class = OrderItemSerializer if includes is None else OrderItemResourceSerializer
+            selection = FieldSelection.from_request(self.request).nested('items')
+            queryset = queryset.prefetch_related(*items_prefetches(OrderItem, item_serializer_class, selection))
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        includes = self.get_includes()
+        if includes is None:
+            return super().list(request, *args, **kwargs)
+        return self.compound_list(self.filter_queryset(self.get_queryset()), includes)
+    
+    def compound_list(self, queryset, includes):
+        page = self.paginate_queryset(queryset)
+        rows, included = self.get_document(page if page is not None else queryset, includes)
+        if page is None:
+            return Response({'results': rows, 'included': included})
+        response = self.get_paginated_response(rows)
+        response.data['included'] = included
+        return response
+    
+    @conditional_response('get_detail_validators')
+    def retrieve(self, request, *args, **kwargs):
+        includes = self.get_includes()
+        if includes is None:
+            return super().retrieve(request, *args, **kwargs)
+        rows, included = self.get_document([self.get_object()], includes)
+        return Response({'data': rows[0], 'included': included})
+    
+    def get_detail_validators(self, request, pk=None):
+        # Los items anidan el producto actual (con su categoría)
+        summary = self.get_queryset().filter(pk=pk).aggregate(
+            order_id=Max('id'),
+            order_modified=Max('updated_at'),
+            item_count=Count('items'),
+            products_modified=Max('items__product__updated_at'),
+            categories_modified=Max('items__product__category__updated_at')
+        )
+        if summary['order_id'] is None:
+            return None
+        return build_validators('order', *summary.values())
     
     def get_serializer_class(self):
         if self.action == 'create':
             return CreateOrderSerializer
         elif self.action == 'update_status':
             return UpdateOrderStatusSerializer
+        elif self.get_includes() is not None:
+            return OrderResourceSerializer
         return OrderSerializer
     
     def create(self, request):
@@ -186,10 +328,15 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=KeysetPagination)
     def my_orders(self, request):
         """Obtener las órdenes del usuario autenticado"""
-        orders = self.get_queryset().filter(user=request.user)
+        orders = self.filter_queryset(self.get_queryset()).filter(user=request.user)
+        includes = self.get_includes()
+        if includes is not None:
+            return self.compound_list(orders, includes)
+        if settings.FAST_LIST_SERIALIZATION:
+            return self.values_list_response(orders)
         page = self.paginate_queryset(orders)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -13,7 +13,7 @@ class ProductImageInline(admin.TabularInline):
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'is_active', 'created_at')
+    list_display = ('name', 'slug', 'is_active', 'active_products_count', 'created_at')
     list_filter = ('is_active', 'created_at')
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
@@ -74,10 +74,12 @@ class ProductAdmin(admin.ModelAdmin):
         if obj.main_image and hasattr(obj.main_image, 'file'):
             try:
                 storage_service = SupabaseStorageService()
-                # Subir imagen a Supabase Storage
-                image_url = storage_service.upload_image(obj.main_image, 'products')
+                # Subir imagen y sus variantes redimensionadas a Supabase Storage
+                result = storage_service.upload_image_with_variants(obj.main_image, 'products')
+                image_url = result['image_url']
                 # Actualizar la URL de la imagen
                 obj.main_image_url = image_url
+                obj.main_image_variants = result['variants']
                 # Limpiar el campo de imagen temporal
                 obj.main_image = None
                 
@@ -0,0 +1,184 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .cache import invalidate_catalog
+from .counters import rebuild_active_products_counts
+from core.slugs import taken_slugs, unique_slugs
+from .models import Category, Product, catalog_slug_models
+from .related import refresh_category_related
+from .search import uses_search_index
+from .search_engine import index_product, peek_search_index
+from .serializers import ProductBulkItemSerializer
+from .signals import SEARCH_INDEX_FIELDS
+
+
+def reindex_on_commit(products):
+    """Reindexar en el índice BM25 del proceso los productos del queryset, al confirmar"""
+    index = peek_search_index()
+    if index is None or not uses_search_index():
+        return
+    rows = list(products.values_list('id', 'name', 'description', 'is_active'))
+
+    def apply():
+        for product_id, name, description, is_active in rows:
+            if is_active:
+                index_product(index, product_id, name, description)
+            else:
+                index.remove(product_id)
+    transaction.on_commit(apply)
+
+
+def sync_after_bulk_write(category_ids, reindexed=None):
+    """
+    bulk_create/bulk_update no emiten señales: recalcular contadores y
+    relacionados de las categorías tocadas, reindexar e invalidar la caché
+    """
+    category_ids = {category_id for category_id in category_ids if category_id}
+    if category_ids:
+        rebuild_active_products_counts(category_ids)
+        refresh_category_related(category_ids)
+    if reindexed is not None:
+        reindex_on_commit(reindexed)
+    invalidate_catalog()
+
+
+class BulkResult:
+    """Items aplicados y errores por item (posición en la petición) de una operación en bloque"""
+
+    def __init__(self):
+        self.applied = 0
+        self.errors = []
+
+    def reject(self, position, item, errors):
+        error = {'index': position, 'errors': errors}
+        if isinstance(item, dict) and item.get('slug'):
+            error['slug'] = item['slug']
+        self.errors.append(error)
+
+    def validate(self, items, partial=False):
+        """Valida cada item con ProductBulkItemSerializer; devuelve [(posición, datos validados)]"""
+        serializer = ProductBulkItemSerializer(partial=partial)
+        valid = []
+        seen = set()
+        for position, item in enumerate(items):
+            try:
+                data = serializer.run_validation(item)
+            except ValidationError as error:
+                self.reject(position, item, error.detail)
+                continue
+            if data.get('slug') in seen:
+                self.reject(position, item, {'slug': ['Slug repetido en la petición']})
+                continue
+            if data.get('slug'):
+                seen.add(data['slug'])
+            valid.append((position, data))
+        return valid
+
+    def existing_categories(self, valid):
+        category_ids = {data['category'] for _, data in valid if 'category' in data}
+        return set(Category.objects.filter(pk__in=category_ids).values_list('id', flat=True))
+
+
+def check_items(items):
+    if not isinstance(items, list):
+        raise ValidationError('Se espera una lista de productos')
+    if len(items) > settings.PRODUCT_BULK_MAX_ITEMS:
+        raise ValidationError(f'Máximo {settings.PRODUCT_BULK_MAX_ITEMS} productos por petición')
+
+
+def bulk_create_products(items, batch_size=None):
+    """
+    Crea los productos válidos de la lista en una transacción
+
+    Cada item se valida por separado; la unicidad de los slugs enviados y la
+    existencia de la categoría se comprueban con una consulta para todo el
+    lote. Sin slug se genera uno libre desde el nombre (core.slugs.unique_slugs).
+
+    Returns:
+        BulkResult: productos creados y errores por item
+    """
+    check_items(items)
+    result = BulkResult()
+    valid = result.validate(items)
+    explicit = {data['slug'] for _, data in valid if data.get('slug')}
+    taken = taken_slugs(catalog_slug_models(), Q(slug__in=explicit))
+    generated = [data for _, data in valid if not data.get('slug')]
+    slugs = unique_slugs(Product, [data['name'] for data in generated], catalog_slug_models(), reserved=explicit)
+    for data, slug in zip(generated, slugs):
+        data['slug'] = slug
+    categories = result.existing_categories(valid)
+
+    products = []
+    for position, data in valid:
+        if data['slug'] in taken:
+            result.reject(position, data, {'slug': [f'Ya existe un registro con el slug "{data["slug"]}"']})
+        elif data['category'] not in categories:
+            result.reject(position, data, {'category': [f'No existe la categoría {data["category"]}']})
+        else:
+            data['category_id'] = data.pop('category')
+            products.append(Product(**data))
+
+    if products:
+        with transaction.atomic():
+            Product.objects.bulk_create(products, batch_size=batch_size or settings.PRODUCT_BULK_BATCH_SIZE)
+            sync_after_bulk_write(
+                {product.category_id for product in products},
+                Product.objects.filter(slug__in=[product.slug for product in products])
+            )
+    result.applied = len(products)
+    return result
+
+
+def bulk_update_products(items, batch_size=None):
+    """
+    Actualiza por slug los campos enviados de cada producto (precio, stock...)
+    con bulk_update en una transacción
+
+    Returns:
+        BulkResult: productos actualizados y errores por item
+    """
+    check_items(items)
+    result = BulkResult()
+    valid = result.validate(items, partial=True)
+    categories = result.existing_categories(valid)
+    fields = set().union(*(data for _, data in valid)) - {'slug'}
+
+    with transaction.atomic():
+        products = Product.objects.select_for_update().only(
+            'id', 'slug', 'category_id', 'is_active', *fields
+        ).in_bulk([data['slug'] for _, data in valid], field_name='slug')
+
+        updated, touched_categories = [], set()
+        now = timezone.now()
+        for position, data in valid:
+            product = products.get(data['slug'])
+            if product is None:
+                result.reject(position, data, {'slug': [f'No existe un producto con el slug "{data["slug"]}"']})
+                continue
+            if 'category' in data and data['category'] not in categories:
+                result.reject(position, data, {'category': [f'No existe la categoría {data["category"]}']})
+                continue
+            if 'category' in data:
+                data['category_id'] = data.pop('category')
+            previous = (product.category_id, product.is_active)
+            for name, value in data.items():
+                setattr(product, name, value)
+            product.updated_at = now
+            if previous != (product.category_id, product.is_active):
+                touched_categories.update((previous[0], product.category_id))
+            updated.append(product)
+
+        if updated:
+            Product.objects.bulk_update(
+                updated,
+                [*fields, 'updated_at'],
+                batch_size=batch_size or settings.PRODUCT_BULK_BATCH_SIZE
+            )
+            reindexed = None
+            if SEARCH_INDEX_FIELDS & fields:
+                reindexed = Product.objects.filter(pk__in=[product.pk for product in updated])
+            sync_after_bulk_write(touched_categories, reindexed)
+    result.applied = len(updated)
+    return result
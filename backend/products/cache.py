@@ -0,0 +1,108 @@
+import hashlib
+import uuid
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.functions import Now
+from rest_framework import status
+from rest_framework.response import Response
+from core.conditional import get_validator_headers, not_modified_response, set_validator_headers
+from .models import Product
+
+CATALOG_VERSION_KEY = 'products:catalog:version'
+
+
+def bump_catalog_version():
+    """Invalida de golpe todas las respuestas cacheadas del catálogo"""
+    version = uuid.uuid4().hex
+    cache.set(CATALOG_VERSION_KEY, version, None)
+    return version
+
+
+def invalidate_catalog(product_ids=()):
+    """
+    Nueva versión del catálogo ya mismo y otra vez al confirmar: una lectura
+    concurrente podría volver a cachear datos previos al commit bajo la
+    primera versión nueva
+
+    Con `product_ids` también actualiza su updated_at (parte de los
+    validadores del detalle), para escrituras sin señales (update(),
+    bulk_create) de datos que forman parte de la respuesta del producto,
+    como sus imágenes.
+    """
+    if product_ids:
+        Product.objects.filter(pk__in=product_ids).update(updated_at=Now())
+    bump_catalog_version()
+    transaction.on_commit(bump_catalog_version)
+
+
+def get_versioned(key):
+    """
+    Lee una entrada cacheada junto con la versión actual del catálogo en una
+    sola lectura de caché
+
+    Returns:
+        tuple: (versión actual, datos o None si no hay entrada vigente)
+    """
+    entries = cache.get_many([CATALOG_VERSION_KEY, key])
+    version = entries.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Caché fría o expulsada: fijar una versión (add no pisa la de otro proceso)
+        cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+        return cache.get(CATALOG_VERSION_KEY), None
+
+    entry = entries.get(key)
+    if entry is None or entry[0] != version:
+        return version, None
+    return version, entry[1]
+
+
+def set_versioned(key, version, data, timeout=None):
+    """
+    Guarda datos calculados bajo `version`. La versión se lee antes de
+    consultar la base de datos, así que si hubo una escritura en medio la
+    entrada nace vieja y simplemente no se usa.
+    """
+    if timeout is None:
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+    cache.set(key, (version, data), timeout)
+
+
+def response_cache_key(prefix, request):
+    """Clave por host, ruta y parámetros (los enlaces de paginación son absolutos)"""
+    params = sorted((key, tuple(request.query_params.getlist(key))) for key in request.query_params)
+    raw = repr((request.get_host(), request.path, params))
+    return f'{prefix}:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def cache_catalog_response(view_method):
+    """
+    Cachea la respuesta de una acción de solo lectura del catálogo hasta la
+    siguiente escritura de Product, Category o ProductImage
+
+    Solo para respuestas iguales para todos los usuarios. Con LocMemCache
+    cada proceso tiene su propia caché (y su propia versión); para
+    compartirla entre workers usar la caché en archivos.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = response_cache_key(f'products:response:{self.basename}:{self.action}', request)
+        version, entry = get_versioned(key)
+        if entry is not None:
+            data, (etag, last_modified) = entry
+            # Los validadores se guardan junto a la respuesta: un acierto
+            # también puede contestar 304 sin tocar la base de datos
+            response = None
+            if etag or last_modified:
+                response = not_modified_response(request, etag, last_modified)
+            if response is None:
+                response = Response(data)
+            set_validator_headers(response, etag, last_modified)
+            return response
+
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            set_versioned(key, version, (response.data, get_validator_headers(response)))
+        return response
+    return wrapper
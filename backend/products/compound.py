@@ -0,0 +1,96 @@
+from collections import defaultdict
+from core.compound import IncludedResources
+from core.serializers import FieldSelection
+from .models import Category, CategoryRelatedProduct, Product, ProductImage, RelatedProduct
+from .related import category_related
+from .serializers import CategorySerializer, ProductImageSerializer, ProductResourceSerializer
+
+PRODUCT_INCLUDES = ('category', 'images', 'related')
+
+# Campo del recurso con los ids de cada tipo de relacionado precalculado por producto
+RELATED_FIELDS = {
+    RelatedProduct.KIND_SIMILAR: 'similar_products',
+}
+
+
+def serialize_resources(products, context):
+    """Productos incluidos: siempre completos, sin aplicar el ?fields= de la petición"""
+    return ProductResourceSerializer(products, many=True, context=context, field_selection=FieldSelection()).data
+
+
+def include_product_relations(products, rows, includes, included, context):
+    """
+    Carga las relaciones pedidas de `products` con una consulta por tipo,
+    las agrega a `included` y anota en cada fila los ids de sus relaciones a
+    muchos ('images', 'related_products', 'similar_products')
+
+    Args:
+        products: Productos ya cargados
+        rows: Su representación, en el mismo orden
+        includes: Subconjunto de PRODUCT_INCLUDES
+    """
+    products, rows = list(products), list(rows)
+    
+    if 'related' in includes:
+        links = defaultdict(list)
+        for product_id, kind, related_id in RelatedProduct.objects.filter(
+            product__in=[product.id for product in products],
+            kind__in=list(RELATED_FIELDS),
+            related__is_active=True
+        ).order_by('product_id', 'kind', 'rank').values_list('product_id', 'kind', 'related_id'):
+            links[product_id, kind].append(related_id)
+        # Relacionados por categoría: la lista de cada categoría, sin el propio producto
+        newest = defaultdict(list)
+        for category_id, product_id in CategoryRelatedProduct.objects.filter(
+            category__in={product.category_id for product in products} - {None},
+            product__is_active=True
+        ).order_by('category_id', 'rank').values_list('category_id', 'product_id'):
+            newest[category_id].append(product_id)
+        for product, row in zip(products, rows):
+            for kind, field in RELATED_FIELDS.items():
+                row[field] = links[product.id, kind]
+            row['related_products'] = category_related(product.id, newest[product.category_id])
+        
+        # Los relacionados también reciben la categoría y las imágenes pedidas
+        known_ids = {product.id for product in products}
+        related_ids = {related_id for ids in links.values() for related_id in ids}
+        related_ids.update(related_id for row in rows for related_id in row['related_products'])
+        related_ids -= known_ids
+        related = list(Product.objects.filter(id__in=related_ids).order_by('id'))
+        related_rows = serialize_resources(related, context)
+        included.add('products', related_rows)
+        products += related
+        rows += related_rows
+    
+    if 'category' in includes:
+        category_ids = {product.category_id for product in products} - {None}
+        categories = Category.objects.filter(id__in=category_ids).order_by('id')
+        included.add('categories', CategorySerializer(categories, many=True, context=context).data)
+    
+    if 'images' in includes:
+        images = list(ProductImage.objects.filter(
+            product__in=[product.id for product in products]
+        ).order_by('order', 'created_at'))
+        image_ids = defaultdict(list)
+        for image in images:
+            image_ids[image.product_id].append(image.id)
+        for product, row in zip(products, rows):
+            row['images'] = image_ids[product.id]
+        included.add('images', ProductImageSerializer(
+            images, many=True, context=context, field_selection=FieldSelection()
+        ).data)
+
+
+def product_document(products, includes, context):
+    """
+    Documento compuesto de productos: los productos con sus relaciones como
+    ids y en `included` las relaciones pedidas, sin duplicados
+
+    Returns:
+        tuple: (filas de los productos, sección included)
+    """
+    products = list(products)
+    rows = ProductResourceSerializer(products, many=True, context=context).data
+    included = IncludedResources('products', [product.id for product in products])
+    include_product_relations(products, rows, includes, included, context)
+    return rows, included.data
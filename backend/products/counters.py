@@ -0,0 +1,42 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
+from .models import Category, Product
+
+
+def adjust_active_products_count(category_id, delta):
+    """
+    Suma (o resta) productos activos al contador de una categoría con un
+    UPDATE atómico, sin leer la fila previamente
+    """
+    if not category_id or not delta:
+        return
+    # updated_at también cambia: el contador forma parte de la respuesta de la categoría
+    Category.objects.filter(pk=category_id).update(
+        active_products_count=F('active_products_count') + delta,
+        updated_at=Now()
+    )
+
+
+def rebuild_active_products_counts(category_ids=None):
+    """
+    Recalcula desde cero el contador de productos activos en un solo UPDATE
+
+    Args:
+        category_ids: Categorías a recalcular (todas si es None)
+
+    Returns:
+        int: Número de categorías actualizadas
+    """
+    active_products = Product.objects.filter(
+        category=OuterRef('pk'),
+        is_active=True
+    ).order_by().values('category').annotate(total=Count('pk')).values('total')
+    
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+    
+    return categories.update(
+        active_products_count=Coalesce(Subquery(active_products), 0),
+        updated_at=Now()
+    )
@@ -0,0 +1,105 @@
+import hashlib
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q
+from rest_framework.exceptions import ValidationError
+
+# Parámetros que no cambian los conteos y no deben fragmentar la caché
+NON_FILTER_PARAMS = {'cursor', 'page', 'page_size', 'ordering', 'price_buckets'}
+MAX_PRICE_BUCKETS = 20
+CENTS = Decimal('0.01')
+
+
+def parse_price_edges(raw):
+    """
+    Límites de los rangos de precio: '0,50,100' -> [0, 50, 100]
+    (rangos [0, 50), [50, 100) y [100, ∞))
+    """
+    if not raw:
+        return [Decimal(str(edge)) for edge in settings.PRODUCT_FACET_PRICE_BUCKETS]
+    try:
+        edges = sorted({Decimal(edge.strip()) for edge in raw.split(',') if edge.strip()})
+    except InvalidOperation:
+        raise ValidationError({'price_buckets': 'Los límites de precio deben ser números separados por comas'})
+    if not edges or len(edges) > MAX_PRICE_BUCKETS:
+        raise ValidationError({'price_buckets': f'Indica entre 1 y {MAX_PRICE_BUCKETS} límites de precio'})
+    return edges
+
+
+def facets_cache_key(query_params, edges):
+    """Clave de caché estable para el conjunto de filtros (sin orden ni paginación)"""
+    normalized = sorted(
+        (key, tuple(sorted(query_params.getlist(key))))
+        for key in query_params
+        if key not in NON_FILTER_PARAMS
+    )
+    raw = repr((normalized, [str(edge) for edge in edges]))
+    return 'products:facets:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def format_price(value):
+    return None if value is None else str(value.quantize(CENTS))
+
+
+def compute_product_facets(queryset, edges):
+    """
+    Conteos por categoría, rango de precio y stock, más precio mínimo y
+    máximo, en una sola consulta agregada agrupada por categoría
+    """
+    bucket_filters = []
+    for position, lower in enumerate(edges):
+        upper = edges[position + 1] if position + 1 < len(edges) else None
+        condition = Q(price__gte=lower)
+        if upper is not None:
+            condition &= Q(price__lt=upper)
+        bucket_filters.append((lower, upper, condition))
+
+    rows = queryset.prefetch_related(None).order_by().values(
+        'category_id', 'category__name'
+    ).annotate(
+        total=Count('pk'),
+        in_stock=Count('pk', filter=Q(stock__gt=0)),
+        min_price=Min('price'),
+        max_price=Max('price'),
+        **{
+            f'bucket_{position}': Count('pk', filter=condition)
+            for position, (_, _, condition) in enumerate(bucket_filters)
+        }
+    )
+
+    total = in_stock = 0
+    min_price = max_price = None
+    bucket_counts = [0] * len(bucket_filters)
+    categories = []
+    for row in rows:
+        total += row['total']
+        in_stock += row['in_stock']
+        if min_price is None or row['min_price'] < min_price:
+            min_price = row['min_price']
+        if max_price is None or row['max_price'] > max_price:
+            max_price = row['max_price']
+        for position in range(len(bucket_filters)):
+            bucket_counts[position] += row[f'bucket_{position}']
+        categories.append({
+            'id': row['category_id'],
+            'name': row['category__name'],
+            'count': row['total'],
+        })
+    categories.sort(key=lambda category: (-category['count'], category['name']))
+
+    return {
+        'total': total,
+        'categories': categories,
+        'price': {
+            'min': format_price(min_price),
+            'max': format_price(max_price),
+            'buckets': [
+                {'min': format_price(lower), 'max': format_price(upper), 'count': count}
+                for (lower, upper, _), count in zip(bucket_filters, bucket_counts)
+            ],
+        },
+        'stock': {
+            'in_stock': in_stock,
+            'out_of_stock': total - in_stock,
+        },
+    }
@@ -0,0 +1,26 @@
+from rest_framework import filters
+from .search import SEARCH_RANK, is_ranked, search_products, supports_full_text, uses_search_index
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    `?search=` con búsqueda de texto completo en PostgreSQL o con el índice BM25
+
+    Con el backend 'database' en otros motores (SQLite en los tests) conserva
+    el comportamiento de SearchFilter sobre `search_fields`.
+    """
+    
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not (uses_search_index() or supports_full_text(queryset)):
+            return super().filter_queryset(request, queryset, view)
+        return search_products(queryset, ' '.join(terms))
+
+
+class SearchRankOrderingFilter(filters.OrderingFilter):
+    """Ordena por relevancia cuando hay búsqueda y no se pidió un orden explícito"""
+    
+    def get_ordering(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param) and is_ranked(queryset):
+            return ['-' + SEARCH_RANK] + list(self.get_default_ordering(view) or [])
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,35 @@
+from django.db.models import Case, F, JSONField, Q, Value, When
+from django.db.models.functions import Now
+from .models import Product
+
+
+def sync_primary_image(image, removed=False):
+    """
+    Un solo UPDATE del producto de `image`: su updated_at (las imágenes son
+    parte de su respuesta) y la imagen principal desnormalizada
+
+    - Imagen principal: pasa a ser Product.primary_image
+    - Imagen que era la principal y se desmarcó: el producto queda sin ella
+    - Imagen principal eliminada: también (el FK ya quedó en NULL)
+    """
+    values = {'updated_at': Now()}
+    if removed:
+        if image.is_main:
+            values.update(primary_image=None, primary_image_url=None, primary_image_variants=[])
+    elif image.is_main:
+        values.update(
+            primary_image=image,
+            primary_image_url=image.image_url,
+            primary_image_variants=image.variants
+        )
+    else:
+        was_primary = Q(primary_image=image.pk)
+        values.update(
+            primary_image=Case(When(was_primary, then=None), default=F('primary_image')),
+            primary_image_url=Case(When(was_primary, then=None), default=F('primary_image_url')),
+            primary_image_variants=Case(
+                When(was_primary, then=Value([], output_field=JSONField())),
+                default=F('primary_image_variants')
+            )
+        )
+    Product.objects.filter(pk=image.product_id).update(**values)
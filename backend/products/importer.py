@@ -0,0 +1,274 @@
+import csv
+import json
+import time
+from collections import defaultdict
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from core.slugs import unique_slugs
+from .bulk import reindex_on_commit
+from .cache import bump_catalog_version
+from .counters import rebuild_active_products_counts
+from .models import Category, Product, catalog_slug_models
+from .related import refresh_category_related
+
+CHUNK_SIZE = 1000
+# Columnas que acepta el archivo; category puede ser el slug o el nombre
+IMPORT_FIELDS = (
+    'name', 'slug', 'description', 'price', 'stock', 'category',
+    'main_image_url', 'is_active', 'is_featured',
+)
+TRUE_VALUES = {'1', 't', 'true', 'y', 'yes', 's', 'si', 'sí'}
+FALSE_VALUES = {'0', 'f', 'false', 'n', 'no', ''}
+
+
+def detect_format(path):
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """
+    Recorre el archivo fila a fila sin cargarlo en memoria
+
+    Yields:
+        tuple: (número de línea, dict con la fila o None si no se pudo leer)
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def is_blank(value):
+    """Celda ausente o vacía: no pisa el valor guardado"""
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    normalized = str(value).strip().lower()
+    if normalized in TRUE_VALUES:
+        return True
+    if normalized in FALSE_VALUES:
+        return False
+    raise ValidationError(f'"{value}" no es un valor booleano válido')
+
+
+class CatalogImporter:
+    """
+    Importa productos por bloques: valida cada bloque con consultas por
+    conjunto (categorías, slugs) y lo escribe por slug, una escritura por
+    combinación de celdas con valor. Las filas de un slug que ya existe solo
+    validan y escriben sus celdas con valor (las vacías y las columnas que
+    falten no pisan lo guardado), así que basta con p. ej. slug,stock; las
+    demás son altas y necesitan al menos nombre, descripción, precio y
+    categoría. Las filas sin slug siempre crean un producto, con un slug libre.
+
+    Las validaciones de campo son las del modelo (Field.clean); las de
+    unicidad de Product.clean se resuelven para todo el bloque a la vez. Como
+    bulk_create no emite señales, al final de cada bloque se recalculan los
+    contadores de las categorías tocadas, se reindexan los productos en el
+    índice BM25 del proceso y se invalida la caché del catálogo; los
+    relacionados por categoría se recalculan una vez al terminar.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, rejects=None, progress=None):
+        self.chunk_size = chunk_size
+        self.rejects = rejects
+        self.progress = progress
+        self.fields = {name: Product._meta.get_field(name) for name in IMPORT_FIELDS if name != 'category'}
+        self.categories = {}
+        self.touched_categories = set()
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'rejected': 0}
+
+    def run(self, rows):
+        """
+        Importa las filas de `read_rows` y devuelve las estadísticas:
+        filas leídas, creadas, actualizadas y rechazadas
+        """
+        started = time.perf_counter()
+        for chunk in chunked(rows, self.chunk_size):
+            self.import_chunk(chunk)
+            if self.progress:
+                elapsed = time.perf_counter() - started
+                self.progress(self.stats, self.stats['rows'] / elapsed if elapsed else 0)
+        if self.touched_categories:
+            refresh_category_related(self.touched_categories)
+        self.stats['seconds'] = time.perf_counter() - started
+        return self.stats
+
+    def reject(self, line_number, row, errors):
+        self.stats['rejected'] += 1
+        if self.rejects is not None:
+            self.rejects.write(json.dumps(
+                {'line': line_number, 'errors': errors, 'row': row},
+                ensure_ascii=False,
+                default=str
+            ) + '\n')
+
+    def clean_row(self, row, partial=False):
+        """
+        Valores de la fila validados con los campos del modelo; lanza
+        ValidationError con los errores por campo
+
+        Con `partial` (el slug ya existe) solo se validan y devuelven las
+        celdas con valor; si no, la fila es un alta completa.
+        """
+        values, errors = {}, {}
+        for name, field in self.fields.items():
+            raw = row.get(name)
+            if isinstance(raw, str):
+                raw = raw.strip()
+            if name == 'slug' and is_blank(raw):
+                # Sin slug la fila es un producto nuevo: se le asigna uno libre al escribir el bloque
+                values[name] = ''
+                continue
+            if partial and is_blank(raw):
+                continue
+            try:
+                if raw is None or (raw == '' and field.has_default()):
+                    value = field.get_default()
+                elif field.get_internal_type() == 'BooleanField':
+                    value = parse_bool(raw)
+                else:
+                    value = raw
+                if value == '' and field.null:
+                    value = None
+                values[name] = field.clean(value, None)
+            except ValidationError as error:
+                errors[name] = error.messages
+        category = str(row.get('category') or '').strip()
+        if category:
+            values['category'] = category
+        elif not partial:
+            errors['category'] = ['Este campo no puede estar en blanco.']
+        if errors:
+            raise ValidationError(errors)
+        return values
+
+    def resolve_categories(self, keys):
+        """Categorías por slug o nombre; una sola consulta por bloque para las que aún no se conocen"""
+        missing = set(keys) - set(self.categories)
+        if missing:
+            for category_id, slug, name in Category.objects.filter(
+                Q(slug__in=missing) | Q(name__in=missing)
+            ).values_list('id', 'slug', 'name'):
+                self.categories[slug] = category_id
+                self.categories[name] = category_id
+
+    def import_chunk(self, chunk):
+        self.stats['rows'] += len(chunk)
+        # Slugs del bloque que ya existen: sus filas solo actualizan las celdas con valor
+        existing = set(Product.objects.filter(slug__in={
+            str(row.get('slug') or '').strip() for _, row in chunk if row is not None
+        } - {''}).values_list('slug', flat=True))
+        cleaned, unslugged = {}, []
+        for line_number, row in chunk:
+            if row is None:
+                self.reject(line_number, None, {'row': ['Línea con formato inválido']})
+                continue
+            try:
+                values = self.clean_row(row, partial=str(row.get('slug') or '').strip() in existing)
+            except ValidationError as error:
+                self.reject(line_number, row, error.message_dict)
+                continue
+            if not values['slug']:
+                unslugged.append((line_number, row, values))
+                continue
+            if values['slug'] in cleaned:
+                # Como entre bloques, la última fila con el mismo slug es la que queda
+                replaced_line, replaced_row, _ = cleaned.pop(values['slug'])
+                self.reject(replaced_line, replaced_row, {'slug': [f'Reemplazada por la línea {line_number}']})
+            cleaned[values['slug']] = (line_number, row, values)
+        if not cleaned and not unslugged:
+            return
+
+        # Product.clean: el slug no puede coincidir con el de una categoría
+        category_slugs = set(Category.objects.filter(slug__in=cleaned).values_list('slug', flat=True))
+        # Solo se empareja con productos existentes por el slug del archivo; sin
+        # él cada fila crea un producto con un slug libre (también de categorías)
+        slugs = unique_slugs(
+            Product,
+            [values['name'] for _, _, values in unslugged],
+            catalog_slug_models(),
+            reserved=cleaned
+        )
+        for (line_number, row, values), slug in zip(unslugged, slugs):
+            values['slug'] = slug
+            cleaned[slug] = (line_number, row, values)
+
+        self.resolve_categories({values['category'] for _, _, values in cleaned.values() if 'category' in values})
+        # Una escritura por combinación de celdas con valor: las vacías no pisan lo guardado
+        groups = defaultdict(list)
+        for slug, (line_number, row, values) in cleaned.items():
+            category = values.pop('category', None)
+            category_id = self.categories.get(category)
+            if category is not None and category_id is None:
+                self.reject(line_number, row, {'category': [f'No existe la categoría "{category}"']})
+            elif slug in category_slugs:
+                self.reject(line_number, row, {'slug': [f'Ya existe un registro con el slug "{slug}"']})
+            else:
+                filled = tuple(name for name in self.fields if name != 'slug' and not is_blank(row.get(name)))
+                if category_id is not None:
+                    values['category_id'] = category_id
+                    filled = ('category', *filled)
+                groups[filled, slug in existing].append(Product(**values))
+        for (filled, partial), products in groups.items():
+            self.write(products, ['updated_at', *filled], partial)
+
+    def write(self, products, update_fields, partial=False):
+        """
+        Escribe el bloque en una transacción, con los contadores de sus
+        categorías: upsert por slug para las altas y bulk_update de
+        `update_fields` para las filas parciales de productos existentes
+        """
+        slugs = [product.slug for product in products]
+        with transaction.atomic():
+            previous = {
+                slug: (product_id, category_id)
+                for slug, product_id, category_id in Product.objects.select_for_update().filter(
+                    slug__in=slugs
+                ).values_list('slug', 'id', 'category_id')
+            }
+            if partial:
+                # Un producto borrado desde que se validó el bloque ya no se puede completar
+                products = [product for product in products if product.slug in previous]
+                now = timezone.now()
+                for product in products:
+                    product.pk = previous[product.slug][0]
+                    product.updated_at = now
+                Product.objects.bulk_update(products, update_fields)
+            else:
+                Product.objects.bulk_create(
+                    products,
+                    update_conflicts=True,
+                    unique_fields=['slug'],
+                    update_fields=update_fields
+                )
+            touched = {category_id for _, category_id in previous.values()}
+            touched |= {product.category_id for product in products if product.category_id}
+            rebuild_active_products_counts(touched)
+            reindex_on_commit(Product.objects.filter(slug__in=slugs))
+            transaction.on_commit(bump_catalog_version)
+        self.touched_categories |= touched
+        updated = len(products) if partial else len(previous)
+        self.stats['updated'] += updated
+        self.stats['created'] += len(products) - updated
@@ -0,0 +1,63 @@
+import time
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+from products.models import Category, Product
+from products.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara actualizar precio y stock con un PATCH por producto y con '
+        'PATCH /api/products/bulk/ (los cambios se revierten al terminar)'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500, help='Productos a actualizar')
+    
+    def handle(self, *args, **options):
+        total = options['products']
+        factory = APIRequestFactory()
+        admin = get_user_model()(email='benchmark@example.com', is_staff=True, is_superuser=True)
+        
+        with transaction.atomic():
+            category = Category.objects.create(name='Benchmark bulk', slug='benchmark-bulk')
+            Product.objects.bulk_create([
+                Product(
+                    name=f'Benchmark {number}',
+                    slug=f'benchmark-bulk-{number}',
+                    description='Producto de prueba',
+                    price=Decimal('10.00'),
+                    stock=1,
+                    category=category
+                )
+                for number in range(total)
+            ])
+            items = [
+                {'slug': f'benchmark-bulk-{number}', 'price': f'{11 + number % 50}.90', 'stock': number % 20}
+                for number in range(total)
+            ]
+            
+            partial_update = ProductViewSet.as_view({'patch': 'partial_update'})
+            started = time.perf_counter()
+            for item in items:
+                request = factory.patch(f'/api/products/{item["slug"]}/', item, format='json')
+                force_authenticate(request, user=admin)
+                partial_update(request, slug=item['slug'])
+            per_item = time.perf_counter() - started
+            
+            bulk_update = ProductViewSet.as_view({'patch': 'bulk_update'})
+            request = factory.patch('/api/products/bulk/', items, format='json')
+            force_authenticate(request, user=admin)
+            started = time.perf_counter()
+            response = bulk_update(request)
+            bulk = time.perf_counter() - started
+            transaction.set_rollback(True)
+        
+        self.stdout.write(f'  PATCH por producto    {per_item:8.2f} s  ({total / per_item:8.0f} productos/s)')
+        self.stdout.write(f'  PATCH /products/bulk/ {bulk:8.2f} s  ({total / bulk:8.0f} productos/s)')
+        self.stdout.write(self.style.SUCCESS(
+            f"{response.data['updated']} productos actualizados en bloque, x{per_item / bulk:.0f} más rápido"
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from products.similarity import TOP_K, build_similar_products
+
+
+class Command(BaseCommand):
+    help = 'Calcula los productos similares por contenido (TF-IDF de nombre y descripción)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recalcular desde cero en lugar de procesar solo los cambios')
+        parser.add_argument('--path', help='Archivo .npz con el estado entre ejecuciones')
+        parser.add_argument('--top', type=int, default=TOP_K, help='Similares por producto')
+    
+    def handle(self, *args, **options):
+        result = build_similar_products(full=options['full'], path=options['path'], k=options['top'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Productos vectorizados: {result['products']}, filas recalculadas: {result['updated']}, "
+            f"enlaces guardados: {result['links']}"
+        ))
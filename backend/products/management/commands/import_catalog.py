@@ -0,0 +1,52 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from products.importer import CHUNK_SIZE, CatalogImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa productos desde CSV o JSONL por bloques (upsert por slug). '
+        'Las filas inválidas se escriben en un archivo aparte con sus errores'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo CSV (con cabecera) o JSONL')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Formato (por defecto según la extensión)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Filas por bloque y transacción')
+        parser.add_argument('--rejects', help='Archivo JSONL de filas rechazadas (por defecto <path>.rejects.jsonl)')
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        rejects_path = options['rejects'] or f'{path}.rejects.jsonl'
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size debe ser mayor a 0')
+        
+        try:
+            source = open(path, encoding='utf-8-sig', newline='')
+        except OSError as error:
+            raise CommandError(f'No se pudo abrir {path}: {error}')
+        
+        with source, open(rejects_path, 'w', encoding='utf-8') as rejects:
+            importer = CatalogImporter(
+                chunk_size=options['chunk_size'],
+                rejects=rejects,
+                progress=self.report_progress
+            )
+            stats = importer.run(read_rows(source, fmt))
+        
+        rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Importación terminada: {stats['rows']} filas en {stats['seconds']:.1f}s ({rate:.0f} filas/s), "
+            f"{stats['created']} creados, {stats['updated']} actualizados, {stats['rejected']} rechazados"
+        ))
+        if stats['rejected']:
+            self.stdout.write(self.style.WARNING(f'Filas rechazadas en {rejects_path}'))
+        else:
+            os.remove(rejects_path)
+    
+    def report_progress(self, stats, rate):
+        self.stdout.write(
+            f"  {stats['rows']} filas ({rate:.0f} filas/s): {stats['created']} creados, "
+            f"{stats['updated']} actualizados, {stats['rejected']} rechazados"
+        )
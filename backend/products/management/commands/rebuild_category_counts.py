@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.counters import rebuild_active_products_counts
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero el contador de productos activos de cada categoría'
+    
+    def handle(self, *args, **options):
+        updated = rebuild_active_products_counts()
+        self.stdout.write(self.style.SUCCESS(f'Contadores recalculados para {updated} categorías'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from products.related import refresh_category_related
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero la lista de productos relacionados de cada categoría'
+    
+    def handle(self, *args, **options):
+        created, deleted = refresh_category_related()
+        self.stdout.write(self.style.SUCCESS(
+            f'Productos relacionados actualizados: {created} creados, {deleted} eliminados'
+        ))
@@ -0,0 +1,26 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.search_engine import build_search_index, save_search_index
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice BM25 de productos y guarda la instantánea que cargan los workers'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=settings.PRODUCT_SEARCH_INDEX_PATH,
+            help='Ruta de la instantánea (por defecto PRODUCT_SEARCH_INDEX_PATH)'
+        )
+    
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        index = build_search_index()
+        save_search_index(index, options['path'])
+        elapsed = time.perf_counter() - started
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice reconstruido: {len(index)} productos, {index.term_count} términos '
+            f'en {elapsed:.1f}s -> {options["path"]}'
+        ))
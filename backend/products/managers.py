@@ -0,0 +1,54 @@
+from django.db import models
+from django.db.models import Prefetch
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_card_data(self, relations=None):
+        """
+        Plan de consulta para listados: la categoría viaja en el mismo JOIN y
+        las imágenes se cargan ordenadas en una sola consulta adicional, sin
+        importar cuántos productos o imágenes haya en la página.
+
+        `relations` limita la carga a {'category', 'images'} (ambas si es
+        None), según los campos pedidos con ?fields= / ?omit=.
+        """
+        from .models import ProductImage
+
+        queryset = self
+        if relations is None or 'category' in relations:
+            queryset = queryset.select_related('category')
+        if relations is None or 'images' in relations:
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=ProductImage.objects.order_by('order', 'created_at'))
+            )
+        return queryset
+    
+    def with_related_cards(self, *kinds):
+        """
+        Relacionados precalculados (RelatedProduct) de los tipos indicados en
+        `related_cards`: los productos relacionados y su categoría llegan en
+        una sola consulta, más otra para sus imágenes
+        """
+        from .related import related_cards
+
+        return self.prefetch_related(
+            Prefetch('related_links', queryset=related_cards(*kinds), to_attr='related_cards')
+        )
+    
+    def with_category_cards(self):
+        """
+        Lista de relacionados de la categoría de cada producto (ver
+        CategoryRelatedProduct) en `category.related_cards`: una consulta para
+        la lista con sus productos y categorías, más otra para sus imágenes
+        """
+        from .related import category_cards
+
+        return self.select_related('category').prefetch_related(
+            Prefetch('category__related_links', queryset=category_cards(), to_attr='related_cards')
+        )
+
+
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    def get_queryset(self):
+        # El tsvector solo lo usa la búsqueda en PostgreSQL: no cargarlo con cada fila
+        return super().get_queryset().defer('search_vector')
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_active_products_count(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    active_products = Product.objects.filter(
+        category=OuterRef('pk'),
+        is_active=True
+    ).order_by().values('category').annotate(total=Count('pk')).values('total')
+    Category.objects.update(active_products_count=Coalesce(Subquery(active_products), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_alter_category_image_url_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_products_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Productos activos'),
+        ),
+        migrations.RunPython(populate_active_products_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:28
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# El nombre del producto pesa más (A) que la descripción (B) en el ranking
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('spanish', coalesce({prefix}name, '')), 'A') ||
+    setweight(to_tsvector('spanish', coalesce({prefix}description, '')), 'B')
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    # El trigger y el índice GIN solo existen en PostgreSQL; SQLite usa icontains
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"""
+        CREATE OR REPLACE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {SEARCH_VECTOR_SQL.format(prefix='NEW.')};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+    """)
+    schema_editor.execute("""
+        CREATE TRIGGER products_product_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF name, description ON products_product
+        FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update();
+    """)
+    schema_editor.execute(
+        f"UPDATE products_product SET search_vector = {SEARCH_VECTOR_SQL.format(prefix='')};"
+    )
+    schema_editor.execute(
+        "CREATE INDEX products_product_search_vector_gin "
+        "ON products_product USING GIN (search_vector);"
+    )
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS products_product_search_vector_gin;")
+    schema_editor.execute(
+        "DROP TRIGGER IF EXISTS products_product_search_vector_trigger ON products_product;"
+    )
+    schema_editor.execute("DROP FUNCTION IF EXISTS products_product_search_vector_update();")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_category_active_products_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+RELATED_PRODUCTS_LIMIT = 4
+
+
+def populate_related_products(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    RelatedProduct = apps.get_model('products', 'RelatedProduct')
+    category_ids = Product.objects.filter(is_active=True).values_list('category_id', flat=True).distinct()
+    for category_id in category_ids:
+        active = Product.objects.filter(category_id=category_id, is_active=True).order_by('-created_at', '-id')
+        newest_ids = list(active.values_list('id', flat=True)[:RELATED_PRODUCTS_LIMIT + 1])
+        links = []
+        for product_id in active.values_list('id', flat=True):
+            related = [related_id for related_id in newest_ids if related_id != product_id]
+            links.extend(
+                RelatedProduct(product_id=product_id, related_id=related_id, kind='category', rank=rank)
+                for rank, related_id in enumerate(related[:RELATED_PRODUCTS_LIMIT])
+            )
+        RelatedProduct.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('category', 'Misma categoría')], default='category', max_length=20, verbose_name='Tipo')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Posición')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='products.product', verbose_name='Producto')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product', verbose_name='Relacionado')),
+            ],
+            options={
+                'verbose_name': 'Producto relacionado',
+                'verbose_name_plural': 'Productos relacionados',
+                'ordering': ['product', 'kind', 'rank'],
+                'indexes': [models.Index(fields=['product', 'kind', 'rank'], name='related_product_rank')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedproduct',
+            constraint=models.UniqueConstraint(fields=('product', 'kind', 'related'), name='related_product_unique'),
+        ),
+        migrations.RunPython(populate_related_products, migrations.RunPython.noop),
+    ]
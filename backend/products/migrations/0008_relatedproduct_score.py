@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_related_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatedproduct',
+            name='score',
+            field=models.FloatField(default=0, verbose_name='Puntuación'),
+        ),
+        migrations.AlterField(
+            model_name='relatedproduct',
+            name='kind',
+            field=models.CharField(choices=[('category', 'Misma categoría'), ('bought_together', 'Comprados juntos')], default='category', max_length=20, verbose_name='Tipo'),
+        ),
+    ]
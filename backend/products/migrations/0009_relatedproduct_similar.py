@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_relatedproduct_score'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='relatedproduct',
+            name='kind',
+            field=models.CharField(choices=[('category', 'Misma categoría'), ('bought_together', 'Comprados juntos'), ('similar', 'Similares por contenido')], default='category', max_length=20, verbose_name='Tipo'),
+        ),
+    ]
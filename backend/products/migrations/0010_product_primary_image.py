@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def deduplicate_main_images(apps, schema_editor):
+    ProductImage = apps.get_model('products', 'ProductImage')
+    # Antes del índice único: si un producto tiene varias principales, queda la primera
+    mains = ProductImage.objects.filter(is_main=True).order_by('product_id', 'order', 'created_at', 'id')
+    keep, duplicates = set(), []
+    for image_id, product_id in mains.values_list('id', 'product_id'):
+        if product_id in keep:
+            duplicates.append(image_id)
+        keep.add(product_id)
+    ProductImage.objects.filter(id__in=duplicates).update(is_main=False)
+
+
+def populate_primary_image(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductImage = apps.get_model('products', 'ProductImage')
+    main = ProductImage.objects.filter(product=OuterRef('pk'), is_main=True)
+    Product.objects.filter(images__is_main=True).update(
+        primary_image=Subquery(main.values('id')[:1]),
+        primary_image_url=Subquery(main.values('image_url')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_relatedproduct_similar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.productimage', verbose_name='Imagen principal de la galería'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_url',
+            field=models.URLField(blank=True, editable=False, null=True, verbose_name='URL de la imagen principal de la galería'),
+        ),
+        migrations.RunPython(deduplicate_main_images, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productimage',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_main', True)), fields=('product',), name='productimage_one_main'),
+        ),
+        migrations.RunPython(populate_primary_image, migrations.RunPython.noop),
+    ]
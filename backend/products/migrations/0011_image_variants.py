@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='main_image_variants',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Variantes de la imagen principal'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_variants',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Variantes de la imagen principal de la galería'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=list, verbose_name='Variantes'),
+        ),
+    ]
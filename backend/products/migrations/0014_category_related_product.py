@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+RELATED_PRODUCTS_LIMIT = 4
+
+
+def move_category_related(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    RelatedProduct = apps.get_model('products', 'RelatedProduct')
+    CategoryRelatedProduct = apps.get_model('products', 'CategoryRelatedProduct')
+    RelatedProduct.objects.filter(kind='category').delete()
+    category_ids = Product.objects.filter(is_active=True).values_list('category_id', flat=True).distinct()
+    links = []
+    for category_id in category_ids:
+        newest_ids = Product.objects.filter(
+            category_id=category_id,
+            is_active=True
+        ).order_by('-created_at', '-id').values_list('id', flat=True)[:RELATED_PRODUCTS_LIMIT + 1]
+        links.extend(
+            CategoryRelatedProduct(category_id=category_id, product_id=product_id, rank=rank)
+            for rank, product_id in enumerate(newest_ids)
+        )
+    CategoryRelatedProduct.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_keyset_tiebreaker_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='relatedproduct',
+            name='kind',
+            field=models.CharField(choices=[('bought_together', 'Comprados juntos'), ('similar', 'Similares por contenido')], max_length=20, verbose_name='Tipo'),
+        ),
+        migrations.CreateModel(
+            name='CategoryRelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Posición')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='products.category', verbose_name='Categoría')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Relacionado por categoría',
+                'verbose_name_plural': 'Relacionados por categoría',
+                'ordering': ['category', 'rank'],
+                'indexes': [models.Index(fields=['category', 'rank'], name='category_related_rank')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='categoryrelatedproduct',
+            constraint=models.UniqueConstraint(fields=('category', 'product'), name='category_related_unique'),
+        ),
+        migrations.RunPython(move_category_related, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,80 @@
-from django.db import models
-from django.utils.text import slugify
+from django.db import models, transaction
+from django.db.models import Q
+from django.contrib.postgres.search import SearchVectorField
 from django.urls import reverse
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from core.validators import (
     validate_positive_price,
     validate_non_negative_stock,
-    validate_unique_slug,
     validate_url_format
 )
+from core.imaging import build_srcset
+from core.slugs import unique_slug, validate_slug_available
+from .managers import ProductManager
+
+
+# Modos de validación de save():
+# - 'full': validadores de campo, clean() y unicidad (por defecto: admin, shell)
+# - 'fields': solo validadores de campo (sin clean() ni comprobaciones de unicidad)
+# - 'trusted': sin validar; datos que ya validó un serializer o escritos por
+#   procesos internos
+VALIDATE_FULL = 'full'
+VALIDATE_FIELDS = 'fields'
+VALIDATE_TRUSTED = 'trusted'
+VALIDATION_MODES = (VALIDATE_FULL, VALIDATE_FIELDS, VALIDATE_TRUSTED)
+
+
+def validate_for_save(instance, validation, update_fields=None, exclude=()):
+    """
+    Validaciones de save() según el modo; con update_fields solo se validan
+    los campos que se van a escribir
+    """
+    if validation not in VALIDATION_MODES:
+        raise ValueError(f'Modo de validación desconocido: {validation}')
+    if validation == VALIDATE_TRUSTED:
+        return
+    exclude = set(exclude)
+    if update_fields is not None:
+        exclude.update(
+            field.name for field in instance._meta.concrete_fields
+            if field.name not in update_fields and field.attname not in update_fields
+        )
+    if validation == VALIDATE_FIELDS:
+        instance.clean_fields(exclude=exclude)
+    else:
+        instance.full_clean(exclude=exclude, validate_unique=False)
+
+
+# Campos de Product que save() no valida ni reescribe: search_vector (trigger
+# de PostgreSQL) y la imagen principal (products.images)
+PRODUCT_MANAGED_FIELDS = ['search_vector', 'primary_image', 'primary_image_url', 'primary_image_variants']
+
+
+def catalog_slug_models():
+    """Productos y categorías comparten el espacio de slugs"""
+    return (Product, Category)
+
+
+def remember_loaded_slug(instance, field_names, values):
+    # Slug y nombre guardados: si no cambian no hace falta volver a validarlos
+    loaded = dict(zip(field_names, values))
+    instance._checked_slug = loaded.get('slug')
+    instance._loaded_name = loaded.get('name')
+
+
+def assign_catalog_slug(instance):
+    """Sin slug: el del nombre, con sufijo numérico si ya existe (una consulta)"""
+    if not instance.slug:
+        instance.slug = unique_slug(instance, instance.name, catalog_slug_models())
+        instance._checked_slug = instance.slug
+
+
+def validate_catalog_slug(instance):
+    """Slug único entre productos y categorías, con una sola consulta"""
+    if instance.slug and instance.slug != getattr(instance, '_checked_slug', None):
+        validate_slug_available(instance, instance.slug, catalog_slug_models())
+        instance._checked_slug = instance.slug
 
 
 class Category(models.Model):
@@ -22,6 +88,12 @@ class Category(models.Model):
         validators=[validate_url_format]
     )
     is_active = models.BooleanField(default=True, verbose_name='Activo')
+    # Desnormalizado: se mantiene desde las señales de Product (ver products.counters)
+    active_products_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Productos activos'
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Creado')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Actualizado')
     
@@ -33,17 +105,30 @@ class Category(models.Model):
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        remember_loaded_slug(instance, field_names, values)
+        return instance
+    
     def clean(self):
         super().clean()
-        # Validar slug único
-        if self.slug:
-            validate_unique_slug(self.slug, Product, self)
+        validate_catalog_slug(self)
     
-    def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        # Ejecutar validaciones
-        self.full_clean()
+    def save(self, *args, validation=VALIDATE_FULL, **kwargs):
+        assign_catalog_slug(self)
+        # Ejecutar validaciones; la unicidad del slug ya la resolvió clean()
+        update_fields = kwargs.get('update_fields')
+        validate_for_save(self, validation, update_fields)
+        name_changed = self._state.adding or self.name != getattr(self, '_loaded_name', None)
+        if validation == VALIDATE_FULL and name_changed and (update_fields is None or 'name' in update_fields):
+            self.validate_unique(exclude=['slug'])
+        # No sobrescribir el contador desnormalizado con un valor en memoria desactualizado
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'active_products_count'
+            ]
         super().save(*args, **kwargs)
     
     def get_absolute_url(self):
@@ -73,31 +158,102 @@ class Product(models.Model):
         validators=[validate_url_format]
     )
     main_image = models.ImageField(upload_to='temp/', blank=True, null=True, verbose_name='Imagen principal (subir archivo)')
+    # Variantes redimensionadas de main_image_url: [{'url', 'width', 'height', 'format'}]
+    main_image_variants = models.JSONField(default=list, blank=True, editable=False, verbose_name='Variantes de la imagen principal')
     is_active = models.BooleanField(default=True, verbose_name='Activo')
     is_featured = models.BooleanField(default=False, verbose_name='Destacado')
+    # Desnormalizado: la imagen marcada como principal y su URL, para que las
+    # tarjetas no consulten las imágenes (se mantiene en products.images)
+    primary_image = models.ForeignKey(
+        'ProductImage',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+        verbose_name='Imagen principal de la galería'
+    )
+    primary_image_url = models.URLField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='URL de la imagen principal de la galería'
+    )
+    primary_image_variants = models.JSONField(
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name='Variantes de la imagen principal de la galería'
+    )
+    # Mantenido por un trigger en PostgreSQL (ver migración 0005); nulo en otros motores
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Creado')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Actualizado')
     
+    objects = ProductManager()
+    
     class Meta:
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
         ordering = ['-created_at']
+        indexes = [
+            # Catálogo por categoría: WHERE category AND is_active ORDER BY -created_at, -id.
+            # is_active va en la condición y no como columna: Django lo compila como
+            # booleano desnudo y SQLite no lo usaría como igualdad dentro del índice.
+            # `-id` es el desempate de KeysetPagination: sin él se ordena en memoria
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=Q(is_active=True),
+                name='product_cat_active_created'
+            ),
+            # Listado general y "latest": solo productos activos
+            models.Index(fields=['-created_at', '-id'], condition=Q(is_active=True), name='product_active_created'),
+            # Destacados
+            models.Index(
+                fields=['-created_at'],
+                condition=Q(is_active=True, is_featured=True),
+                name='product_featured_created'
+            ),
+            # Puesta al día del índice BM25 de cada worker (products.search_engine)
+            models.Index(fields=['updated_at'], name='product_updated_at'),
+            # Rangos y orden por precio
+            models.Index(fields=['price', 'id'], condition=Q(is_active=True), name='product_active_price'),
+        ]
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Recordar el estado cargado para calcular los cambios del contador al guardar
+        loaded = dict(zip(field_names, values))
+        if 'category_id' in loaded and 'is_active' in loaded:
+            instance._counter_state = (loaded['category_id'], loaded['is_active'])
+        remember_loaded_slug(instance, field_names, values)
+        return instance
+    
     def clean(self):
         super().clean()
-        # Validar slug único
-        if self.slug:
-            validate_unique_slug(self.slug, Category, self)
+        validate_catalog_slug(self)
     
-    def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        # Ejecutar validaciones
-        self.full_clean()
-        super().save(*args, **kwargs)
+    def save(self, *args, validation=VALIDATE_FULL, **kwargs):
+        assign_catalog_slug(self)
+        # Ejecutar validaciones (search_vector lo calcula la base de datos);
+        # slug es el único campo único y ya lo resolvió clean()
+        validate_for_save(self, validation, kwargs.get('update_fields'), exclude=PRODUCT_MANAGED_FIELDS)
+        # No sobrescribir la imagen principal con un valor en memoria desactualizado
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in PRODUCT_MANAGED_FIELDS
+                and field.attname not in deferred
+            ]
+        # Las señales post_save (contador de la categoría) corren en la misma transacción
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     def get_absolute_url(self):
         return reverse('products:product_detail', kwargs={'slug': self.slug})
@@ -107,13 +263,14 @@ class Product(models.Model):
         return self.stock > 0
     
     def get_main_image_url(self):
+        # Si no hay imagen principal, usar la de la galería marcada como principal
+        return self.main_image_url or self.primary_image_url or None
+    
+    def get_main_image_srcset(self):
+        # Variantes de la misma imagen que devuelve get_main_image_url()
         if self.main_image_url:
-            return self.main_image_url
-        # Si no hay imagen principal, usar la primera imagen disponible
-        first_image = self.images.filter(is_main=True).first()
-        if first_image:
-            return first_image.image_url
-        return None
+            return build_srcset(self.main_image_url, self.main_image_variants)
+        return build_srcset(self.primary_image_url, self.primary_image_variants)
 
 
 class ProductImage(models.Model):
@@ -123,6 +280,8 @@ class ProductImage(models.Model):
         validators=[validate_url_format]
     )
     alt_text = models.CharField(max_length=200, blank=True, verbose_name='Texto alternativo')
+    # Variantes redimensionadas (core.imaging): [{'url', 'width', 'height', 'format'}]
+    variants = models.JSONField(default=list, blank=True, verbose_name='Variantes')
     is_main = models.BooleanField(default=False, verbose_name='Imagen principal')
     order = models.PositiveIntegerField(default=0, verbose_name='Orden')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Creado')
@@ -131,12 +290,92 @@ class ProductImage(models.Model):
         verbose_name = 'Imagen de producto'
         verbose_name_plural = 'Imágenes de productos'
         ordering = ['order', 'created_at']
+        constraints = [
+            # Una sola imagen principal por producto
+            models.UniqueConstraint(
+                fields=['product'],
+                condition=Q(is_main=True),
+                name='productimage_one_main'
+            ),
+        ]
     
     def __str__(self):
         return f'{self.product.name} - Imagen {self.order}'
     
+    def validate_constraints(self, exclude=None):
+        # save() desmarca la principal anterior: marcar otra no es un error de validación
+        super().validate_constraints(exclude={*(exclude or ()), 'is_main'})
+    
     def save(self, *args, **kwargs):
-        # Si esta imagen se marca como principal, desmarcar las demás
-        if self.is_main:
-            ProductImage.objects.filter(product=self.product, is_main=True).update(is_main=False)
-        super().save(*args, **kwargs)
+        # La señal post_save actualiza Product.primary_image en la misma transacción
+        with transaction.atomic():
+            if self.is_main:
+                # Desmarcar la principal anterior antes de escribir (índice único parcial)
+                ProductImage.objects.filter(
+                    product_id=self.product_id,
+                    is_main=True
+                ).exclude(pk=self.pk).update(is_main=False)
+            super().save(*args, **kwargs)
+
+
+class RelatedProduct(models.Model):
+    """
+    Productos relacionados precalculados (top-K por producto y tipo de relación)
+    
+    Los de la misma categoría no van aquí: son los mismos para todos los
+    productos de la categoría (ver CategoryRelatedProduct)
+    """
+    KIND_BOUGHT_TOGETHER = 'bought_together'
+    KIND_SIMILAR = 'similar'
+    KIND_CHOICES = [
+        (KIND_BOUGHT_TOGETHER, 'Comprados juntos'),
+        (KIND_SIMILAR, 'Similares por contenido'),
+    ]
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links', verbose_name='Producto')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='Relacionado')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Tipo')
+    rank = models.PositiveSmallIntegerField(verbose_name='Posición')
+    score = models.FloatField(default=0, verbose_name='Puntuación')
+    
+    class Meta:
+        verbose_name = 'Producto relacionado'
+        verbose_name_plural = 'Productos relacionados'
+        ordering = ['product', 'kind', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'kind', 'related'], name='related_product_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'kind', 'rank'], name='related_product_rank'),
+        ]
+    
+    def __str__(self):
+        return f'{self.product_id} -> {self.related_id} ({self.kind})'
+
+
+class CategoryRelatedProduct(models.Model):
+    """
+    Relacionados por categoría: los productos activos más recientes de cada
+    categoría, uno más que RELATED_PRODUCTS_LIMIT para poder descartar al
+    propio producto al leerlos
+    
+    Una sola lista por categoría: dar de alta, mover o desactivar un producto
+    reescribe a lo sumo esa lista, no la de cada producto de la categoría.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='related_links', verbose_name='Categoría')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='Producto')
+    rank = models.PositiveSmallIntegerField(verbose_name='Posición')
+    
+    class Meta:
+        verbose_name = 'Relacionado por categoría'
+        verbose_name_plural = 'Relacionados por categoría'
+        ordering = ['category', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'product'], name='category_related_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'rank'], name='category_related_rank'),
+        ]
+    
+    def __str__(self):
+        return f'{self.category_id} -> {self.product_id}'
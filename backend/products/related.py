@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from .models import Category, CategoryRelatedProduct, Product, ProductImage, RelatedProduct
+
+
+def related_cards(*kinds):
+    """Enlaces de los tipos indicados con el producto relacionado listo para serializar como tarjeta"""
+    return RelatedProduct.objects.filter(
+        kind__in=kinds,
+        related__is_active=True
+    ).select_related('related__category').defer('related__search_vector').prefetch_related(
+        Prefetch('related__images', queryset=ProductImage.objects.order_by('order', 'created_at'))
+    ).order_by('rank')
+
+
+def category_cards():
+    """Lista de relacionados de cada categoría con el producto listo para serializar como tarjeta"""
+    return CategoryRelatedProduct.objects.filter(
+        product__is_active=True
+    ).select_related('product__category').defer('product__search_vector').prefetch_related(
+        Prefetch('product__images', queryset=ProductImage.objects.order_by('order', 'created_at'))
+    ).order_by('rank')
+
+
+def category_related(product_id, newest, limit=None):
+    """
+    Relacionados por categoría de un producto: los `limit` primeros de la
+    lista de su categoría (ids o productos), sin contarse a sí mismo
+    """
+    limit = limit or settings.RELATED_PRODUCTS_LIMIT
+    return [item for item in newest if getattr(item, 'id', item) != product_id][:limit]
+
+
+def refresh_category_related(category_ids=None):
+    """
+    Recalcula la lista de productos más recientes de cada categoría y aplica
+    solo las diferencias
+
+    Se leen y escriben a lo sumo RELATED_PRODUCTS_LIMIT + 1 filas por
+    categoría, sin importar cuántos productos tenga. Si la lista no cambió
+    (p. ej. se editó el precio de un producto) no se escribe nada.
+
+    La fila de la categoría se bloquea antes de leer la lista: dos altas
+    simultáneas en la misma categoría se aplican una tras otra en vez de
+    insertar las dos las mismas filas. Las categorías se bloquean en orden
+    de id para que dos movimientos cruzados no se esperen mutuamente.
+
+    Args:
+        category_ids: Categorías a recalcular (todas si es None)
+
+    Returns:
+        tuple: (filas creadas, filas eliminadas)
+    """
+    limit = settings.RELATED_PRODUCTS_LIMIT
+    if category_ids is None:
+        category_ids = Category.objects.values_list('id', flat=True)
+
+    created = deleted = 0
+    for category_id in sorted(set(category_ids) - {None}):
+        with transaction.atomic():
+            locked = Category.objects.select_for_update().filter(pk=category_id).values_list('id', flat=True)
+            if not locked:
+                continue
+            # Uno más que el límite: al leerla se descarta el propio producto
+            newest_ids = Product.objects.filter(
+                category_id=category_id,
+                is_active=True
+            ).order_by('-created_at', '-id').values_list('id', flat=True)[:limit + 1]
+            desired = {product_id: rank for rank, product_id in enumerate(newest_ids)}
+
+            existing = CategoryRelatedProduct.objects.filter(
+                category_id=category_id
+            ).values_list('id', 'product_id', 'rank')
+            stale = []
+            for link_id, product_id, rank in existing:
+                if desired.get(product_id) == rank:
+                    del desired[product_id]
+                else:
+                    stale.append(link_id)
+
+            if stale:
+                deleted += CategoryRelatedProduct.objects.filter(id__in=stale).delete()[0]
+            CategoryRelatedProduct.objects.bulk_create([
+                CategoryRelatedProduct(category_id=category_id, product_id=product_id, rank=rank)
+                for product_id, rank in desired.items()
+            ])
+        created += len(desired)
+    return created, deleted
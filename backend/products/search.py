@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import BigIntegerField, Case, F, Q, Value, When
+from django.db.models.functions import Cast
+from .search_engine import get_search_index
+
+# Debe coincidir con la configuración usada por el trigger (migración 0005)
+SEARCH_CONFIG = 'spanish'
+SEARCH_RANK = 'search_rank'
+# La relevancia se anota como entero (puntuación x SEARCH_RANK_SCALE): viaja
+# en el cursor de KeysetPagination y un float4 de ts_rank no se compara igual
+# tras pasar por JSON como float64, con lo que se repetirían o saltarían filas
+SEARCH_RANK_SCALE = 10 ** 6
+# Cuánto se amplía el corte del índice BM25 cuando los filtros descartan resultados
+SEARCH_WIDEN_FACTOR = 4
+
+
+def supports_full_text(queryset):
+    """Indica si la base de datos del queryset soporta tsvector/ts_rank"""
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def uses_search_index():
+    """Indica si ?search= se resuelve con el índice BM25 en memoria"""
+    return settings.PRODUCT_SEARCH_BACKEND == 'bm25'
+
+
+def search_products(queryset, term):
+    """
+    Filtra productos por texto
+
+    Con PRODUCT_SEARCH_BACKEND='bm25' consulta el índice en memoria (si el
+    proceso aún no lo tiene cargado, la base de datos). Si no,
+    en PostgreSQL usa el tsvector indexado con GIN y, en otros motores,
+    vuelve al icontains sobre nombre y descripción. Las dos primeras vías
+    anotan la relevancia en `search_rank`, escalada a entero.
+    """
+    if uses_search_index():
+        index = get_search_index()
+        if index is not None:
+            return search_products_in_index(queryset, term, index)
+    
+    if not supports_full_text(queryset):
+        return queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+    
+    query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(
+        **{SEARCH_RANK: Cast(SearchRank(F('search_vector'), query) * SEARCH_RANK_SCALE, BigIntegerField())}
+    )
+
+
+def search_products_in_index(queryset, term, index):
+    """
+    Restringe el queryset a sus PRODUCT_SEARCH_MAX_RESULTS mejores resultados
+    BM25 y anota su puntuación
+
+    El índice no conoce los filtros del queryset (categoría, precio...): si
+    el corte global deja fuera coincidencias que sí los cumplen, se amplía
+    el corte hasta reunir suficientes o agotar las coincidencias, comprobando
+    contra la base de datos solo los resultados nuevos de cada ronda.
+    """
+    wanted = settings.PRODUCT_SEARCH_MAX_RESULTS
+    limit = wanted
+    hits, seen = [], set()
+    while True:
+        results = index.search(term, limit=limit)
+        exhausted = len(results) < limit
+        if exhausted and not seen:
+            # Todas las coincidencias caben en el corte: basta el filtro final
+            hits = results
+            break
+        batch = [(product_id, score) for product_id, score in results if product_id not in seen]
+        seen.update(product_id for product_id, _ in batch)
+        allowed = set(queryset.filter(pk__in=[product_id for product_id, _ in batch]).values_list('pk', flat=True))
+        hits.extend((product_id, score) for product_id, score in batch if product_id in allowed)
+        if len(hits) >= wanted or exhausted:
+            break
+        limit *= SEARCH_WIDEN_FACTOR
+    hits = hits[:wanted]
+    if not hits:
+        return queryset.none()
+    
+    ranking = Case(
+        *[When(pk=product_id, then=Value(round(score * SEARCH_RANK_SCALE))) for product_id, score in hits],
+        output_field=BigIntegerField()
+    )
+    return queryset.filter(pk__in=[product_id for product_id, _ in hits]).annotate(
+        **{SEARCH_RANK: ranking}
+    )
+
+
+def is_ranked(queryset):
+    """Indica si el queryset trae la relevancia de búsqueda anotada"""
+    return SEARCH_RANK in queryset.query.annotations
@@ -0,0 +1,477 @@
+import hashlib
+import heapq
+import math
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+from operator import itemgetter
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .cache import CATALOG_VERSION_KEY
+from .text import tokenize, trigrams
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin exclusión entre procesos al construir
+    fcntl = None
+
+
+class BM25Index:
+    """
+    Índice invertido en memoria con ranking BM25 y tolerancia a errores
+
+    Cada término tiene un segmento principal de postings (ordinales de
+    documento, frecuencias e impacto BM25 precalculado en `array`, ordenados
+    por impacto) y un segmento delta con las altas incrementales. Para los
+    términos muy frecuentes solo se evalúan los `max_postings` postings de
+    mayor impacto del segmento principal, lo que acota el tiempo de consulta
+    aunque el catálogo tenga cientos de miles de productos (el ranking de
+    esos términos pasa a ser aproximado). `compact()` funde el delta,
+    recalcula los impactos y descarta los documentos eliminados; las altas
+    y bajas incrementales lo llaman solas cuando el delta o los postings
+    muertos superan `compact_ratio` de los documentos (ver needs_compaction).
+
+    Reindexar un documento con el mismo texto no hace nada: se guarda un
+    hash del texto por documento.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, max_postings=400, compact_ratio=0.02, compact_min=64):
+        self.k1 = k1
+        self.b = b
+        self.max_postings = max_postings
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self._lock = threading.RLock()
+        self._term_ids = {}
+        self._terms = []
+        self._postings = []
+        self._freqs = []
+        self._impacts = []
+        self._delta = {}
+        self._expansions = {}
+        self._df = array('I')
+        self._trigrams = defaultdict(lambda: array('I'))
+        self._doc_ids = array('q')
+        self._doc_lengths = array('I')
+        self._doc_terms = {}
+        self._ordinals = {}
+        self._hashes = {}
+        self._total_length = 0
+        # Documentos eliminados aún presentes en los postings y documentos en el delta
+        self._dead = 0
+        self._delta_docs = 0
+        # Marca de sincronización con la BD (updated_at) y productos ya
+        # aplicados dentro de la ventana que se vuelve a leer
+        self.synced_at = None
+        self.recent = {}
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    @property
+    def term_count(self):
+        return len(self._terms)
+
+    def _term_id(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = len(self._terms)
+            self._term_ids[term] = term_id
+            self._terms.append(term)
+            self._postings.append(array('I'))
+            self._freqs.append(array('H'))
+            self._impacts.append(array('f'))
+            self._df.append(0)
+            self._expansions.clear()
+            for gram in trigrams(term):
+                self._trigrams[gram].append(term_id)
+        return term_id
+
+    def add(self, doc_id, *texts):
+        """
+        Indexa (o reindexa) un documento a partir de uno o más textos
+
+        Returns:
+            bool: False si el documento ya estaba indexado con el mismo texto
+        """
+        digest = hashlib.md5('\x00'.join(texts).encode()).digest()[:8]
+        with self._lock:
+            if doc_id in self._ordinals and self._hashes.get(doc_id) == digest:
+                return False
+
+        counts = Counter()
+        for text in texts:
+            counts.update(tokenize(text))
+
+        with self._lock:
+            self._remove(doc_id)
+            if not counts:
+                return True
+            ordinal = len(self._doc_ids)
+            length = sum(counts.values())
+            self._doc_ids.append(doc_id)
+            self._doc_lengths.append(length)
+            self._ordinals[doc_id] = ordinal
+            self._total_length += length
+
+            term_ids = []
+            for term, frequency in counts.items():
+                term_id = self._term_id(term)
+                term_ids.append(term_id)
+                self._df[term_id] += 1
+                ordinals, freqs = self._delta.setdefault(term_id, (array('I'), array('H')))
+                ordinals.append(ordinal)
+                freqs.append(min(frequency, 0xFFFF))
+            self._doc_terms[ordinal] = array('I', term_ids)
+            self._hashes[doc_id] = digest
+            self._delta_docs += 1
+            return True
+
+    def remove(self, doc_id):
+        """Elimina un documento del índice (marca lógica hasta compact())"""
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        ordinal = self._ordinals.pop(doc_id, None)
+        self._hashes.pop(doc_id, None)
+        if ordinal is None:
+            return
+        self._total_length -= self._doc_lengths[ordinal]
+        self._doc_lengths[ordinal] = 0
+        for term_id in self._doc_terms.pop(ordinal, ()):
+            self._df[term_id] -= 1
+        self._dead += 1
+
+    def needs_compaction(self):
+        """True si el delta o los postings muertos ya pesan en las consultas"""
+        threshold = max(self.compact_min, self.compact_ratio * len(self._ordinals))
+        return self._dead > threshold or self._delta_docs > threshold
+
+    def compact(self):
+        """
+        Funde el segmento delta en el principal, descarta documentos
+        eliminados y reordena los postings por impacto
+        """
+        with self._lock:
+            live = sorted(self._ordinals.items(), key=itemgetter(1))
+            remap = {old: new for new, (_, old) in enumerate(live)}
+            avg_length = self._total_length / len(live) if live else 1.0
+            k1, b = self.k1, self.b
+            old_lengths = self._doc_lengths
+
+            postings, freqs, impacts = [], [], []
+            for term_id in range(len(self._terms)):
+                entries = []
+                segments = [(self._postings[term_id], self._freqs[term_id])]
+                if term_id in self._delta:
+                    segments.append(self._delta[term_id])
+                for ordinals, frequencies in segments:
+                    for ordinal, frequency in zip(ordinals, frequencies):
+                        new_ordinal = remap.get(ordinal)
+                        if new_ordinal is None:
+                            continue
+                        norm = k1 * (1 - b + b * old_lengths[ordinal] / avg_length)
+                        impact = frequency * (k1 + 1) / (frequency + norm)
+                        entries.append((impact, new_ordinal, frequency))
+                entries.sort(reverse=True)
+                impacts.append(array('f', (entry[0] for entry in entries)))
+                postings.append(array('I', (entry[1] for entry in entries)))
+                freqs.append(array('H', (entry[2] for entry in entries)))
+
+            self._postings, self._freqs, self._impacts = postings, freqs, impacts
+            self._delta = {}
+            self._doc_ids = array('q', (doc_id for doc_id, _ in live))
+            self._doc_lengths = array('I', (old_lengths[ordinal] for _, ordinal in live))
+            self._doc_terms = {
+                remap[ordinal]: terms for ordinal, terms in self._doc_terms.items()
+                if ordinal in remap
+            }
+            self._ordinals = {doc_id: new for new, (doc_id, _) in enumerate(live)}
+            self._dead = 0
+            self._delta_docs = 0
+
+    def _expand(self, term, max_candidates=2, min_similarity=0.5):
+        """Términos del vocabulario parecidos a `term` según sus trigramas (coeficiente de Dice)"""
+        expansion = self._expansions.get(term)
+        if expansion is None:
+            expansion = self._expansions[term] = self._similar_terms(
+                term, max_candidates, min_similarity
+            )
+        return [(similarity, term_id) for similarity, term_id in expansion if self._df[term_id]]
+
+    def _similar_terms(self, term, max_candidates, min_similarity):
+        grams = trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+        candidates = []
+        for term_id, common in shared.items():
+            # Un término de n letras tiene n trigramas con bordes marcados
+            similarity = 2 * common / (len(grams) + len(self._terms[term_id]))
+            if similarity >= min_similarity:
+                candidates.append((similarity, term_id))
+        return heapq.nlargest(max_candidates, candidates)
+
+    def search(self, query, limit=50, fuzzy=True):
+        """
+        Busca productos por relevancia BM25
+
+        Returns:
+            list: Tuplas (id de producto, puntuación) de mayor a menor
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            live_docs = len(self._ordinals)
+            if not live_docs:
+                return []
+
+            weighted_terms = []
+            for term in terms:
+                term_id = self._term_ids.get(term)
+                if term_id is not None and self._df[term_id]:
+                    weighted_terms.append((1.0, term_id))
+                elif fuzzy and len(term) > 3:
+                    weighted_terms.extend(self._expand(term))
+
+            avg_length = self._total_length / live_docs
+            k1, b = self.k1, self.b
+            lengths = self._doc_lengths
+            scores = {}
+            for weight, term_id in weighted_terms:
+                df = self._df[term_id]
+                idf = weight * math.log(1 + (live_docs - df + 0.5) / (df + 0.5))
+                # Segmento principal: impactos precalculados, solo los de mayor peso
+                top_postings = islice(self._postings[term_id], self.max_postings)
+                for ordinal, impact in zip(top_postings, self._impacts[term_id]):
+                    if lengths[ordinal]:
+                        scores[ordinal] = scores.get(ordinal, 0.0) + idf * impact
+                # Segmento delta: altas incrementales, siempre completo
+                if term_id in self._delta:
+                    for ordinal, frequency in zip(*self._delta[term_id]):
+                        length = lengths[ordinal]
+                        if not length:
+                            continue
+                        scores[ordinal] = scores.get(ordinal, 0.0) + idf * frequency * (k1 + 1) / (
+                            frequency + k1 * (1 - b + b * length / avg_length)
+                        )
+
+            top = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+            return [(self._doc_ids[ordinal], score) for ordinal, score in top]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_trigrams'] = dict(self._trigrams)
+        return state
+
+    def __setstate__(self, state):
+        trigram_index = defaultdict(lambda: array('I'))
+        trigram_index.update(state.pop('_trigrams'))
+        state.setdefault('synced_at', None)
+        state.setdefault('recent', {})
+        # Instantáneas anteriores: sin hashes, cada producto se reindexa una vez
+        state.setdefault('_hashes', {})
+        state.setdefault('_delta_docs', 0)
+        state.setdefault('compact_ratio', 0.02)
+        state.setdefault('compact_min', 64)
+        self.__dict__.update(state)
+        self._trigrams = trigram_index
+        self._lock = threading.RLock()
+
+
+# Índice del proceso (cada worker de gunicorn mantiene el suyo y lo pone al
+# día con sync_search_index)
+_index = None
+_index_lock = threading.Lock()
+# Versión del catálogo sincronizada, momento de la última comprobación y
+# mtime de la instantánea cargada
+_synced = {'version': None, 'checked': 0.0, 'snapshot_mtime': None}
+
+
+def sync_window():
+    return timedelta(seconds=settings.PRODUCT_SEARCH_SYNC_LAG)
+
+
+def build_search_index():
+    """Construye el índice desde la base de datos con los productos activos"""
+    from .models import Product
+
+    started = timezone.now()
+    index = BM25Index()
+    rows = Product.objects.filter(is_active=True).values_list(
+        'id', 'name', 'description', 'updated_at'
+    ).iterator(chunk_size=2000)
+    for product_id, name, description, updated_at in rows:
+        index_product(index, product_id, name, description)
+        if updated_at >= started - sync_window():
+            index.recent[product_id] = updated_at
+    index.compact()
+    index.synced_at = started
+    return index
+
+
+def index_product(index, product_id, name, description):
+    # El nombre se indexa dos veces para que pese más que la descripción
+    index.add(product_id, name, name, description)
+
+
+def sync_search_index(index):
+    """
+    Aplica al índice los productos modificados desde su última sincronización
+    (updated_at), incluidas las escrituras de otros workers
+
+    Se vuelve a leer una ventana de PRODUCT_SEARCH_SYNC_LAG segundos: una
+    transacción puede confirmarse después de fijar su updated_at. Las bajas
+    no aparecen aquí, pero search_products_in_index cruza los resultados
+    con la base de datos y nunca devuelve un producto eliminado.
+
+    Los cambios de stock o precio mueven updated_at sin tocar el texto: esos
+    productos no se reindexan (BM25Index.add compara el hash). Si el delta o
+    los postings muertos crecen demasiado, el índice se compacta aquí mismo.
+    """
+    from .models import Product
+
+    if index.synced_at is None:
+        return
+    started = timezone.now()
+    rows = Product.objects.filter(updated_at__gte=index.synced_at - sync_window()).values_list(
+        'id', 'name', 'description', 'is_active', 'updated_at'
+    ).iterator(chunk_size=2000)
+    for product_id, name, description, is_active, updated_at in rows:
+        if index.recent.get(product_id) == updated_at:
+            continue
+        index.recent[product_id] = updated_at
+        if is_active:
+            index_product(index, product_id, name, description)
+        else:
+            index.remove(product_id)
+    if index.needs_compaction():
+        index.compact()
+    index.synced_at = started
+    cutoff = started - sync_window()
+    index.recent = {product_id: stamp for product_id, stamp in index.recent.items() if stamp >= cutoff}
+
+
+def save_search_index(index, path=None):
+    """Guarda una instantánea del índice para que los workers arranquen sin reconstruirlo"""
+    path = path or settings.PRODUCT_SEARCH_INDEX_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'wb') as snapshot:
+        pickle.dump(index, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+
+def snapshot_mtime(path=None):
+    path = path or settings.PRODUCT_SEARCH_INDEX_PATH
+    try:
+        return os.stat(path).st_mtime
+    except (FileNotFoundError, TypeError):
+        return None
+
+
+def load_search_index(path=None):
+    """Carga la instantánea del índice si existe"""
+    path = path or settings.PRODUCT_SEARCH_INDEX_PATH
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as snapshot:
+        return pickle.load(snapshot)
+
+
+@contextmanager
+def snapshot_lock(path=None):
+    # Un solo proceso construye la instantánea; los demás esperan y la cargan
+    path = path or settings.PRODUCT_SEARCH_INDEX_PATH
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def warm_search_index():
+    """
+    Carga el índice al arrancar el worker (wsgi.py), para que ninguna
+    petición lo construya. Sin instantánea la construye un solo worker y la
+    guarda para los demás
+    """
+    global _index
+    if _index is not None:
+        return _index
+    with snapshot_lock():
+        index = load_search_index()
+        if index is None:
+            index = build_search_index()
+            save_search_index(index)
+    sync_search_index(index)
+    with _index_lock:
+        _index = index
+        _synced.update(
+            version=cache.get(CATALOG_VERSION_KEY),
+            checked=time.monotonic(),
+            snapshot_mtime=snapshot_mtime()
+        )
+    return _index
+
+
+def get_search_index():
+    """
+    Índice del proceso, al día con las escrituras de otros workers
+
+    Nunca se construye aquí: lo carga warm_search_index() al arrancar o se
+    lee la instantánea de rebuild_search_index. Sin ninguno de los dos
+    devuelve None y ?search= usa la base de datos.
+
+    Si cambió la versión del catálogo (products.cache, compartida entre
+    workers con una caché común) o pasaron PRODUCT_SEARCH_SYNC_INTERVAL
+    segundos, aplica los cambios de la BD; si hay una instantánea más
+    nueva (rebuild_search_index), la recarga.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load_search_index()
+                _synced.update(version=None, checked=0.0, snapshot_mtime=snapshot_mtime())
+    if _index is None:
+        return None
+
+    version = cache.get(CATALOG_VERSION_KEY)
+    expired = time.monotonic() - _synced['checked'] >= settings.PRODUCT_SEARCH_SYNC_INTERVAL
+    if (version != _synced['version'] or expired) and _index_lock.acquire(blocking=False):
+        # Si otro hilo ya está sincronizando, se usa el índice tal como está
+        try:
+            mtime = snapshot_mtime()
+            if mtime is not None and mtime != _synced['snapshot_mtime']:
+                _index = load_search_index() or _index
+                _synced['snapshot_mtime'] = mtime
+            sync_search_index(_index)
+            _synced.update(version=version, checked=time.monotonic())
+        finally:
+            _index_lock.release()
+    return _index
+
+
+def peek_search_index():
+    """Índice del proceso si ya está cargado, sin construirlo"""
+    return _index
+
+
+def reset_search_index(index=None):
+    global _index
+    _index = index
+    _synced.update(version=None, checked=0.0, snapshot_mtime=snapshot_mtime())
@@ -1,64 +1,201 @@
+from collections import defaultdict
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models, transaction
+from django.db.models import Case, Max, Value, When
 from rest_framework import serializers
-from .models import Category, Product, ProductImage
+from .models import VALIDATE_TRUSTED, Category, Product, ProductImage, RelatedProduct
+from .related import category_cards, category_related, related_cards
+from .cache import invalidate_catalog
+from core.imaging import VARIANT_FORMATS, build_srcset
+from core.serializers import SparseFieldsetMixin, ValuesSerializer
 from core.services import storage_service
 from core.validators import validate_positive_price, validate_non_negative_stock, validate_image_file
 
 
-class CategorySerializer(serializers.ModelSerializer):
-    products_count = serializers.SerializerMethodField()
+class TrustedSaveMixin:
+    """
+    Guarda sin repetir full_clean(): el serializer ya aplicó los validadores
+    del modelo y los de unicidad. Las actualizaciones escriben solo los
+    campos recibidos (update_fields)
+    """
+    
+    def create(self, validated_data):
+        instance = self.Meta.model(**validated_data)
+        instance.save(validation=VALIDATE_TRUSTED)
+        return instance
+    
+    def update(self, instance, validated_data):
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'], validation=VALIDATE_TRUSTED)
+        return instance
+
+
+class CategorySerializer(TrustedSaveMixin, serializers.ModelSerializer):
+    products_count = serializers.IntegerField(source='active_products_count', read_only=True)
     
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description', 'image_url', 'is_active', 'products_count', 'created_at']
         read_only_fields = ['id', 'slug', 'created_at']
-    
-    def get_products_count(self, obj):
-        return obj.products.filter(is_active=True).count()
 
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+    
     class Meta:
         model = ProductImage
-        fields = ['id', 'image_url', 'alt_text', 'is_main', 'order', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'image_url', 'alt_text', 'is_main', 'order', 'variants', 'srcset', 'created_at']
+        read_only_fields = ['id', 'variants', 'created_at']
+    
+    def get_srcset(self, obj):
+        return build_srcset(obj.image_url, obj.variants)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     main_image = serializers.SerializerMethodField()
+    main_image_srcset = serializers.SerializerMethodField()
+    
+    # La imagen principal está desnormalizada en el producto: no necesita las imágenes
+    relation_fields = {
+        'category': ['category_name'],
+        'images': ['images'],
+    }
     
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'slug', 'description', 'price', 'stock', 
             'category', 'category_name', 'main_image_url', 'main_image',
-            'is_active', 'is_featured', 'is_in_stock', 'images',
+            'main_image_srcset', 'is_active', 'is_featured', 'is_in_stock', 'images',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'slug', 'created_at', 'updated_at', 'is_in_stock']
     
     def get_main_image(self, obj):
         return obj.get_main_image_url()
+    
+    def get_main_image_srcset(self, obj):
+        return obj.get_main_image_srcset()
 
 
 class ProductDetailSerializer(ProductSerializer):
     """Serializer más completo para el detalle del producto"""
     category = CategorySerializer(read_only=True)
     related_products = serializers.SerializerMethodField()
+    similar_products = serializers.SerializerMethodField()
+    
+    relation_fields = {
+        'category': ['category', 'category_name'],
+        'images': ['images'],
+        'category_links': ['related_products'],
+        'similar_links': ['similar_products'],
+    }
     
     class Meta(ProductSerializer.Meta):
-        fields = ProductSerializer.Meta.fields + ['related_products']
+        fields = ProductSerializer.Meta.fields + ['related_products', 'similar_products']
     
     def get_related_products(self, obj):
-        related = Product.objects.filter(
-            category=obj.category,
-            is_active=True
-        ).exclude(id=obj.id)[:4]
-        return ProductSerializer(related, many=True, context=self.context).data
+        # Lista de la categoría; precargada por ProductViewSet con with_category_cards()
+        if obj.category_id is None:
+            return []
+        links = getattr(obj.category, 'related_cards', None)
+        if links is None:
+            links = category_cards().filter(category_id=obj.category_id)
+        return self.serialize_products(
+            category_related(obj.id, [link.product for link in links]),
+            'related_products'
+        )
+    
+    def get_similar_products(self, obj):
+        # Tabla precalculada; precargada por ProductViewSet con with_related_cards()
+        links = getattr(obj, 'related_cards', None)
+        if links is None:
+            links = related_cards(RelatedProduct.KIND_SIMILAR).filter(product=obj)
+        related = [link.related for link in links if link.kind == RelatedProduct.KIND_SIMILAR]
+        return self.serialize_products(related, 'similar_products')
+    
+    def serialize_products(self, products, field_name):
+        return ProductSerializer(
+            products,
+            many=True,
+            context=self.context,
+            field_selection=self.nested_selection(field_name)
+        ).data
+
+
+class CategoryValuesSerializer(ValuesSerializer):
+    """CategorySerializer para listados desde .values()"""
+    serializer_class = CategorySerializer
+
 
+class ProductImageValuesSerializer(ValuesSerializer):
+    serializer_class = ProductImageSerializer
+    computed_fields = ('srcset',)
+    extra_columns = ('id', 'product_id', 'image_url', 'variants')
+    
+    def get_srcset(self, row):
+        return build_srcset(row['image_url'], row['variants'])
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    """
+    ProductSerializer para listados desde .values(): las imágenes de todas
+    las filas se cargan en una sola consulta, como con with_card_data()
+    """
+    serializer_class = ProductSerializer
+    computed_fields = ('is_in_stock', 'main_image', 'main_image_srcset', 'images')
+    extra_columns = (
+        'id', 'stock', 'main_image_url', 'primary_image_url',
+        'main_image_variants', 'primary_image_variants'
+    )
+    
+    def prepare(self, rows):
+        self.images = defaultdict(list)
+        if 'images' not in self.fields:
+            return
+        selection = self.fields['images'].child.get_field_selection()
+        self.image_serializer = ProductImageValuesSerializer(self.context, field_selection=selection)
+        images = ProductImage.objects.filter(
+            product_id__in=[row['id'] for row in rows]
+        ).order_by('order', 'created_at').values(*self.image_serializer.columns)
+        for image in images:
+            self.images[image['product_id']].append(image)
+    
+    def get_is_in_stock(self, row):
+        return row['stock'] > 0
+    
+    def get_main_image(self, row):
+        # Mismo criterio que Product.get_main_image_url()
+        return row['main_image_url'] or row['primary_image_url'] or None
+    
+    def get_main_image_srcset(self, row):
+        # Mismo criterio que Product.get_main_image_srcset()
+        if row['main_image_url']:
+            return build_srcset(row['main_image_url'], row['main_image_variants'])
+        return build_srcset(row['primary_image_url'], row['primary_image_variants'])
+    
+    def get_images(self, row):
+        return [self.image_serializer.to_representation(image) for image in self.images[row['id']]]
+
+
+class ProductResourceSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Producto con sus relaciones como ids, para documentos compuestos (?include=)"""
+    
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'slug', 'description', 'price', 'stock',
+            'category', 'main_image_url', 'is_active', 'is_featured', 'is_in_stock',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
 
-class ProductCreateSerializer(serializers.ModelSerializer):
+
+class ProductCreateSerializer(TrustedSaveMixin, serializers.ModelSerializer):
     """Serializer para crear productos con validaciones"""
     
     class Meta:
@@ -77,6 +214,28 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         return value
 
 
+class ProductBulkItemSerializer(serializers.ModelSerializer):
+    """
+    Producto de /api/products/bulk/: la categoría llega como id y el slug sin
+    validador de unicidad; products.bulk resuelve ambos para todo el lote
+    """
+    slug = serializers.SlugField(max_length=200, required=False)
+    category = serializers.IntegerField()
+    
+    class Meta:
+        model = Product
+        fields = [
+            'slug', 'name', 'description', 'price', 'stock', 'category',
+            'main_image_url', 'is_active', 'is_featured'
+        ]
+    
+    def validate(self, attrs):
+        # En actualizaciones (partial) el slug identifica el producto
+        if self.partial and not attrs.get('slug'):
+            raise serializers.ValidationError({'slug': 'Este campo es requerido.'})
+        return attrs
+
+
 class ImageUploadSerializer(serializers.Serializer):
     """Serializer para subir imágenes"""
     image = serializers.ImageField()
@@ -91,21 +250,146 @@ class ImageUploadSerializer(serializers.Serializer):
         folder = validated_data.get('folder', 'products')
         
         try:
-            image_url = storage_service.upload_image(image, folder)
-            return {'image_url': image_url}
+            # El original y sus variantes redimensionadas (IMAGE_VARIANT_WIDTHS)
+            result = storage_service.upload_image_with_variants(image, folder)
+            result['srcset'] = build_srcset(result['image_url'], result['variants'])
+            return result
         except Exception as e:
             raise serializers.ValidationError(f"Error al subir imagen: {str(e)}")
 
 
+class ImageBatchUploadSerializer(serializers.Serializer):
+    """
+    Varias imágenes en una petición multipart: cada archivo se valida por
+    separado y los válidos se suben en paralelo. Con `product` se crean sus
+    ProductImage con un único bulk_create
+    """
+    images = serializers.ListField(child=serializers.FileField(), allow_empty=False)
+    folder = serializers.CharField(max_length=50, default='products')
+    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), required=False)
+    
+    def validate_images(self, value):
+        if len(value) > settings.IMAGE_UPLOAD_BATCH_MAX_FILES:
+            raise serializers.ValidationError(f'Máximo {settings.IMAGE_UPLOAD_BATCH_MAX_FILES} imágenes por petición')
+        return value
+    
+    def save(self):
+        """
+        Returns:
+            list: Un resultado por archivo, en el orden recibido: la subida
+            (image_url, variants, srcset e id de la ProductImage creada) o sus errores
+        """
+        files = self.validated_data['images']
+        results = [{'index': position, 'name': file.name} for position, file in enumerate(files)]
+        valid = []
+        for result, file in zip(results, files):
+            try:
+                validate_image_file(file)
+            except DjangoValidationError as error:
+                result['errors'] = error.messages
+                continue
+            valid.append((result, file))
+        
+        uploads = storage_service.upload_images([file for _, file in valid], self.validated_data['folder'])
+        uploaded = []
+        for (result, _), (upload, error) in zip(valid, uploads):
+            if error:
+                result['errors'] = [f'Error al subir imagen: {error}']
+                continue
+            result.update(upload, srcset=build_srcset(upload['image_url'], upload['variants']))
+            uploaded.append(result)
+        
+        product = self.validated_data.get('product')
+        if product and uploaded:
+            self.create_images(product, uploaded)
+        return results
+    
+    def create_images(self, product, uploaded):
+        with transaction.atomic():
+            last = product.images.aggregate(last=Max('order'))['last']
+            first = 0 if last is None else last + 1
+            images = ProductImage.objects.bulk_create([
+                ProductImage(
+                    product=product,
+                    image_url=result['image_url'],
+                    variants=result['variants'],
+                    alt_text=product.name,
+                    order=first + position
+                )
+                for position, result in enumerate(uploaded)
+            ])
+            # bulk_create no emite señales: las imágenes forman parte de la respuesta del producto
+            invalidate_catalog([product.pk])
+        for result, image in zip(uploaded, images):
+            result['id'] = image.id
+
+
+class ImageVariantSerializer(serializers.Serializer):
+    """Variante devuelta por /api/products/upload_image/"""
+    url = serializers.URLField()
+    width = serializers.IntegerField(min_value=1)
+    height = serializers.IntegerField(min_value=1)
+    format = serializers.ChoiceField(choices=list(VARIANT_FORMATS))
+
+
 class ProductImageCreateSerializer(serializers.ModelSerializer):
     """Serializer para crear imágenes de productos"""
+    # ListField y no many=True: ModelSerializer no admite escrituras anidadas
+    variants = serializers.ListField(child=ImageVariantSerializer(), required=False)
     
     class Meta:
         model = ProductImage
-        fields = ['product', 'image_url', 'alt_text', 'is_main', 'order']
+        fields = ['product', 'image_url', 'alt_text', 'is_main', 'order', 'variants']
     
     def validate(self, attrs):
         # Si no se especifica alt_text, usar el nombre del producto
         if not attrs.get('alt_text') and attrs.get('product'):
             attrs['alt_text'] = attrs['product'].name
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+class ImageOrderSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    order = serializers.IntegerField(min_value=0)
+
+
+class ImageReorderSerializer(serializers.Serializer):
+    """
+    Nuevo orden de las imágenes de un producto: se valida el conjunto
+    completo con una consulta y se aplica con un único UPDATE
+    """
+    product = serializers.IntegerField(required=False)
+    image_orders = ImageOrderSerializer(many=True, allow_empty=False)
+    
+    def validate_image_orders(self, value):
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError('Hay imágenes repetidas')
+        return value
+    
+    def validate(self, attrs):
+        orders = {item['id']: item['order'] for item in attrs['image_orders']}
+        products = dict(ProductImage.objects.filter(id__in=orders).values_list('id', 'product_id'))
+        missing = sorted(set(orders) - set(products))
+        if missing:
+            raise serializers.ValidationError({'image_orders': f'No existen las imágenes {missing}'})
+        product_id = attrs.get('product', next(iter(products.values())))
+        foreign = sorted(image_id for image_id, owner in products.items() if owner != product_id)
+        if foreign:
+            raise serializers.ValidationError({
+                'image_orders': f'Las imágenes {foreign} no pertenecen al producto {product_id}'
+            })
+        attrs['product'] = product_id
+        attrs['orders'] = orders
+        return attrs
+    
+    def save(self):
+        orders = self.validated_data['orders']
+        with transaction.atomic():
+            ProductImage.objects.filter(id__in=orders).update(order=Case(
+                *[When(id=image_id, then=Value(order)) for image_id, order in orders.items()],
+                output_field=models.PositiveIntegerField()
+            ))
+            # update() no emite señales: las imágenes forman parte de la respuesta del producto
+            invalidate_catalog([self.validated_data['product']])
+        return self.validated_data['product']
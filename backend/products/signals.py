@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .models import Category, Product, ProductImage
+from .cache import invalidate_catalog
+from .counters import adjust_active_products_count, rebuild_active_products_counts
+from .related import refresh_category_related
+from .images import sync_primary_image
+from .search import uses_search_index
+from .search_engine import index_product, peek_search_index
+
+SEARCH_INDEX_FIELDS = {'name', 'description', 'is_active'}
+
+
+@receiver(pre_save, sender=Product)
+def load_counter_state(sender, instance, raw=False, **kwargs):
+    """
+    Estado previo (categoría, activo) de un producto que no se cargó desde la
+    BD (p. ej. Product(pk=...).save()): sin él, si cambió de categoría la
+    anterior quedaría con el contador desactualizado
+    """
+    if raw or instance.pk is None or hasattr(instance, '_counter_state'):
+        return
+    instance._counter_state = Product.objects.filter(pk=instance.pk).values_list('category_id', 'is_active').first()
+
+
+@receiver(post_save, sender=Product)
+def update_category_counter_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Mantener Category.active_products_count y los relacionados por categoría
+    al crear, mover o (des)activar un producto
+    """
+    if raw:
+        return
+    
+    current = (instance.category_id, instance.is_active)
+    if created:
+        previous = (None, False)
+    else:
+        previous = getattr(instance, '_counter_state', None)
+    instance._counter_state = current
+    
+    if previous is None:
+        # La fila no existía antes del save (pk explícito): no hay categoría anterior
+        rebuild_active_products_counts([instance.category_id])
+        refresh_category_related([instance.category_id])
+        return
+    if previous == current:
+        return
+    
+    previous_category, was_active = previous
+    if was_active:
+        adjust_active_products_count(previous_category, -1)
+    if instance.is_active:
+        adjust_active_products_count(instance.category_id, 1)
+    refresh_category_related([previous_category, instance.category_id])
+
+
+@receiver(post_delete, sender=Product)
+def update_category_counter_on_delete(sender, instance, **kwargs):
+    """Descontar el producto eliminado del contador y de los relacionados de su categoría"""
+    if instance.is_active:
+        adjust_active_products_count(instance.category_id, -1)
+        refresh_category_related([instance.category_id])
+
+
+@receiver(post_save, sender=Product)
+def update_search_index_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Reindexar el producto en el índice BM25 del proceso cuando cambia su texto"""
+    index = peek_search_index()
+    if raw or index is None or not uses_search_index():
+        return
+    if update_fields is not None and not SEARCH_INDEX_FIELDS & set(update_fields):
+        return
+    
+    product_id, name, description = instance.pk, instance.name, instance.description
+    if instance.is_active:
+        transaction.on_commit(lambda: index_product(index, product_id, name, description))
+    else:
+        transaction.on_commit(lambda: index.remove(product_id))
+
+
+@receiver(post_delete, sender=Product)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    """Quitar el producto eliminado del índice BM25 del proceso"""
+    index = peek_search_index()
+    if index is None or not uses_search_index():
+        return
+    product_id = instance.pk
+    transaction.on_commit(lambda: index.remove(product_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_catalog_cache(sender, raw=False, **kwargs):
+    """Nueva versión del catálogo: las respuestas cacheadas dejan de servirse"""
+    if raw:
+        return
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def sync_product_on_image_change(sender, instance, raw=False, **kwargs):
+    """Actualizar el updated_at del producto y su imagen principal desnormalizada"""
+    if raw:
+        return
+    # post_delete no envía `created`
+    sync_primary_image(instance, removed='created' not in kwargs)
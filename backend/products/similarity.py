@@ -0,0 +1,340 @@
+import hashlib
+import os
+from collections import Counter
+from datetime import timedelta
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Product, RelatedProduct
+from .text import tokenize
+
+TOP_K = 8
+# Términos presentes en más de esta fracción de productos no discriminan
+MAX_DF_RATIO = 0.5
+# Celdas de similitud por bloque: acota la memoria con cualquier catálogo. Cada
+# celda cuesta el float32 de la similitud más el índice int64 que devuelve
+# argpartition (~12 B, ~192 MB de pico por bloque); el producto disperso que
+# se densifica pesa a lo sumo lo mismo y se libera antes de particionar
+BLOCK_CELLS = 16_000_000
+
+
+def document_terms(name, description):
+    """Términos de un producto; el nombre pesa el doble, como en el índice de búsqueda"""
+    name_terms = tokenize(name)
+    return name_terms + name_terms + tokenize(description)
+
+
+def text_hash(name, description):
+    digest = hashlib.md5(f'{name}\x00{description}'.encode()).digest()
+    return int.from_bytes(digest[:8], 'little', signed=True)
+
+
+def fit_vocabulary(documents):
+    """
+    Vocabulario e IDF suavizado, log((1 + N) / (1 + df)) + 1, descartando
+    los términos demasiado frecuentes
+
+    Returns:
+        tuple: (dict término -> columna, array float32 de IDF)
+    """
+    document_frequency = Counter()
+    for terms in documents:
+        document_frequency.update(set(terms))
+    total = len(documents)
+    max_df = max(1, int(MAX_DF_RATIO * total))
+    vocabulary, idf = {}, []
+    for term, df in document_frequency.items():
+        if df <= max_df or total < 3:
+            vocabulary[term] = len(idf)
+            idf.append(np.log((1 + total) / (1 + df)) + 1)
+    return vocabulary, np.asarray(idf, dtype=np.float32)
+
+
+def vectorize(documents, vocabulary, idf):
+    """
+    Matriz TF-IDF dispersa float32 (una fila por documento) con TF sublineal
+    y filas normalizadas (L2), de modo que el producto escalar es el coseno
+    """
+    indptr, indices, counts = [0], [], []
+    for terms in documents:
+        frequencies = Counter(term for term in terms if term in vocabulary)
+        indices.extend(vocabulary[term] for term in frequencies)
+        counts.extend(frequencies.values())
+        indptr.append(len(indices))
+
+    indices = np.asarray(indices, dtype=np.int32)
+    data = (1 + np.log(np.asarray(counts, dtype=np.float32))) * idf[indices]
+    matrix = sparse.csr_matrix(
+        (data, indices, np.asarray(indptr, dtype=np.int64)),
+        shape=(len(documents), len(idf)),
+        dtype=np.float32
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags((1 / norms).astype(np.float32)) @ matrix
+
+
+def similarity_blocks(queries, matrix):
+    """
+    Similitudes densas float32 de `queries` contra todas las filas de
+    `matrix`, por bloques de filas: cada bloque ocupa a lo sumo BLOCK_CELLS
+    celdas, sin importar el tamaño del catálogo
+    """
+    transposed = matrix.T.tocsr()
+    step = max(1, BLOCK_CELLS // max(matrix.shape[0], 1))
+    for start in range(0, queries.shape[0], step):
+        block = queries[start:start + step]
+        yield start, (block @ transposed).toarray()
+
+
+def top_k_neighbours(matrix, positions, k=TOP_K):
+    """
+    Vecinos más parecidos (coseno) de las filas `positions` de `matrix`
+
+    Returns:
+        tuple: arrays (len(positions) × k) de posiciones y similitudes; las
+        similitudes <= 0 corresponden a huecos sin vecino
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    neighbours = np.zeros((len(positions), k), dtype=np.int32)
+    scores = np.zeros((len(positions), k), dtype=np.float32)
+    candidates = min(k, matrix.shape[0] - 1)
+    if candidates <= 0 or not len(positions):
+        return neighbours, scores
+
+    for start, similarity in similarity_blocks(matrix[positions], matrix):
+        rows = np.arange(similarity.shape[0])
+        similarity[rows, positions[start:start + len(rows)]] = -1  # sin sí mismo
+        # kth desde el final: los mayores quedan a la derecha sin copiar el bloque negado
+        kth = similarity.shape[1] - candidates
+        top = np.argpartition(similarity, kth, axis=1)[:, kth:]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        neighbours[start:start + len(rows), :candidates] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + len(rows), :candidates] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbours, scores
+
+
+class SimilarityModel:
+    """
+    Estado entre ejecuciones: vocabulario e IDF, matriz TF-IDF, hash del texto
+    de cada producto, vecinos actuales y la marca de agua de updated_at
+    """
+
+    def __init__(self, product_ids, hashes, matrix, vocabulary, idf, neighbours, scores, watermark=None):
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.hashes = np.asarray(hashes, dtype=np.int64)
+        self.matrix = matrix.tocsr()
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.neighbours = neighbours
+        self.scores = scores
+        self.watermark = watermark
+        self.positions = {product_id: position for position, product_id in enumerate(self.product_ids.tolist())}
+
+    @classmethod
+    def fit(cls, rows, k=TOP_K):
+        """Modelo completo a partir de filas (id, nombre, descripción)"""
+        product_ids = [row[0] for row in rows]
+        documents = [document_terms(row[1], row[2]) for row in rows]
+        vocabulary, idf = fit_vocabulary(documents)
+        matrix = vectorize(documents, vocabulary, idf)
+        neighbours, scores = top_k_neighbours(matrix, np.arange(len(rows)), k)
+        hashes = [text_hash(row[1], row[2]) for row in rows]
+        return cls(product_ids, hashes, matrix, vocabulary, idf, neighbours, scores)
+
+    def update(self, changed, removed_ids, k=TOP_K):
+        """
+        Aplica productos con texto nuevo (o altas) y bajas, y recalcula solo
+        las filas cuyos vecinos pueden haber cambiado. El vocabulario y el IDF
+        no cambian: los términos nuevos cuentan a partir de la siguiente
+        reconstrucción completa.
+
+        Args:
+            changed: Filas (id, nombre, descripción) activas con texto nuevo
+            removed_ids: Productos desactivados o eliminados
+
+        Returns:
+            array: Posiciones recalculadas
+        """
+        new_ids = [row[0] for row in changed if row[0] not in self.positions]
+        if new_ids:
+            start = len(self.product_ids)
+            self.product_ids = np.concatenate([self.product_ids, np.asarray(new_ids, dtype=np.int64)])
+            self.hashes = np.concatenate([self.hashes, np.zeros(len(new_ids), dtype=np.int64)])
+            self.positions.update({product_id: start + offset for offset, product_id in enumerate(new_ids)})
+            self.neighbours = np.vstack([self.neighbours, np.zeros((len(new_ids), k), dtype=np.int32)])
+            self.scores = np.vstack([self.scores, np.zeros((len(new_ids), k), dtype=np.float32)])
+        size = len(self.product_ids)
+        matrix = self.matrix
+        if matrix.shape[0] < size:
+            matrix = sparse.vstack([matrix, sparse.csr_matrix((size - matrix.shape[0], matrix.shape[1]), dtype=np.float32)])
+
+        changed_positions = np.asarray([self.positions[row[0]] for row in changed], dtype=np.int64)
+        removed_positions = np.asarray(
+            [self.positions[product_id] for product_id in removed_ids if product_id in self.positions],
+            dtype=np.int64
+        )
+        touched = np.concatenate([changed_positions, removed_positions])
+        if not len(touched):
+            self.matrix = matrix.tocsr()
+            return touched
+
+        # Filas tocadas a cero y los vectores nuevos sumados en su lugar
+        keep = np.ones(size, dtype=np.float32)
+        keep[touched] = 0
+        vectors = vectorize([document_terms(row[1], row[2]) for row in changed], self.vocabulary, self.idf).tocoo()
+        replacement = sparse.csr_matrix(
+            (vectors.data, (changed_positions[vectors.row], vectors.col)), shape=matrix.shape, dtype=np.float32
+        )
+        self.matrix = (sparse.diags(keep) @ matrix + replacement).tocsr()
+        self.hashes[changed_positions] = [text_hash(row[1], row[2]) for row in changed]
+        self.hashes[removed_positions] = 0
+
+        # Afectados: los tocados, quien los tenía como vecino y quien ahora
+        # tendría a un producto cambiado por encima de su último vecino
+        affected = np.zeros(size, dtype=bool)
+        affected[touched] = True
+        affected |= (np.isin(self.neighbours, touched) & (self.scores > 0)).any(axis=1)
+        threshold = self.scores[:, -1]
+        for _, similarity in similarity_blocks(self.matrix[changed_positions], self.matrix):
+            affected |= (similarity > threshold[None, :]).any(axis=0)
+
+        positions = np.flatnonzero(affected)
+        self.neighbours[positions], self.scores[positions] = top_k_neighbours(self.matrix, positions, k)
+        return positions
+
+    def links(self, positions):
+        """Enlaces (producto, relacionado, posición, similitud) de las filas indicadas"""
+        positions = np.asarray(positions, dtype=np.int64)
+        k = self.neighbours.shape[1]
+        scores = self.scores[positions]
+        valid = scores > 0
+        rows = np.repeat(positions, k).reshape(-1, k)
+        ranks = np.broadcast_to(np.arange(k), scores.shape)
+        return (
+            self.product_ids[rows[valid]],
+            self.product_ids[self.neighbours[positions][valid]],
+            ranks[valid],
+            scores[valid],
+        )
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        terms = np.empty(len(self.vocabulary), dtype=object)
+        for term, column in self.vocabulary.items():
+            terms[column] = term
+        temporary_path = f'{path}.tmp.npz'
+        np.savez_compressed(
+            temporary_path,
+            product_ids=self.product_ids,
+            hashes=self.hashes,
+            data=self.matrix.data,
+            indices=self.matrix.indices,
+            indptr=self.matrix.indptr,
+            columns=np.array([self.matrix.shape[1]]),
+            terms=terms.astype(str),
+            idf=self.idf,
+            neighbours=self.neighbours,
+            scores=self.scores,
+            watermark=np.array([self.watermark.isoformat() if self.watermark else '']),
+        )
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        if not path or not os.path.exists(path):
+            return None
+        with np.load(path) as stored:
+            size = len(stored['product_ids'])
+            matrix = sparse.csr_matrix(
+                (stored['data'], stored['indices'], stored['indptr']),
+                shape=(size, int(stored['columns'][0]))
+            )
+            vocabulary = {term: column for column, term in enumerate(stored['terms'].tolist())}
+            watermark = parse_datetime(str(stored['watermark'][0])) if stored['watermark'][0] else None
+            return cls(
+                stored['product_ids'], stored['hashes'], matrix, vocabulary, stored['idf'],
+                stored['neighbours'], stored['scores'], watermark
+            )
+
+
+def store_similar(products, related, ranks, scores, product_ids=None):
+    """Reemplaza las filas 'similar' (de `product_ids`, o todas)"""
+    links = [
+        RelatedProduct(
+            product_id=product_id,
+            related_id=related_id,
+            kind=RelatedProduct.KIND_SIMILAR,
+            rank=rank,
+            score=score
+        )
+        for product_id, related_id, rank, score in zip(
+            products.tolist(), related.tolist(), ranks.tolist(), scores.tolist()
+        )
+    ]
+    stale = RelatedProduct.objects.filter(kind=RelatedProduct.KIND_SIMILAR)
+    if product_ids is not None:
+        stale = stale.filter(product_id__in=list(product_ids))
+    with transaction.atomic():
+        stale.delete()
+        RelatedProduct.objects.bulk_create(links, batch_size=2000)
+    return len(links)
+
+
+def build_similar_products(full=False, path=None, k=TOP_K):
+    """
+    Construye (o actualiza) los productos similares por contenido
+
+    En modo incremental solo se vectorizan los productos modificados desde la
+    última ejecución cuyo texto cambió de verdad (se compara un hash de
+    nombre y descripción), más las bajas, y solo se recalculan las filas
+    afectadas. Se vuelven a leer los PRODUCT_SIMILARITY_LAG segundos previos
+    al inicio de la ejecución anterior (transacciones que confirman tarde o
+    con el mismo updated_at); el hash descarta lo ya aplicado.
+
+    Returns:
+        dict: Productos vectorizados, filas recalculadas y enlaces guardados
+    """
+    path = path or settings.PRODUCT_SIMILARITY_STATE_PATH
+    model = None if full else SimilarityModel.load(path)
+    products = Product.objects.order_by()
+    started = timezone.now()
+
+    if model is None:
+        rows = list(products.filter(is_active=True).order_by('id').values_list('id', 'name', 'description'))
+        model = SimilarityModel.fit(rows, k)
+        model.watermark = started
+        positions = np.arange(len(model.product_ids))
+        with transaction.atomic():
+            links = store_similar(*model.links(positions))
+            model.save(path)
+        return {'products': len(rows), 'updated': len(positions), 'links': links}
+
+    recent = products
+    if model.watermark is not None:
+        recent = recent.filter(updated_at__gte=model.watermark - timedelta(seconds=settings.PRODUCT_SIMILARITY_LAG))
+    recent = list(recent.values_list('id', 'name', 'description', 'is_active'))
+    existing = np.fromiter(products.filter(is_active=True).values_list('id', flat=True).iterator(), dtype=np.int64)
+
+    # Bajas: productos vectorizados que ya no existen o ya no están activos
+    gone = (model.hashes != 0) & ~np.isin(model.product_ids, existing)
+    changed, removed = [], set(model.product_ids[gone].tolist())
+    for product_id, name, description, is_active in recent:
+        position = model.positions.get(product_id)
+        if not is_active:
+            # Una baja ya aplicada (hash 0) que se vuelve a leer no se recalcula
+            if position is not None and model.hashes[position]:
+                removed.add(product_id)
+        elif position is None or model.hashes[position] != text_hash(name, description):
+            changed.append((product_id, name, description))
+
+    positions = model.update(changed, removed, k)
+    model.watermark = started
+    with transaction.atomic():
+        links = store_similar(*model.links(positions), product_ids=model.product_ids[positions].tolist())
+        model.save(path)
+    return {'products': len(changed), 'updated': len(positions), 'links': links}
@@ -1,12 +1,45 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIRequestFactory
+from rest_framework.request import Request
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from decimal import Decimal
-from .models import Category, Product, ProductImage
+import numpy as np
+from PIL import Image
+from django.db.models import F, Value
+from .models import VALIDATE_FIELDS, VALIDATE_TRUSTED, Category, CategoryRelatedProduct, Product, ProductImage, RelatedProduct
 from .serializers import CategorySerializer, ProductSerializer
+from .filters import SearchRankOrderingFilter
+from .search import supports_full_text
+from .search_engine import (
+    BM25Index, build_search_index, index_product, load_search_index,
+    peek_search_index, reset_search_index, sync_search_index, warm_search_index
+)
+from .text import tokenize
+from .views import ProductViewSet
+from .related import category_related, refresh_category_related
+from .similarity import SimilarityModel, build_similar_products, top_k_neighbours, vectorize, fit_vocabulary
+from .cache import CATALOG_VERSION_KEY, bump_catalog_version
+from core.exceptions import StorageObjectNotFound
+from core.services import storage_service
 
 User = get_user_model()
 
@@ -79,6 +112,63 @@ class ProductModelTest(TestCase):
         )
         self.assertEqual(product.slug, 'samsung-galaxy-s24')
     
+    def test_duplicate_name_gets_suffix(self):
+        """Test dos productos con el mismo nombre reciben slugs distintos"""
+        duplicate = Product.objects.create(
+            name='iPhone 15',
+            description='Otro',
+            price=Decimal('10.00'),
+            category=self.category
+        )
+        self.assertEqual(duplicate.slug, 'iphone-15-2')
+    
+    def test_save_single_slug_query(self):
+        """Test guardar hace como mucho una consulta de unicidad del slug"""
+        def slug_queries(save):
+            with CaptureQueriesContext(connection) as context:
+                save()
+            return [query for query in context.captured_queries if '"slug" ' in query['sql'].partition('WHERE')[2]]
+        
+        product = Product(name='Pixel 8', description='Test', price=Decimal('10.00'), category=self.category)
+        self.assertEqual(len(slug_queries(product.save)), 1)
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = 20
+        self.assertEqual(slug_queries(product.save), [])
+        
+        product.slug = 'electronicos'
+        with self.assertRaises(ValidationError):
+            product.save()
+    
+    def test_validation_modes(self):
+        """Test 'fields' valida solo los campos y rechaza modos desconocidos"""
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = Decimal('-1')
+        with self.assertRaises(ValidationError):
+            product.save(validation=VALIDATE_FIELDS)
+        with self.assertRaises(ValueError):
+            product.save(validation='otro')
+        
+        product.price = Decimal('5.00')
+        product.slug = 'electronicos'
+        # Sin clean(): la unicidad entre productos y categorías no se comprueba
+        product.save(validation=VALIDATE_FIELDS)
+        self.assertEqual(Product.objects.get(pk=product.pk).slug, 'electronicos')
+    
+    def test_trusted_update_fields_single_update(self):
+        """Test con 'trusted' y update_fields, descontar stock es un solo UPDATE"""
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = F('stock') - 3
+        with CaptureQueriesContext(connection) as context:
+            product.save(update_fields=['stock', 'updated_at'], validation=VALIDATE_TRUSTED)
+        statements = [
+            query['sql'] for query in context.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))
+        ]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('UPDATE "products_product" SET "stock"'))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)
+    
     def test_product_is_in_stock(self):
         """Test propiedad is_in_stock"""
         self.assertTrue(self.product.is_in_stock)
@@ -124,6 +214,50 @@ class ProductImageModelTest(TestCase):
         """Test representación string de imagen de producto"""
         expected = f'{self.product.name} - Imagen {self.product_image.order}'
         self.assertEqual(str(self.product_image), expected)
+    
+    def assert_primary_image(self, image):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.primary_image_id, image and image.id)
+        self.assertEqual(self.product.primary_image_url, image and image.image_url)
+    
+    def test_primary_image_follows_main_image(self):
+        """Test la imagen principal desnormalizada sigue a la marcada como principal"""
+        self.assert_primary_image(self.product_image)
+        
+        second = ProductImage.objects.create(
+            product=self.product,
+            image_url='https://example.com/image2.jpg',
+            is_main=True,
+            order=2
+        )
+        self.assert_primary_image(second)
+        self.product_image.refresh_from_db()
+        self.assertFalse(self.product_image.is_main)
+        
+        second.is_main = False
+        second.save()
+        self.assert_primary_image(None)
+    
+    def test_primary_image_cleared_on_delete(self):
+        """Test al eliminar la imagen principal el producto queda sin ella"""
+        self.product_image.delete()
+        self.assert_primary_image(None)
+    
+    def test_product_save_keeps_primary_image(self):
+        """Test guardar un producto cargado antes de cambiar la imagen no la pisa"""
+        stale = Product.objects.get(pk=self.product.pk)
+        self.product_image.delete()
+        image = ProductImage.objects.create(product=self.product, image_url='https://example.com/new.jpg', is_main=True)
+        stale.stock = 1
+        stale.save()
+        self.assert_primary_image(image)
+    
+    def test_one_main_image_per_product(self):
+        """Test el índice único parcial impide dos imágenes principales"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductImage.objects.bulk_create([
+                ProductImage(product=self.product, image_url='https://example.com/other.jpg', is_main=True)
+            ])
 
 
 class CategoryAPITest(APITestCase):
@@ -302,3 +436,1906 @@ class ProductAPITest(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['name'], 'Nuevo Producto')
+
+
+class ProductQueryBudgetTest(APITestCase):
+    """Tests del presupuesto de consultas en los listados de productos"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Electrónicos')
+        self.create_products(3, images_per_product=1)
+    
+    def create_products(self, count, images_per_product):
+        start = Product.objects.count()
+        for i in range(start, start + count):
+            product = Product.objects.create(
+                name=f'Producto {i}',
+                description='Descripción de prueba',
+                price=Decimal('10.00'),
+                stock=5,
+                category=self.category,
+                is_featured=True
+            )
+            for order in range(images_per_product):
+                ProductImage.objects.create(
+                    product=product,
+                    image_url=f'https://example.com/{i}-{order}.jpg',
+                    is_main=(order == 0),
+                    order=order
+                )
+    
+    def assert_constant_queries(self, url, expected):
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        # Más productos e imágenes no deben cambiar el número de consultas
+        self.create_products(5, images_per_product=3)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+    
+    def test_product_list_query_budget(self):
+        """Test listado: productos con categoría + imágenes (cursor, sin COUNT)"""
+        response = self.assert_constant_queries(reverse('products:product-list'), 2)
+        first = response.data['results'][0]
+        self.assertEqual(first['category_name'], 'Electrónicos')
+        self.assertEqual(first['main_image'], first['images'][0]['image_url'])
+    
+    def test_featured_query_budget(self):
+        """Test destacados: productos con categoría + imágenes"""
+        self.assert_constant_queries(reverse('products:product-featured'), 2)
+    
+    def test_latest_query_budget(self):
+        """Test recientes: productos con categoría + imágenes"""
+        self.assert_constant_queries(reverse('products:product-latest'), 2)
+    
+    def test_product_detail_query_budget(self):
+        """
+        Test detalle: validadores, producto, imágenes, lista de la categoría con
+        sus imágenes y similares (sin enlaces no se buscan sus imágenes)
+        """
+        url = reverse('products:product-detail', kwargs={'slug': 'producto-0'})
+        response = self.assert_constant_queries(url, 6)
+        self.assertEqual(len(response.data['related_products']), 4)
+        self.assertEqual(response.data['related_products'][0]['category_name'], 'Electrónicos')
+    
+    def test_main_image_resolved_from_product(self):
+        """Test la imagen principal se resuelve sin consultar las imágenes"""
+        product = Product.objects.get(name='Producto 0')
+        with self.assertNumQueries(0):
+            self.assertEqual(product.get_main_image_url(), 'https://example.com/0-0.jpg')
+    
+    def test_cards_without_images_skip_image_table(self):
+        """Test con ?omit=images las tarjetas no consultan products_productimage"""
+        for url in (reverse('products:product-list'), reverse('products:product-featured')):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {'omit': 'images'})
+            cards = response.data['results'] if 'results' in response.data else response.data
+            self.assertTrue(all(card['main_image'].startswith('https://example.com/') for card in cards))
+            self.assertFalse([query for query in context.captured_queries if 'products_productimage' in query['sql']])
+
+
+class CategoryActiveProductsCountTest(TestCase):
+    """Tests para el contador desnormalizado de productos activos"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Electrónicos')
+        self.other_category = Category.objects.create(name='Hogar')
+        self.product = Product.objects.create(
+            name='iPhone 15',
+            description='Último modelo de iPhone',
+            price=Decimal('999.99'),
+            stock=10,
+            category=self.category
+        )
+    
+    def get_count(self, category):
+        category.refresh_from_db()
+        return category.active_products_count
+    
+    def test_count_on_create(self):
+        """Test crear productos activos e inactivos"""
+        Product.objects.create(
+            name='Inactivo',
+            description='Test',
+            price=Decimal('10.00'),
+            category=self.category,
+            is_active=False
+        )
+        self.assertEqual(self.get_count(self.category), 1)
+    
+    def test_count_on_toggle_active(self):
+        """Test desactivar y reactivar un producto"""
+        product = Product.objects.get(pk=self.product.pk)
+        product.is_active = False
+        product.save()
+        self.assertEqual(self.get_count(self.category), 0)
+        
+        product.is_active = True
+        product.save()
+        self.assertEqual(self.get_count(self.category), 1)
+    
+    def test_count_on_recategorize(self):
+        """Test mover un producto a otra categoría"""
+        product = Product.objects.get(pk=self.product.pk)
+        product.category = self.other_category
+        product.save()
+        self.assertEqual(self.get_count(self.category), 0)
+        self.assertEqual(self.get_count(self.other_category), 1)
+    
+    def test_count_on_recategorize_unloaded_instance(self):
+        """Test mover un producto guardado sin cargarlo recuenta también la categoría anterior"""
+        product = Product(
+            pk=self.product.pk,
+            name='iPhone 15',
+            slug=self.product.slug,
+            description='Último modelo de iPhone',
+            price=Decimal('999.99'),
+            stock=10,
+            category=self.other_category,
+            created_at=self.product.created_at
+        )
+        product.save()
+        self.assertEqual(self.get_count(self.category), 0)
+        self.assertEqual(self.get_count(self.other_category), 1)
+    
+    def test_count_on_delete(self):
+        """Test eliminar un producto"""
+        self.product.delete()
+        self.assertEqual(self.get_count(self.category), 0)
+    
+    def test_category_save_keeps_count(self):
+        """Test guardar una categoría no pisa el contador"""
+        self.category.description = 'Nueva descripción'
+        self.category.save()
+        self.assertEqual(self.get_count(self.category), 1)
+    
+    def test_rebuild_command(self):
+        """Test el comando recalcula los contadores desde cero"""
+        Category.objects.update(active_products_count=42)
+        call_command('rebuild_category_counts', stdout=StringIO())
+        self.assertEqual(self.get_count(self.category), 1)
+        self.assertEqual(self.get_count(self.other_category), 0)
+    
+    def test_category_list_without_per_row_counts(self):
+        """Test el listado de categorías no ejecuta COUNT por fila"""
+        # Validadores de GET condicional, COUNT de la paginación y la página
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('products:category-list'))
+        counts = {item['name']: item['products_count'] for item in response.data['results']}
+        self.assertEqual(counts, {'Electrónicos': 1, 'Hogar': 0})
+
+
+class ProductSearchTest(APITestCase):
+    """Tests para la búsqueda de productos (icontains en SQLite)"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Calzado')
+        self.boots = Product.objects.create(
+            name='Botas de montaña',
+            description='Impermeables y resistentes',
+            price=Decimal('120.00'),
+            stock=3,
+            category=self.category
+        )
+        self.sneakers = Product.objects.create(
+            name='Tenis urbanos',
+            description='Ligeros para caminar por la montaña',
+            price=Decimal('80.00'),
+            stock=3,
+            category=self.category
+        )
+    
+    def test_search_falls_back_to_icontains(self):
+        """Test la búsqueda recorre nombre y descripción sin distinguir mayúsculas"""
+        self.assertFalse(supports_full_text(Product.objects.all()))
+        url = reverse('products:product-list')
+        response = self.client.get(url, {'search': 'Montaña'})
+        names = {item['name'] for item in response.data['results']}
+        self.assertEqual(names, {'Botas de montaña', 'Tenis urbanos'})
+    
+    def test_category_products_search(self):
+        """Test búsqueda dentro de los productos de una categoría"""
+        url = reverse('products:category-products', kwargs={'slug': self.category.slug})
+        response = self.client.get(url, {'search': 'impermeables'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data['results']], ['Botas de montaña'])
+    
+    def test_rank_ordering_when_ranked(self):
+        """Test el orden por relevancia solo aplica sin ?ordering= explícito"""
+        view = ProductViewSet()
+        ordering_filter = SearchRankOrderingFilter()
+        ranked = Product.objects.annotate(search_rank=Value(1.0))
+        
+        request = Request(APIRequestFactory().get('/'))
+        self.assertEqual(
+            ordering_filter.get_ordering(request, ranked, view),
+            ['-search_rank', '-created_at']
+        )
+        
+        request = Request(APIRequestFactory().get('/', {'ordering': 'price'}))
+        self.assertEqual(ordering_filter.get_ordering(request, ranked, view), ['price'])
+
+
+class SearchEngineTest(TestCase):
+    """Tests para el índice BM25 en memoria"""
+    
+    def test_tokenize_folds_accents_and_stems(self):
+        """Test normalización de tildes, plurales y género"""
+        self.assertEqual(tokenize('Camisetas de Algodón'), tokenize('camiseta algodon'))
+        self.assertEqual(tokenize('zapatos rojos'), tokenize('Zapato roja'))
+        self.assertEqual(tokenize('de la y para'), [])
+    
+    def test_bm25_ranking(self):
+        """Test el nombre pesa más que la descripción"""
+        index = BM25Index()
+        index_product(index, 1, 'Mochila de viaje', 'Con bolsillo para botella')
+        index_product(index, 2, 'Botella térmica', 'Acero inoxidable')
+        index_product(index, 3, 'Lámpara', 'Luz cálida')
+        index.compact()
+        results = index.search('botellas')
+        self.assertEqual([product_id for product_id, _ in results], [2, 1])
+    
+    def test_typo_tolerance(self):
+        """Test búsqueda con errores de escritura"""
+        index = BM25Index()
+        index_product(index, 1, 'Camiseta deportiva', 'Tela transpirable')
+        index_product(index, 2, 'Pantalón', 'Mezclilla')
+        self.assertEqual(index.search('camizeta')[0][0], 1)
+        self.assertEqual(index.search('camizeta', fuzzy=False), [])
+    
+    def test_remove_and_compact(self):
+        """Test eliminar documentos antes y después de compactar"""
+        index = BM25Index()
+        index_product(index, 1, 'Silla', 'Madera')
+        index_product(index, 2, 'Silla gamer', 'Reclinable')
+        index.remove(1)
+        self.assertEqual([pid for pid, _ in index.search('silla')], [2])
+        index.compact()
+        self.assertEqual(len(index), 1)
+        self.assertEqual([pid for pid, _ in index.search('silla')], [2])
+    
+    def test_reindex_same_text_is_noop(self):
+        """Test reindexar con el mismo texto no deja postings muertos ni crece el delta"""
+        index = BM25Index()
+        index_product(index, 1, 'Silla', 'Madera')
+        index.compact()
+        self.assertFalse(index.add(1, 'Silla', 'Silla', 'Madera'))
+        self.assertEqual((index._dead, index._delta_docs), (0, 0))
+        self.assertTrue(index.add(1, 'Silla plegable', 'Silla plegable', 'Madera'))
+        self.assertEqual((index._dead, index._delta_docs), (1, 1))
+    
+    def test_sync_compacts_when_delta_grows(self):
+        """Test la sincronización compacta sola cuando el delta supera el umbral"""
+        category = Category.objects.create(name='Muebles')
+        products = [
+            Product.objects.create(
+                name=f'Mesa {i}', description='Roble', price=Decimal('10.00'), stock=1, category=category
+            )
+            for i in range(5)
+        ]
+        index = build_search_index()
+        index.compact_min = 2
+        # Solo cambia el stock: nada que reindexar
+        Product.objects.filter(category=category).update(stock=0, updated_at=timezone.now())
+        sync_search_index(index)
+        self.assertEqual((index._dead, index._delta_docs), (0, 0))
+        
+        for product in products[:3]:
+            product.name = f'Mesa plegable {product.id}'
+            product.save()
+        sync_search_index(index)
+        self.assertEqual((index._dead, index._delta_docs), (0, 0))
+        self.assertEqual(len(index), 5)
+        self.assertEqual(len(index.search('plegable')), 3)
+
+
+@override_settings(PRODUCT_SEARCH_BACKEND='bm25')
+class SearchIndexAPITest(APITestCase):
+    """Tests para ?search= con el backend BM25"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Cocina')
+        self.pan = Product.objects.create(
+            name='Sartén antiadherente',
+            description='Ideal para cocinar sin aceite',
+            price=Decimal('35.00'),
+            stock=4,
+            category=self.category
+        )
+        reset_search_index(build_search_index())
+    
+    def tearDown(self):
+        reset_search_index()
+    
+    def search(self, term):
+        response = self.client.get(reverse('products:product-list'), {'search': term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in response.data['results']]
+    
+    def test_search_uses_index(self):
+        """Test búsqueda por raíz sin tildes"""
+        self.assertEqual(self.search('sarten'), ['Sartén antiadherente'])
+    
+    def test_walk_ranked_pages(self):
+        """Test paginar por relevancia no repite ni salta productos"""
+        for i in range(6):
+            Product.objects.create(
+                name=f'Sartén {"honda " * i}{i}',
+                description='Sartén de hierro',
+                price=Decimal('20.00'),
+                stock=1,
+                category=self.category
+            )
+        reset_search_index(build_search_index())
+        response = self.client.get(reverse('products:product-list'), {'search': 'sarten', 'page_size': 2})
+        ids = []
+        while True:
+            ids.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(sorted(ids), sorted(Product.objects.values_list('id', flat=True)))
+    
+    def test_index_updates_from_signals(self):
+        """Test altas, cambios y bajas se reflejan en el índice"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name='Olla exprés',
+                description='Acero inoxidable',
+                price=Decimal('80.00'),
+                stock=2,
+                category=self.category
+            )
+        self.assertEqual(self.search('ollas'), ['Olla exprés'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pan.name = 'Comal de hierro'
+            self.pan.save()
+        self.assertEqual(self.search('sarten'), [])
+        self.assertEqual(self.search('comal'), ['Comal de hierro'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pan.delete()
+        self.assertEqual(self.search('comal'), [])
+    
+    @override_settings(PRODUCT_SEARCH_MAX_RESULTS=1)
+    def test_filtered_search_beyond_global_cutoff(self):
+        """Test los filtros no pierden coincidencias que quedan fuera del corte global del índice"""
+        other = Category.objects.create(name='Jardín')
+        Product.objects.create(
+            name='Sartén de hierro fundido para parrilla de jardín',
+            description='Resistente a la intemperie, con mango largo de madera',
+            price=Decimal('50.00'),
+            stock=1,
+            category=other
+        )
+        reset_search_index(build_search_index())
+        self.assertEqual(peek_search_index().search('sarten', limit=1)[0][0], self.pan.id)
+        
+        response = self.client.get(reverse('products:product-list'), {'search': 'sarten', 'category': other.id})
+        self.assertEqual(
+            [item['name'] for item in response.data['results']],
+            ['Sartén de hierro fundido para parrilla de jardín']
+        )
+    
+    def test_picks_up_writes_from_other_workers(self):
+        """Test un cambio hecho en otro worker (sin señales en este) llega al índice"""
+        self.search('sarten')
+        Product.objects.filter(pk=self.pan.pk).update(name='Comal de hierro', updated_at=timezone.now())
+        self.assertEqual(self.search('comal'), [])
+        # El otro worker invalidó la versión del catálogo (caché compartida)
+        bump_catalog_version()
+        self.assertEqual(self.search('comal'), ['Comal de hierro'])
+    
+    def test_never_builds_inside_a_request(self):
+        """Test sin índice cargado ni instantánea, ?search= usa la base de datos"""
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(PRODUCT_SEARCH_INDEX_PATH=os.path.join(directory, 'index.pickle')):
+            reset_search_index()
+            self.assertEqual(self.search('Sartén'), ['Sartén antiadherente'])
+            self.assertIsNone(peek_search_index())
+    
+    def test_warm_builds_snapshot(self):
+        """Test al arrancar sin instantánea se construye el índice y se guarda para los demás workers"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.pickle')
+            with override_settings(PRODUCT_SEARCH_INDEX_PATH=path):
+                reset_search_index()
+                index = warm_search_index()
+                self.assertEqual(len(load_search_index(path)), 1)
+                self.assertIs(warm_search_index(), index)
+                self.assertEqual(self.search('sarten'), ['Sartén antiadherente'])
+
+
+class ProductKeysetPaginationTest(APITestCase):
+    """Tests para la paginación por cursor del listado de productos"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Electrónicos')
+        for i, price in enumerate(['30.00', '10.00', '20.00', '10.00', '30.00', '10.00', '20.00']):
+            Product.objects.create(
+                name=f'Producto {i}',
+                description='Test',
+                price=Decimal(price),
+                stock=1,
+                category=self.category
+            )
+        self.url = reverse('products:product-list')
+    
+    def walk(self, params):
+        pages = []
+        response = self.client.get(self.url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response)
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+    
+    def collect_ids(self, pages):
+        return [item['id'] for page in pages for item in page.data['results']]
+    
+    def test_walk_all_orderings(self):
+        """Test recorrer todas las páginas sin repetir ni saltar productos"""
+        for ordering in ['-created_at', 'price', '-price', 'name']:
+            expected = list(
+                Product.objects.order_by(ordering, '-id' if ordering.startswith('-') else 'id')
+                .values_list('id', flat=True)
+            )
+            pages = self.walk({'ordering': ordering, 'page_size': 3})
+            self.assertEqual(self.collect_ids(pages), expected, ordering)
+            self.assertNotIn('count', pages[0].data)
+    
+    def test_previous_link(self):
+        """Test volver a la página anterior con el cursor inverso"""
+        pages = self.walk({'ordering': 'price', 'page_size': 3})
+        response = self.client.get(pages[-1].data['previous'])
+        self.assertEqual(response.data['results'], pages[-2].data['results'])
+    
+    def test_no_count_query(self):
+        """Test una página cuesta lo mismo sin COUNT(*): productos + imágenes"""
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {'page_size': 3})
+    
+    def test_page_number_opt_in(self):
+        """Test ?page= conserva la paginación numerada con count"""
+        response = self.client.get(self.url, {'page': 1})
+        self.assertEqual(response.data['count'], 7)
+    
+    def test_invalid_cursor(self):
+        """Test un cursor manipulado devuelve 404"""
+        response = self.client.get(self.url, {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_cursor_bounds_leading_column(self):
+        """Test el filtro del cursor acota la primera columna para poder buscar en el índice"""
+        first = self.client.get(self.url, {'page_size': 3})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data['next'])
+        sql = queries.captured_queries[0]['sql']
+        self.assertIn('"products_product"."created_at" <= ', sql)
+
+
+class ProductFacetsTest(APITestCase):
+    """Tests para el endpoint de facetas de productos"""
+    
+    def setUp(self):
+        cache.clear()
+        self.electronics = Category.objects.create(name='Electrónicos')
+        self.home = Category.objects.create(name='Hogar')
+        for name, price, stock, category in [
+            ('Audífonos', '45.00', 3, self.electronics),
+            ('Teclado', '80.00', 0, self.electronics),
+            ('Monitor', '250.00', 2, self.electronics),
+            ('Lámpara', '30.00', 5, self.home),
+        ]:
+            Product.objects.create(
+                name=name,
+                description='Test',
+                price=Decimal(price),
+                stock=stock,
+                category=category
+            )
+        self.url = reverse('products:product-facets')
+    
+    def test_facets_single_query(self):
+        """Test categorías, rangos, stock y extremos de precio en una consulta"""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'price_buckets': '0,50,100'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data['total'], 4)
+        self.assertEqual(
+            [(item['name'], item['count']) for item in data['categories']],
+            [('Electrónicos', 3), ('Hogar', 1)]
+        )
+        self.assertEqual(
+            [(bucket['min'], bucket['max'], bucket['count']) for bucket in data['price']['buckets']],
+            [('0.00', '50.00', 2), ('50.00', '100.00', 1), ('100.00', None, 1)]
+        )
+        self.assertEqual((data['price']['min'], data['price']['max']), ('30.00', '250.00'))
+        self.assertEqual(data['stock'], {'in_stock': 3, 'out_of_stock': 1})
+    
+    def test_facets_apply_filters(self):
+        """Test las facetas respetan los filtros actuales"""
+        response = self.client.get(self.url, {'in_stock': 'true', 'max_price': '100'})
+        self.assertEqual(response.data['total'], 2)
+        self.assertEqual(response.data['stock']['out_of_stock'], 0)
+    
+    def test_facets_cached_per_filter_key(self):
+        """Test la respuesta se cachea por filtros normalizados"""
+        self.client.get(self.url, {'in_stock': 'true', 'ordering': 'price'})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'ordering': '-price', 'in_stock': 'true'})
+        self.assertEqual(response.data['total'], 3)
+    
+    def test_invalid_price_buckets(self):
+        """Test límites de precio inválidos"""
+        response = self.client.get(self.url, {'price_buckets': 'barato,caro'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'El formato de EXPLAIN depende del motor')
+class ProductIndexPlanTest(APITestCase):
+    """Tests de los índices del catálogo (plan de consulta de SQLite)"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        categories = [
+            Category.objects.create(name=f'Categoría {number}', description='Categoría')
+            for number in range(40)
+        ]
+        cls.category = categories[0]
+        Product.objects.bulk_create([
+            Product(
+                name=f'Producto {number}',
+                slug=f'producto-{number}',
+                description='Descripción',
+                price=Decimal(number % 300 + 1),
+                stock=number % 5,
+                category=categories[number % 40],
+                is_active=number % 7 != 0,
+                is_featured=number % 13 == 0
+            )
+            for number in range(2000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def assertPagesUseIndex(self, url, params, index_name):
+        """
+        Plan de la consulta de productos que ejecuta la vista en la primera
+        página y en la siguiente: con cursor debe buscar en el índice (SEARCH),
+        no recorrerlo desde el principio
+        """
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for page_url, page_params, access in ((url, params, ''), (response.data['next'], None, 'SEARCH products_product ')):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(page_url, page_params)
+            sql = next(query['sql'] for query in queries if 'FROM "products_product"' in query['sql'])
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+            self.assertIn(f'{access}USING INDEX {index_name}', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_category_listing_uses_index(self):
+        """Test listado por categoría paginado con cursor sin ordenar en memoria"""
+        url = reverse('products:category-products', kwargs={'slug': self.category.slug})
+        self.assertPagesUseIndex(url, {'page_size': 20}, 'product_cat_active_created')
+    
+    def test_active_listing_uses_partial_index(self):
+        """Test listado general paginado con cursor"""
+        self.assertPagesUseIndex(reverse('products:product-list'), {'page_size': 20}, 'product_active_created')
+    
+    def test_price_ordering_uses_partial_index(self):
+        """Test listado ordenado por precio paginado con cursor"""
+        params = {'ordering': 'price', 'page_size': 20}
+        self.assertPagesUseIndex(reverse('products:product-list'), params, 'product_active_price')
+    
+    def test_featured_uses_partial_index(self):
+        """Test productos destacados"""
+        queryset = Product.objects.filter(is_active=True, is_featured=True)[:8]
+        self.assertUsesIndex(queryset, 'product_featured_created')
+    
+    def test_price_range_uses_partial_index(self):
+        """Test filtro por rango de precio"""
+        queryset = Product.objects.filter(is_active=True, price__gte=10, price__lte=20).order_by('price')
+        self.assertUsesIndex(queryset, 'product_active_price')
+
+
+class CatalogResponseCacheTest(APITestCase):
+    """Tests para la caché versionada de destacados, últimos y categorías"""
+    
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Electrónicos')
+        self.product = Product.objects.create(
+            name='Auriculares',
+            description='Test',
+            price=Decimal('45.00'),
+            stock=3,
+            category=self.category,
+            is_featured=True
+        )
+        self.featured_url = reverse('products:product-featured')
+        self.latest_url = reverse('products:product-latest')
+        self.categories_url = reverse('products:category-list')
+    
+    def test_hit_serves_without_queries(self):
+        """Test una respuesta cacheada no consulta la base de datos"""
+        for url in [self.featured_url, self.latest_url, self.categories_url]:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(second.status_code, status.HTTP_200_OK)
+            self.assertEqual(second.data, first.data)
+    
+    def test_hit_is_single_cache_read(self):
+        """Test un acierto es una sola lectura de caché"""
+        self.client.get(self.featured_url)
+        with self.assertNumQueries(0), \
+                mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'set') as cache_set:
+            self.client.get(self.featured_url)
+        get_many.assert_called_once()
+        cache_set.assert_not_called()
+    
+    def test_product_write_invalidates(self):
+        """Test editar un producto invalida las respuestas"""
+        self.client.get(self.featured_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Auriculares Pro'
+            self.product.save()
+        response = self.client.get(self.featured_url)
+        self.assertEqual(response.data[0]['name'], 'Auriculares Pro')
+    
+    def test_image_write_invalidates(self):
+        """Test agregar una imagen invalida las respuestas"""
+        self.client.get(self.latest_url)
+        ProductImage.objects.create(
+            product=self.product,
+            image_url='https://example.com/auriculares.jpg',
+            is_main=True
+        )
+        response = self.client.get(self.latest_url)
+        self.assertEqual(response.data[0]['main_image'], 'https://example.com/auriculares.jpg')
+    
+    def test_category_write_invalidates(self):
+        """Test editar una categoría invalida el listado"""
+        self.client.get(self.categories_url)
+        Category.objects.create(name='Hogar')
+        response = self.client.get(self.categories_url)
+        self.assertEqual(response.data['count'], 2)
+    
+    def test_query_params_are_part_of_key(self):
+        """Test parámetros distintos no comparten entrada"""
+        Category.objects.create(name='Hogar')
+        self.client.get(self.categories_url, {'search': 'Hogar'})
+        response = self.client.get(self.categories_url)
+        self.assertEqual(response.data['count'], 2)
+    
+    def test_cold_cache_sets_version(self):
+        """Test con la versión expulsada se vuelve a calcular"""
+        self.client.get(self.featured_url)
+        cache.delete(CATALOG_VERSION_KEY)
+        with self.assertNumQueries(2):
+            self.client.get(self.featured_url)
+        self.assertIsNotNone(cache.get(CATALOG_VERSION_KEY))
+    
+    def test_file_based_cache(self):
+        """Test funciona con la caché en archivos"""
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }
+        }):
+            self.client.get(self.featured_url)
+            with self.assertNumQueries(0):
+                self.client.get(self.featured_url)
+            Product.objects.filter(pk=self.product.pk).first().save()
+            with self.assertNumQueries(2):
+                self.client.get(self.featured_url)
+
+
+class ConditionalGetTest(APITestCase):
+    """Tests de GET condicional (ETag / Last-Modified) en el catálogo"""
+    
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Electrónicos')
+        self.product = Product.objects.create(
+            name='Auriculares',
+            description='Test',
+            price=Decimal('45.00'),
+            stock=3,
+            category=self.category
+        )
+        self.related = Product.objects.create(
+            name='Teclado',
+            description='Test',
+            price=Decimal('80.00'),
+            stock=1,
+            category=self.category
+        )
+        self.product_url = reverse('products:product-detail', kwargs={'slug': self.product.slug})
+        self.category_url = reverse('products:category-detail', kwargs={'slug': self.category.slug})
+        self.categories_url = reverse('products:category-list')
+    
+    def test_product_not_modified_skips_serialization(self):
+        """Test el detalle sin cambios responde 304 con solo la consulta de validadores"""
+        response = self.client.get(self.product_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(self.product_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_product_if_modified_since(self):
+        """Test If-Modified-Since con la fecha devuelta"""
+        response = self.client.get(self.product_url)
+        response = self.client.get(self.product_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_product_image_modifies_etag(self):
+        """Test agregar una imagen cambia el ETag del producto"""
+        etag = self.client.get(self.product_url)['ETag']
+        ProductImage.objects.create(product=self.product, image_url='https://example.com/a.jpg')
+        response = self.client.get(self.product_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['images']), 1)
+    
+    def test_related_product_modifies_etag(self):
+        """Test cambiar un producto relacionado cambia el ETag del detalle"""
+        etag = self.client.get(self.product_url)['ETag']
+        self.related.price = Decimal('70.00')
+        self.related.save()
+        response = self.client.get(self.product_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    @override_settings(RELATED_PRODUCTS_LIMIT=1)
+    def test_products_outside_related_list_keep_etag(self):
+        """Test los validadores solo miran la lista de relacionados, no toda la categoría"""
+        Product.objects.create(
+            name='Monitor',
+            description='Test',
+            price=Decimal('150.00'),
+            stock=1,
+            category=self.category
+        )
+        url = reverse('products:product-detail', kwargs={'slug': self.related.slug})
+        etag = self.client.get(url)['ETag']
+        # Auriculares ya no está entre los dos más recientes de la categoría
+        self.product.price = Decimal('40.00')
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_inactive_product_is_not_found(self):
+        """Test un producto inactivo no responde 304"""
+        self.product.is_active = False
+        self.product.save()
+        response = self.client.get(self.product_url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_category_counter_modifies_etag(self):
+        """Test el contador de productos cambia el ETag de la categoría"""
+        etag = self.client.get(self.category_url)['ETag']
+        self.related.is_active = False
+        self.related.save()
+        response = self.client.get(self.category_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['products_count'], 1)
+    
+    def test_cached_category_list_not_modified(self):
+        """Test el listado cacheado responde 304 sin consultas"""
+        etag = self.client.get(self.categories_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.categories_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        Category.objects.create(name='Hogar')
+        response = self.client.get(self.categories_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class RelatedProductTest(APITestCase):
+    """Tests para la lista de relacionados precalculada de cada categoría"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Electrónicos')
+        self.other_category = Category.objects.create(name='Hogar')
+        self.products = [self.create_product(f'Producto {number}') for number in range(6)]
+    
+    def create_product(self, name, category=None):
+        return Product.objects.create(
+            name=name,
+            description='Test',
+            price=Decimal('10.00'),
+            stock=1,
+            category=category or self.category
+        )
+    
+    def related_ids(self, product):
+        product.refresh_from_db()
+        if not product.is_active:
+            return []
+        newest = CategoryRelatedProduct.objects.filter(
+            category_id=product.category_id
+        ).order_by('rank').values_list('product_id', flat=True)
+        return category_related(product.id, list(newest))
+    
+    def test_newest_products_of_category(self):
+        """Test los relacionados son los más recientes de la categoría, sin el propio producto"""
+        newest = [product.id for product in reversed(self.products)]
+        self.assertEqual(self.related_ids(self.products[0]), newest[:4])
+        self.assertEqual(self.related_ids(self.products[-1]), newest[1:5])
+        self.assertEqual(CategoryRelatedProduct.objects.filter(category=self.category).count(), 5)
+    
+    def test_detail_uses_table(self):
+        """Test el detalle devuelve los relacionados precalculados"""
+        url = reverse('products:product-detail', kwargs={'slug': self.products[0].slug})
+        response = self.client.get(url)
+        self.assertEqual(
+            [item['id'] for item in response.data['related_products']],
+            self.related_ids(self.products[0])
+        )
+    
+    def test_new_product_refreshes_category(self):
+        """Test un producto nuevo entra en los relacionados de su categoría"""
+        newest = self.create_product('Producto nuevo')
+        self.assertEqual(self.related_ids(self.products[0])[0], newest.id)
+        self.assertEqual(len(self.related_ids(self.products[0])), 4)
+    
+    def test_deactivate_and_move_refresh_categories(self):
+        """Test desactivar o mover un producto lo quita de su categoría anterior"""
+        moved, deactivated = self.products[-1], self.products[-2]
+        moved.category = self.other_category
+        moved.save()
+        deactivated.is_active = False
+        deactivated.save()
+        
+        self.assertNotIn(moved.id, self.related_ids(self.products[0]))
+        self.assertNotIn(deactivated.id, self.related_ids(self.products[0]))
+        self.assertEqual(self.related_ids(deactivated), [])
+        self.assertEqual(self.related_ids(moved), [])
+        self.assertEqual(self.related_ids(self.products[0]), [self.products[3].id, self.products[2].id, self.products[1].id])
+    
+    def test_delete_refreshes_category(self):
+        """Test eliminar un producto lo reemplaza en los relacionados"""
+        removed = self.products[-1]
+        removed.delete()
+        self.assertNotIn(removed.id, self.related_ids(self.products[0]))
+        self.assertEqual(len(self.related_ids(self.products[0])), 4)
+    
+    def test_unchanged_category_writes_nothing(self):
+        """Test editar un producto sin cambiar su categoría no reescribe la tabla"""
+        self.assertEqual(refresh_category_related([self.category.id]), (0, 0))
+        before = set(CategoryRelatedProduct.objects.values_list('id', flat=True))
+        self.products[0].price = Decimal('12.00')
+        self.products[0].save()
+        self.assertEqual(set(CategoryRelatedProduct.objects.values_list('id', flat=True)), before)
+    
+    def test_refresh_cost_does_not_grow_with_category(self):
+        """Test un alta lee y escribe lo mismo con 6 o con 30 productos en la categoría"""
+        def queries_for_new_product(name):
+            with CaptureQueriesContext(connection) as context:
+                self.create_product(name)
+            return len(context)
+        
+        small = queries_for_new_product('Producto 6')
+        for number in range(24):
+            self.create_product(f'Relleno {number}')
+        self.assertEqual(queries_for_new_product('Producto 31'), small)
+        self.assertEqual(CategoryRelatedProduct.objects.filter(category=self.category).count(), 5)
+    
+    def test_rebuild_command(self):
+        """Test el comando reconstruye la tabla desde cero"""
+        expected = self.related_ids(self.products[0])
+        CategoryRelatedProduct.objects.all().delete()
+        call_command('rebuild_related_products', stdout=StringIO())
+        self.assertEqual(self.related_ids(self.products[0]), expected)
+        self.assertEqual(CategoryRelatedProduct.objects.count(), 5)
+
+
+class ProductSimilarityTest(APITestCase):
+    """Tests para los productos similares por contenido (TF-IDF)"""
+    
+    def setUp(self):
+        self.shoes = Category.objects.create(name='Calzado')
+        self.tools = Category.objects.create(name='Herramientas')
+        self.products = {}
+        for key, name, description, category in [
+            ('hombre', 'Zapatillas running hombre', 'Zapatilla ligera con amortiguación', self.shoes),
+            ('mujer', 'Zapatillas running mujer', 'Zapatillas ligeras con amortiguación', self.shoes),
+            ('trail', 'Zapatilla trail montaña', 'Suela con tacos para montaña', self.shoes),
+            ('taladro', 'Taladro percutor', 'Taladro con percusión y maletín', self.tools),
+            ('inalambrico', 'Taladro inalámbrico', 'Taladro atornillador con batería', self.tools),
+            ('sierra', 'Sierra circular', 'Sierra con disco de corte para madera', self.tools),
+        ]:
+            self.products[key] = Product.objects.create(
+                name=name,
+                description=description,
+                price=Decimal('50.00'),
+                stock=5,
+                category=category
+            )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'similarity.npz')
+    
+    def similar(self, key):
+        return [
+            link.related_id for link in RelatedProduct.objects.filter(
+                product=self.products[key],
+                kind=RelatedProduct.KIND_SIMILAR
+            ).order_by('rank')
+        ]
+    
+    def test_nearest_neighbours(self):
+        """Test los vecinos más parecidos aparecen primero y sin el propio producto"""
+        build_similar_products(path=self.path)
+        self.assertEqual(self.similar('hombre')[0], self.products['mujer'].id)
+        self.assertEqual(self.similar('taladro')[0], self.products['inalambrico'].id)
+        self.assertNotIn(self.products['hombre'].id, self.similar('hombre'))
+        # Sin términos en común no hay enlace
+        self.assertNotIn(self.products['sierra'].id, self.similar('hombre'))
+    
+    def test_blocked_matches_single_block(self):
+        """Test el cálculo por bloques da el mismo resultado que en un solo bloque"""
+        documents = [['zapat', 'run'], ['zapat', 'run', 'mujer'], ['taladr'], ['taladr', 'bateri'], ['sierr']]
+        matrix = vectorize(documents, *fit_vocabulary(documents))
+        expected = top_k_neighbours(matrix, range(5), k=3)
+        with mock.patch('products.similarity.BLOCK_CELLS', 5):
+            blocked = top_k_neighbours(matrix, range(5), k=3)
+        np.testing.assert_array_equal(blocked[1], expected[1])
+    
+    def test_detail_includes_similar_products(self):
+        """Test el detalle sirve los similares precalculados"""
+        build_similar_products(path=self.path)
+        url = reverse('products:product-detail', kwargs={'slug': self.products['taladro'].slug})
+        # validadores, producto, imágenes y las dos listas de relacionados con sus imágenes
+        with self.assertNumQueries(7):
+            response = self.client.get(url)
+        self.assertEqual(response.data['similar_products'][0]['name'], 'Taladro inalámbrico')
+    
+    def test_incremental_only_changed_text(self):
+        """Test el modo incremental ignora cambios que no tocan el texto"""
+        build_similar_products(path=self.path)
+        product = self.products['sierra']
+        product.price = Decimal('60.00')
+        product.save()
+        self.assertEqual(build_similar_products(path=self.path)['products'], 0)
+        
+        product.name = 'Taladro de columna'
+        product.save()
+        result = build_similar_products(path=self.path)
+        self.assertEqual(result['products'], 1)
+        self.assertIn(product.id, self.similar('taladro'))
+        self.assertLess(result['updated'], len(self.products))
+    
+    def test_incremental_rereads_late_commits(self):
+        """Test un cambio confirmado tarde, con updated_at anterior a la última ejecución, no se pierde"""
+        build_similar_products(path=self.path)
+        product = self.products['sierra']
+        late = SimilarityModel.load(self.path).watermark - timedelta(seconds=30)
+        Product.objects.filter(pk=product.pk).update(name='Taladro de columna', updated_at=late)
+        
+        self.assertEqual(build_similar_products(path=self.path)['products'], 1)
+        self.assertIn(product.id, self.similar('taladro'))
+        # La ventana se relee, pero lo ya aplicado no se vuelve a vectorizar
+        self.assertEqual(build_similar_products(path=self.path), {'products': 0, 'updated': 0, 'links': 0})
+    
+    def test_incremental_new_and_removed_products(self):
+        """Test altas y bajas actualizan a los productos afectados"""
+        build_similar_products(path=self.path)
+        new = Product.objects.create(
+            name='Zapatillas running niño',
+            description='Zapatilla ligera',
+            price=Decimal('30.00'),
+            stock=5,
+            category=self.shoes
+        )
+        self.products['mujer'].is_active = False
+        self.products['mujer'].save()
+        build_similar_products(path=self.path)
+        
+        self.assertEqual(self.similar('hombre')[0], new.id)
+        self.assertNotIn(self.products['mujer'].id, self.similar('hombre'))
+        self.assertEqual(self.similar('mujer'), [])
+        state = SimilarityModel.load(self.path)
+        self.assertIn(new.id, state.positions)
+    
+    def test_command(self):
+        """Test el comando de gestión"""
+        out = StringIO()
+        call_command('build_similar_products', '--path', self.path, '--full', stdout=out)
+        self.assertIn('Productos vectorizados: 6', out.getvalue())
+
+
+class SparseFieldsetTest(APITestCase):
+    """Tests de ?fields= / ?omit= en los serializers de productos"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Electrónicos')
+        for i in range(3):
+            product = Product.objects.create(
+                name=f'Producto {i}',
+                description='Descripción de prueba',
+                price=Decimal('10.00'),
+                stock=5,
+                category=self.category
+            )
+            ProductImage.objects.create(
+                product=product,
+                image_url=f'https://example.com/{i}.jpg',
+                alt_text='Imagen',
+                is_main=True
+            )
+        refresh_category_related()
+        self.list_url = reverse('products:product-list')
+        self.detail_url = reverse('products:product-detail', kwargs={'slug': 'producto-0'})
+    
+    def test_fields_limits_payload_and_prefetches(self):
+        """Test ?fields= devuelve solo esos campos y no precarga imágenes"""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.list_url, {'fields': 'id,name,price'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+    
+    def test_omit_drops_fields(self):
+        """Test ?omit= quita campos y conserva el resto"""
+        response = self.client.get(self.list_url, {'omit': 'description,images'})
+        first = response.data['results'][0]
+        self.assertNotIn('description', first)
+        self.assertNotIn('images', first)
+        self.assertEqual(first['main_image'], 'https://example.com/2.jpg')
+        self.assertEqual(first['category_name'], 'Electrónicos')
+    
+    def test_nested_fields(self):
+        """Test rutas con puntos seleccionan campos de los anidados"""
+        response = self.client.get(self.list_url, {'fields': 'name,images.image_url'})
+        self.assertEqual(response.data['results'][0]['images'], [{'image_url': 'https://example.com/2.jpg'}])
+        
+        response = self.client.get(self.list_url, {'omit': 'images.alt_text,images.created_at'})
+        self.assertEqual(
+            set(response.data['results'][0]['images'][0]),
+            {'id', 'image_url', 'is_main', 'order', 'variants', 'srcset'}
+        )
+    
+    def test_detail_omits_related_queries(self):
+        """Test el detalle sin relacionados no los consulta"""
+        with self.assertNumQueries(3):  # validadores, producto e imágenes
+            response = self.client.get(self.detail_url, {'omit': 'related_products,similar_products'})
+        self.assertNotIn('related_products', response.data)
+        
+        with self.assertNumQueries(4):  # validadores, producto, relacionados y sus imágenes
+            response = self.client.get(self.detail_url, {'fields': 'name,related_products.name,related_products.main_image'})
+        self.assertEqual(set(response.data), {'name', 'related_products'})
+        self.assertEqual(set(response.data['related_products'][0]), {'name', 'main_image'})
+    
+    def test_unknown_fields_are_ignored(self):
+        """Test campos inexistentes no producen errores"""
+        response = self.client.get(self.list_url, {'fields': 'id,nope', 'omit': 'nada'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'id'})
+    
+    def test_serializer_without_request_returns_all_fields(self):
+        """Test sin petición (uso interno) se serializan todos los campos"""
+        product = Product.objects.with_card_data().first()
+        self.assertIn('images', ProductSerializer(product).data)
+
+
+class CompoundDocumentTest(APITestCase):
+    """Tests de documentos compuestos (?include=) en productos"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Electrónicos')
+        self.other = Category.objects.create(name='Hogar')
+        for i, category in enumerate([self.category, self.category, self.other]):
+            product = Product.objects.create(
+                name=f'Producto {i}',
+                description='Descripción de prueba',
+                price=Decimal('10.00'),
+                stock=5,
+                category=category
+            )
+            for order in range(2):
+                ProductImage.objects.create(
+                    product=product,
+                    image_url=f'https://example.com/{i}-{order}.jpg',
+                    order=order
+                )
+        refresh_category_related()
+        self.list_url = reverse('products:product-list')
+        self.detail_url = reverse('products:product-detail', kwargs={'slug': 'producto-0'})
+    
+    def test_default_keeps_nested_payload(self):
+        """Test sin ?include= la respuesta es la de siempre"""
+        response = self.client.get(self.list_url)
+        self.assertNotIn('included', response.data)
+        self.assertEqual(len(response.data['results'][0]['images']), 2)
+    
+    def test_list_includes_one_query_per_relation(self):
+        """Test listado: productos, categorías e imágenes con una consulta cada uno"""
+        with self.assertNumQueries(3):
+            response = self.client.get(self.list_url, {'include': 'category,images'})
+        first = response.data['results'][0]
+        self.assertEqual(first['category'], self.other.id)
+        self.assertNotIn('category_name', first)
+        self.assertEqual(len(first['images']), 2)
+        
+        included = response.data['included']
+        self.assertEqual({category['name'] for category in included['categories']}, {'Electrónicos', 'Hogar'})
+        self.assertEqual(len(included['images']), 6)
+    
+    def test_empty_include_returns_ids_only(self):
+        """Test ?include= vacío: solo ids y ninguna relación cargada"""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.list_url, {'include': ''})
+        self.assertEqual(response.data['included'], {})
+        self.assertNotIn('images', response.data['results'][0])
+    
+    def test_detail_includes_related(self):
+        """Test detalle: los relacionados se incluyen sin duplicados y con su categoría"""
+        # validadores, producto, similares, lista de la categoría, productos relacionados y categorías
+        with self.assertNumQueries(6):
+            response = self.client.get(self.detail_url, {'include': 'related,category'})
+        data = response.data['data']
+        related_id = Product.objects.get(name='Producto 1').id
+        self.assertEqual(data['related_products'], [related_id])
+        self.assertEqual([product['id'] for product in response.data['included']['products']], [related_id])
+        self.assertEqual(len(response.data['included']['categories']), 1)
+    
+    def test_unknown_include(self):
+        """Test relación no soportada responde 400"""
+        response = self.client.get(self.list_url, {'include': 'category,owner'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('owner', str(response.data['error']['details']))
+
+
+class ValuesListParityTest(APITestCase):
+    """Tests de paridad entre los listados desde .values() y los serializers de DRF"""
+    
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Electrónicos', description='Gadgets')
+        self.other = Category.objects.create(name='Hogar')
+        for i in range(5):
+            product = Product.objects.create(
+                name=f'Producto {i}',
+                description=f'Descripción del producto {i}',
+                price=Decimal('10.50') + i,
+                stock=i % 2,
+                category=self.category if i % 2 else self.other,
+                main_image_url='https://example.com/principal.jpg' if i == 3 else '',
+                main_image_variants=[
+                    {'url': 'https://example.com/principal_320.webp', 'width': 320, 'height': 160, 'format': 'webp'}
+                ] if i == 3 else [],
+                is_featured=i == 1
+            )
+            for order in range(i % 3):
+                ProductImage.objects.create(
+                    product=product,
+                    image_url=f'https://example.com/{i}-{order}.jpg',
+                    variants=[
+                        {'url': f'https://example.com/{i}-{order}_160.jpg', 'width': 160, 'height': 80, 'format': 'jpeg'}
+                    ],
+                    is_main=order == 1,
+                    order=order
+                )
+    
+    def assert_parity(self, url, params=None):
+        cache.clear()
+        with override_settings(FAST_LIST_SERIALIZATION=False):
+            expected = self.client.get(url, params)
+        cache.clear()
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, expected.content)
+        return response
+    
+    def test_product_list_parity(self):
+        """Test listado de productos: misma respuesta byte a byte"""
+        url = reverse('products:product-list')
+        self.assert_parity(url)
+        self.assert_parity(url, {'ordering': 'price', 'in_stock': 'true'})
+        self.assert_parity(url, {'fields': 'id,main_image,images.image_url'})
+        self.assert_parity(url, {'fields': 'id,main_image_srcset,images.srcset'})
+        self.assert_parity(url, {'omit': 'images', 'search': 'producto'})
+    
+    def test_product_cursor_pages_parity(self):
+        """Test las páginas siguientes (cursor desde filas .values()) coinciden"""
+        url = reverse('products:product-list')
+        response = self.assert_parity(url, {'page_size': 2, 'ordering': '-price'})
+        while response.data['next']:
+            response = self.assert_parity(response.data['next'])
+    
+    def test_category_parity(self):
+        """Test listado de categorías y productos de una categoría"""
+        self.assert_parity(reverse('products:category-list'))
+        self.assert_parity(reverse('products:category-products', kwargs={'slug': self.category.slug}))
+    
+    def test_product_list_query_budget(self):
+        """Test el camino rápido mantiene una consulta por relación"""
+        with self.assertNumQueries(2):
+            self.client.get(reverse('products:product-list'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('products:product-list'), {'fields': 'id,name,category_name'})
+
+
+class ImportCatalogTest(TestCase):
+    """Tests para el comando import_catalog"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Electrónicos')
+        self.other_category = Category.objects.create(name='Hogar')
+        self.existing = Product.objects.create(
+            name='Laptop',
+            description='Antigua',
+            price=Decimal('500.00'),
+            stock=1,
+            is_featured=True,
+            category=self.category
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+    
+    def write_file(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+    
+    def import_catalog(self, path, **options):
+        out = StringIO()
+        call_command('import_catalog', path, stdout=out, **options)
+        return out.getvalue()
+    
+    def read_rejects(self, path):
+        with open(f'{path}.rejects.jsonl', encoding='utf-8') as handle:
+            return [json.loads(line) for line in handle]
+    
+    def test_csv_creates_and_updates_by_slug(self):
+        """Test el CSV crea productos nuevos y actualiza los existentes por slug"""
+        path = self.write_file('catalogo.csv', (
+            'name,slug,description,price,stock,category\n'
+            'Laptop,laptop,Nueva,450.50,3,electronicos\n'
+            'Lámpara,,De mesa,20,5,Hogar\n'
+        ))
+        output = self.import_catalog(path)
+        
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.description, 'Nueva')
+        self.assertEqual(self.existing.price, Decimal('450.50'))
+        # Columna ausente en el archivo: no se pisa
+        self.assertTrue(self.existing.is_featured)
+        lamp = Product.objects.get(slug='lampara')
+        self.assertEqual(lamp.category, self.other_category)
+        self.assertEqual(lamp.stock, 5)
+        self.assertIn('1 creados, 1 actualizados, 0 rechazados', output)
+        self.assertIn('filas/s', output)
+        self.assertFalse(os.path.exists(f'{path}.rejects.jsonl'))
+    
+    def test_rejects_written_to_sidecar(self):
+        """Test las filas inválidas van al archivo de rechazados con sus errores"""
+        path = self.write_file('catalogo.jsonl', '\n'.join([
+            json.dumps({'name': 'Mouse', 'description': 'Óptico', 'price': '15', 'category': 'Electrónicos'}),
+            json.dumps({'name': 'Gratis', 'description': 'x', 'price': '0', 'category': 'Electrónicos'}),
+            json.dumps({'name': 'Silla', 'description': 'x', 'price': '30', 'category': 'Jardín'}),
+            json.dumps({'name': 'Hogar', 'slug': 'hogar', 'description': 'x', 'price': '30', 'category': 'Hogar'}),
+            '{no es json',
+        ]))
+        output = self.import_catalog(path)
+        
+        self.assertTrue(Product.objects.filter(slug='mouse').exists())
+        self.assertIn('4 rechazados', output)
+        rejects = {reject['line']: reject['errors'] for reject in self.read_rejects(path)}
+        self.assertEqual(sorted(rejects), [2, 3, 4, 5])
+        self.assertIn('price', rejects[2])
+        self.assertIn('category', rejects[3])
+        self.assertIn('slug', rejects[4])
+        self.assertIn('row', rejects[5])
+    
+    def test_duplicate_slug_last_row_wins(self):
+        """Test con slugs repetidos queda la última fila, también dentro de un bloque"""
+        path = self.write_file('catalogo.csv', (
+            'name,slug,description,price,category\n'
+            'Mouse,mouse,Primera,10,Electrónicos\n'
+            'Mouse,mouse,Segunda,12,Electrónicos\n'
+        ))
+        self.import_catalog(path)
+        
+        self.assertEqual(Product.objects.get(slug='mouse').description, 'Segunda')
+        self.assertEqual(self.read_rejects(path)[0]['line'], 2)
+    
+    def test_rows_without_slug_always_create(self):
+        """Test sin slug no se empareja por nombre: mismos nombres, renombrados y nombres sin slug crean productos"""
+        path = self.write_file('catalogo.csv', (
+            'name,description,price,category\n'
+            'Mouse,Primera,10,Electrónicos\n'
+            'Mouse,Segunda,12,Electrónicos\n'
+            'Laptop,Otra,700,Electrónicos\n'
+            '¡¡¡,Sin letras,5,Hogar\n'
+            '???,Sin letras,5,Hogar\n'
+        ))
+        output = self.import_catalog(path)
+        
+        self.assertIn('5 creados, 0 actualizados, 0 rechazados', output)
+        self.assertEqual(
+            set(Product.objects.filter(name='Mouse').values_list('slug', 'description')),
+            {('mouse', 'Primera'), ('mouse-2', 'Segunda')}
+        )
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.description, 'Antigua')
+        self.assertEqual(Product.objects.filter(category=self.other_category).count(), 2)
+    
+    def test_blank_cells_keep_stored_values(self):
+        """Test una celda vacía no pisa el valor guardado (p. ej. el stock)"""
+        path = self.write_file('catalogo.csv', (
+            'name,slug,description,price,stock,category\n'
+            'Laptop,laptop,Nueva,450,,Electrónicos\n'
+            'Tablet,,Nueva,200,,Electrónicos\n'
+        ))
+        self.import_catalog(path)
+        
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.description, self.existing.stock), ('Nueva', 1))
+        self.assertEqual(Product.objects.get(slug='tablet').stock, 0)
+    
+    def test_partial_rows_update_existing_products(self):
+        """Test sin nombre, descripción ni precio se actualiza un producto existente, pero no se crea uno nuevo"""
+        path = self.write_file('stock.csv', (
+            'slug,stock,category\n'
+            'laptop,7,\n'
+            'tablet,3,Electrónicos\n'
+        ))
+        output = self.import_catalog(path)
+        
+        self.assertIn('0 creados, 1 actualizados, 1 rechazados', output)
+        self.existing.refresh_from_db()
+        self.assertEqual(
+            (self.existing.name, self.existing.price, self.existing.stock, self.existing.category_id),
+            ('Laptop', Decimal('500.00'), 7, self.category.id)
+        )
+        rejects = self.read_rejects(path)
+        self.assertEqual(rejects[0]['line'], 3)
+        self.assertEqual(sorted(rejects[0]['errors']), ['description', 'name', 'price'])
+    
+    def test_partial_rows_validate_filled_cells(self):
+        """Test en un producto existente se validan las celdas con valor y se puede mover de categoría"""
+        path = self.write_file('precio.csv', 'slug,name,price,category\nlaptop,,barato,\n')
+        self.import_catalog(path)
+        self.assertEqual(list(self.read_rejects(path)[0]['errors']), ['price'])
+        
+        path = self.write_file('catalogo.csv', 'slug,name,price,category\nlaptop,,450,Hogar\n')
+        self.import_catalog(path)
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.price, self.existing.category_id), (Decimal('450.00'), self.other_category.id))
+        self.category.refresh_from_db()
+        self.other_category.refresh_from_db()
+        self.assertEqual((self.category.active_products_count, self.other_category.active_products_count), (0, 1))
+    
+    def test_counters_and_related_after_import(self):
+        """Test sin señales por fila, los contadores y relacionados quedan al día"""
+        rows = ''.join(f'Producto {number},Test,10,Hogar\n' for number in range(5))
+        path = self.write_file('catalogo.csv', 'name,description,price,category\n' + rows)
+        self.import_catalog(path, chunk_size=2)
+        
+        self.other_category.refresh_from_db()
+        self.assertEqual(self.other_category.active_products_count, 5)
+        self.assertEqual(CategoryRelatedProduct.objects.filter(category=self.other_category).count(), 5)
+    
+    def test_queries_do_not_grow_with_rows(self):
+        """Test el número de consultas depende de los bloques, no de las filas"""
+        def queries_for(total, name):
+            rows = ''.join(f'{name} {number},Test,10,Electrónicos\n' for number in range(total))
+            path = self.write_file(f'{name}.csv', 'name,description,price,category\n' + rows)
+            with CaptureQueriesContext(connection) as context:
+                self.import_catalog(path, chunk_size=1000)
+            # Los relacionados por categoría se recalculan al final: a lo sumo
+            # RELATED_PRODUCTS_LIMIT + 1 filas por categoría, también constante
+            return len(context.captured_queries)
+        
+        self.assertEqual(queries_for(5, 'Pocos'), queries_for(50, 'Muchos'))
+
+
+class ProductBulkAPITest(APITestCase):
+    """Tests para /api/products/bulk/"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email='admin@example.com',
+            password='adminpass123',
+            first_name='Admin',
+            last_name='User'
+        )
+        self.category = Category.objects.create(name='Electrónicos')
+        self.other_category = Category.objects.create(name='Hogar')
+        self.products = [
+            Product.objects.create(
+                name=f'Producto {number}',
+                description='Test',
+                price=Decimal('10.00'),
+                stock=1,
+                category=self.category
+            )
+            for number in range(3)
+        ]
+        self.url = reverse('products:product-bulk')
+        self.client.force_authenticate(self.admin_user)
+    
+    def test_requires_admin(self):
+        """Test solo los administradores pueden usar las operaciones en bloque"""
+        self.client.force_authenticate(None)
+        response = self.client.patch(self.url, [{'slug': 'producto-0', 'stock': 5}], format='json')
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+    
+    def test_bulk_update_price_and_stock(self):
+        """Test actualiza precio y stock de varios productos con un número fijo de consultas"""
+        items = [
+            {'slug': product.slug, 'price': f'{20 + number}.50', 'stock': number}
+            for number, product in enumerate(self.products)
+        ]
+        # SELECT ... FOR UPDATE y un UPDATE (más el savepoint de la transacción)
+        with self.assertNumQueries(4):
+            response = self.client.patch(self.url, items, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'updated': 3, 'errors': []})
+        prices = dict(Product.objects.values_list('slug', 'price'))
+        self.assertEqual(prices['producto-2'], Decimal('22.50'))
+        self.assertEqual(Product.objects.get(slug='producto-0').stock, 0)
+    
+    def test_bulk_update_partial_success(self):
+        """Test los items válidos se aplican y los inválidos devuelven su error con la posición"""
+        items = [
+            {'slug': 'producto-0', 'price': '-1'},
+            {'slug': 'no-existe', 'stock': 2},
+            {'stock': 2},
+            {'slug': 'producto-1', 'stock': 9},
+        ]
+        response = self.client.patch(self.url, items, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 1)
+        errors = {error['index']: error for error in response.data['errors']}
+        self.assertEqual(sorted(errors), [0, 1, 2])
+        self.assertIn('price', errors[0]['errors'])
+        self.assertEqual(errors[1]['slug'], 'no-existe')
+        self.assertIn('slug', errors[2]['errors'])
+        self.assertEqual(Product.objects.get(slug='producto-0').price, Decimal('10.00'))
+        self.assertEqual(Product.objects.get(slug='producto-1').stock, 9)
+    
+    def test_bulk_update_keeps_counters(self):
+        """Test mover y desactivar productos en bloque mantiene los contadores de las categorías"""
+        items = [
+            {'slug': 'producto-0', 'category': self.other_category.id},
+            {'slug': 'producto-1', 'is_active': False},
+        ]
+        self.client.patch(self.url, items, format='json')
+        
+        self.category.refresh_from_db()
+        self.other_category.refresh_from_db()
+        self.assertEqual(self.category.active_products_count, 1)
+        self.assertEqual(self.other_category.active_products_count, 1)
+    
+    def test_bulk_create(self):
+        """Test crea los productos válidos y rechaza slugs existentes y categorías desconocidas"""
+        items = [
+            {'name': 'Mouse', 'description': 'Óptico', 'price': '15.00', 'stock': 3, 'category': self.category.id},
+            {'name': 'Otro', 'slug': 'producto-0', 'description': 'x', 'price': '15.00', 'category': self.category.id},
+            {'name': 'Silla', 'description': 'x', 'price': '15.00', 'category': 999},
+        ]
+        response = self.client.post(self.url, items, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertTrue(Product.objects.filter(slug='mouse', stock=3).exists())
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.active_products_count, 4)
+    
+    def test_all_items_invalid(self):
+        """Test si no se aplica ningún item la respuesta es 400"""
+        response = self.client.patch(self.url, [{'slug': 'no-existe', 'stock': 1}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['updated'], 0)
+    
+    @override_settings(PRODUCT_BULK_MAX_ITEMS=2)
+    def test_max_items(self):
+        """Test rechaza peticiones con más items que PRODUCT_BULK_MAX_ITEMS"""
+        items = [{'slug': product.slug, 'stock': 1} for product in self.products]
+        response = self.client.patch(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductImageReorderTest(APITestCase):
+    """Tests para /api/images/reorder/"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email='admin@example.com',
+            password='adminpass123',
+            first_name='Admin',
+            last_name='User'
+        )
+        self.category = Category.objects.create(name='Electrónicos')
+        self.product = Product.objects.create(
+            name='Laptop', description='Test', price=Decimal('10.00'), category=self.category
+        )
+        self.other_product = Product.objects.create(
+            name='Mouse', description='Test', price=Decimal('10.00'), category=self.category
+        )
+        self.images = [
+            ProductImage.objects.create(product=self.product, image_url=f'https://example.com/{number}.jpg', order=number)
+            for number in range(3)
+        ]
+        self.foreign_image = ProductImage.objects.create(
+            product=self.other_product, image_url='https://example.com/mouse.jpg'
+        )
+        self.url = reverse('products:productimage-reorder')
+        self.client.force_authenticate(self.admin_user)
+    
+    def image_orders(self):
+        return list(ProductImage.objects.filter(product=self.product).order_by('order').values_list('id', flat=True))
+    
+    def test_reorder_single_update(self):
+        """Test valida con un SELECT y reordena con un UPDATE"""
+        reversed_ids = [image.id for image in reversed(self.images)]
+        data = {'image_orders': [{'id': image_id, 'order': order} for order, image_id in enumerate(reversed_ids)]}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.image_orders(), reversed_ids)
+        image_queries = [query['sql'] for query in context.captured_queries if 'products_productimage' in query['sql']]
+        self.assertEqual(len(image_queries), 2)
+        self.assertTrue(image_queries[1].startswith('UPDATE'))
+    
+    def test_reorder_touches_product(self):
+        """Test reordenar actualiza el updated_at del producto"""
+        before = self.product.updated_at
+        data = {'image_orders': [{'id': self.images[0].id, 'order': 5}]}
+        self.client.post(self.url, data, format='json')
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_at, before)
+    
+    def test_reorder_rejects_other_product_images(self):
+        """Test rechaza imágenes de otro producto sin aplicar ningún cambio"""
+        data = {
+            'product': self.product.id,
+            'image_orders': [
+                {'id': self.images[0].id, 'order': 9},
+                {'id': self.foreign_image.id, 'order': 0},
+            ]
+        }
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.image_orders(), [image.id for image in self.images])
+    
+    def test_set_main_updates_product(self):
+        """Test set_main cambia la principal y la imagen desnormalizada del producto"""
+        url = reverse('products:productimage-set-main', kwargs={'pk': self.images[2].id})
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(ProductImage.objects.filter(is_main=True).values_list('id', flat=True)), [self.images[2].id])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.primary_image_url, 'https://example.com/2.jpg')
+    
+    def test_reorder_rejects_unknown_and_repeated_ids(self):
+        """Test rechaza ids inexistentes o repetidos"""
+        for image_orders in (
+            [{'id': 999, 'order': 0}],
+            [{'id': self.images[0].id, 'order': 0}, {'id': self.images[0].id, 'order': 1}],
+            [],
+        ):
+            response = self.client.post(self.url, {'image_orders': image_orders}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=[160, 320], IMAGE_VARIANT_FORMATS=['webp', 'jpeg'], IMAGE_VARIANT_WORKERS=0)
+class ProductImageVariantsTest(APITestCase):
+    """Tests para las variantes responsive de las imágenes subidas"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email='admin@example.com',
+            password='adminpass123',
+            first_name='Admin',
+            last_name='User'
+        )
+        self.category = Category.objects.create(name='Electrónicos')
+        self.product = Product.objects.create(
+            name='Laptop', description='Test', price=Decimal('10.00'), category=self.category
+        )
+        self.client.force_authenticate(self.admin_user)
+        # Storage simulado: la URL pública es la ruta dentro del bucket
+        self.uploaded = {}
+        
+        def upload_bytes(content, file_path, content_type):
+            self.uploaded[file_path] = content_type
+            return f'https://cdn.example.com/{file_path}'
+        patcher = mock.patch.object(storage_service, 'upload_bytes', side_effect=upload_bytes)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def upload(self, width=800, height=400):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'blue').save(buffer, 'JPEG')
+        image = SimpleUploadedFile('foto.jpg', buffer.getvalue(), content_type='image/jpeg')
+        return self.client.post(reverse('products:product-upload-image'), {'image': image}, format='multipart')
+    
+    def test_upload_stores_variants_next_to_original(self):
+        """Test la subida guarda el original y una variante por ancho y formato"""
+        response = self.upload()
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        stem = response.data['image_url'][:-len('.jpg')]
+        self.assertEqual(
+            [(variant['url'], variant['width'], variant['height'], variant['format']) for variant in response.data['variants']],
+            [
+                (f'{stem}_160.webp', 160, 80, 'webp'), (f'{stem}_160.jpg', 160, 80, 'jpeg'),
+                (f'{stem}_320.webp', 320, 160, 'webp'), (f'{stem}_320.jpg', 320, 160, 'jpeg'),
+            ]
+        )
+        self.assertEqual(len(self.uploaded), 5)
+        self.assertEqual(response.data['srcset']['webp'], f'{stem}_160.webp 160w, {stem}_320.webp 320w')
+    
+    def test_product_image_exposes_srcset(self):
+        """Test las variantes se guardan en la imagen y el producto expone su srcset"""
+        upload = self.upload().data
+        response = self.client.post(reverse('products:productimage-list'), {
+            'product': self.product.id,
+            'image_url': upload['image_url'],
+            'variants': upload['variants'],
+            'is_main': True,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        
+        image = ProductImage.objects.get(product=self.product)
+        self.assertEqual(image.variants, upload['variants'])
+        detail = self.client.get(reverse('products:product-detail', kwargs={'slug': self.product.slug})).data
+        self.assertEqual(detail['images'][0]['srcset'], upload['srcset'])
+        # Sin main_image_url, las tarjetas usan las variantes de la imagen principal de la galería
+        self.assertEqual(detail['main_image_srcset'], upload['srcset'])
+    
+    def test_invalid_variants_rejected(self):
+        """Test las variantes deben traer URL, dimensiones y un formato conocido"""
+        response = self.client.post(reverse('products:productimage-list'), {
+            'product': self.product.id,
+            'image_url': 'https://example.com/a.jpg',
+            'variants': [{'url': 'https://example.com/a_160.gif', 'width': 0, 'height': 80, 'format': 'gif'}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('variants', response.data['error']['details'])
+    
+    def test_main_image_url_changed_by_hand(self):
+        """Test si main_image_url ya no es la imagen subida, no se usan sus variantes"""
+        self.product.main_image_url = 'https://cdn.example.com/products/a.jpg'
+        self.product.main_image_variants = [
+            {'url': 'https://cdn.example.com/products/a_160.webp', 'width': 160, 'height': 80, 'format': 'webp'}
+        ]
+        self.product.save()
+        self.assertEqual(self.product.get_main_image_srcset(), {'webp': 'https://cdn.example.com/products/a_160.webp 160w'})
+        
+        self.product.main_image_url = 'https://example.com/otra.jpg'
+        self.assertEqual(self.product.get_main_image_srcset(), {})
+
+
+class ImageResizeTest(TestCase):
+    """Tests para /api/images/resize/<ruta>"""
+    
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        settings_override = override_settings(IMAGE_RESIZE_CACHE_DIR=directory, IMAGE_VARIANT_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        buffer = BytesIO()
+        Image.new('RGB', (1000, 500), 'green').save(buffer, 'JPEG')
+        patcher = mock.patch.object(storage_service, 'download_image', return_value=buffer.getvalue())
+        self.download = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = reverse('products:image-resize', kwargs={'key': 'products/foto.jpg'})
+    
+    def test_renders_once_then_serves_from_cache(self):
+        """Test la primera petición renderiza y las siguientes salen de la caché en disco"""
+        response = self.client.get(self.url, {'w': 300, 'fmt': 'webp'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with Image.open(BytesIO(response.content)) as image:
+            # El ancho se redondea al paso configurado (40 px)
+            self.assertEqual(image.size, (320, 160))
+        
+        cached = self.client.get(self.url, {'w': 300, 'fmt': 'webp'})
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached.content, response.content)
+        self.download.assert_called_once_with('products/foto.jpg')
+    
+    def test_not_modified(self):
+        """Test con el ETag vigente responde 304 sin leer la imagen"""
+        etag = self.client.get(self.url, {'w': 160, 'fmt': 'jpeg'})['ETag']
+        self.download.reset_mock()
+        response = self.client.get(self.url, {'w': 160, 'fmt': 'jpeg'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.download.assert_not_called()
+    
+    def test_quality_rounded_to_step(self):
+        """Test calidades cercanas comparten variante: se redondean al paso configurado (5)"""
+        response = self.client.get(self.url, {'w': 160, 'fmt': 'jpeg', 'q': 83})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        
+        cached = self.client.get(self.url, {'w': 160, 'fmt': 'jpeg', 'q': 86})
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.download.assert_called_once_with('products/foto.jpg')
+    
+    def test_format_from_accept_header(self):
+        """Test sin fmt se sirve WebP a quien lo acepta y JPEG al resto"""
+        response = self.client.get(self.url, {'w': 160}, HTTP_ACCEPT='image/avif,image/webp,*/*')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        response = self.client.get(self.url, {'w': 160}, HTTP_ACCEPT='image/*')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+    
+    def test_invalid_requests(self):
+        """Test parámetros fuera de rango, rutas no permitidas e imágenes inexistentes"""
+        for params in ({}, {'w': 'ancho'}, {'w': 99999}, {'w': 160, 'fmt': 'gif'}, {'w': 160, 'q': 5}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+        
+        url = reverse('products:image-resize', kwargs={'key': 'products/../secreto.jpg'})
+        self.assertEqual(self.client.get(url, {'w': 160}).status_code, 404)
+        
+        self.download.side_effect = StorageObjectNotFound('products/foto.jpg')
+        response = self.client.get(self.url, {'w': 640})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('Cache-Control'))
+    
+    def test_transient_failures_are_not_404(self):
+        """Test Storage caído, imagen ilegible y timeout no se confunden con una imagen inexistente"""
+        for side_effect, expected in [
+            (Exception('Error al descargar archivo: timed out'), 502),
+            ([b'no es una imagen'], 502),
+            (FutureTimeoutError(), 504),
+        ]:
+            self.download.side_effect = side_effect
+            response = self.client.get(self.url, {'w': 640})
+            self.assertEqual(response.status_code, expected, side_effect)
+            self.assertFalse(response.has_header('Cache-Control'))
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=[160], IMAGE_VARIANT_FORMATS=['webp'], IMAGE_VARIANT_WORKERS=0)
+class ProductImageBatchUploadTest(APITestCase):
+    """Tests para /api/products/upload_images/"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email='admin@example.com',
+            password='adminpass123',
+            first_name='Admin',
+            last_name='User'
+        )
+        self.category = Category.objects.create(name='Electrónicos')
+        self.product = Product.objects.create(
+            name='Laptop', description='Test', price=Decimal('10.00'), category=self.category
+        )
+        ProductImage.objects.create(product=self.product, image_url='https://example.com/0.jpg', order=3)
+        self.url = reverse('products:product-upload-images')
+        self.client.force_authenticate(self.admin_user)
+        self.failing = set()
+        
+        def upload_bytes(content, file_path, content_type):
+            if content in self.failing:
+                raise Exception('Bucket no disponible')
+            return f'https://cdn.example.com/{file_path}'
+        patcher = mock.patch.object(storage_service, 'upload_bytes', side_effect=upload_bytes)
+        self.upload_bytes = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def make_file(self, name, color='red'):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+    
+    def post(self, files, **data):
+        return self.client.post(self.url, {'images': files, **data}, format='multipart')
+    
+    def test_results_in_request_order(self):
+        """Test cada archivo tiene su resultado o sus errores, en el orden enviado"""
+        invalid = SimpleUploadedFile('notas.txt', b'no es una imagen', content_type='text/plain')
+        response = self.post([self.make_file('a.jpg'), invalid, self.make_file('b.jpg', 'blue')])
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['uploaded'], 2)
+        results = response.data['results']
+        self.assertEqual([result['name'] for result in results], ['a.jpg', 'notas.txt', 'b.jpg'])
+        self.assertIn('errors', results[1])
+        for result in (results[0], results[2]):
+            self.assertTrue(result['image_url'].startswith('https://cdn.example.com/products/'))
+            self.assertEqual([variant['width'] for variant in result['variants']], [160])
+            self.assertIn('webp', result['srcset'])
+        # Original y una variante por imagen válida
+        self.assertEqual(self.upload_bytes.call_count, 4)
+    
+    def test_uploads_run_concurrently(self):
+        """Test las subidas se reparten entre los hilos del pool"""
+        barrier = threading.Barrier(2, timeout=5)
+        
+        def upload_bytes(content, file_path, content_type):
+            if file_path.endswith('.jpg'):
+                # Solo pasa si las dos subidas del original están en curso a la vez
+                barrier.wait()
+            return f'https://cdn.example.com/{file_path}'
+        self.upload_bytes.side_effect = upload_bytes
+        
+        response = self.post([self.make_file('a.jpg'), self.make_file('b.jpg')])
+        self.assertEqual(response.data['uploaded'], 2)
+    
+    def test_creates_product_images_in_one_insert(self):
+        """Test con product las imágenes se crean con un solo INSERT, tras las existentes"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.post(
+                [self.make_file('a.jpg'), self.make_file('b.jpg', 'blue')],
+                product=self.product.id
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        inserts = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('INSERT INTO "products_productimage"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        images = list(ProductImage.objects.filter(product=self.product).order_by('order'))
+        self.assertEqual([image.order for image in images], [3, 4, 5])
+        self.assertEqual([image.id for image in images[1:]], [result['id'] for result in response.data['results']])
+        self.assertEqual(images[1].variants, response.data['results'][0]['variants'])
+        self.assertEqual(images[1].alt_text, 'Laptop')
+    
+    def test_storage_error_reported_per_file(self):
+        """Test un fallo de storage solo afecta a su archivo"""
+        broken = self.make_file('roto.jpg', 'black')
+        self.failing.add(broken.read())
+        broken.seek(0)
+        response = self.post([broken, self.make_file('a.jpg')], product=self.product.id)
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.data['results']
+        self.assertIn('Bucket no disponible', results[0]['errors'][0])
+        self.assertIn('id', results[1])
+        self.assertEqual(ProductImage.objects.filter(product=self.product).count(), 2)
+    
+    def test_all_failed(self):
+        """Test si no se sube ninguna la respuesta es 400"""
+        invalid = SimpleUploadedFile('notas.txt', b'texto', content_type='text/plain')
+        response = self.post([invalid], product=self.product.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['uploaded'], 0)
+        self.assertEqual(ProductImage.objects.filter(product=self.product).count(), 1)
+    
+    @override_settings(IMAGE_UPLOAD_BATCH_MAX_FILES=1)
+    def test_max_files(self):
+        """Test se rechaza la petición con más archivos que el máximo"""
+        response = self.post([self.make_file('a.jpg'), self.make_file('b.jpg')])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.upload_bytes.assert_not_called()
+    
+    def test_requires_admin(self):
+        """Test solo administradores pueden subir imágenes"""
+        self.client.force_authenticate(None)
+        response = self.post([self.make_file('a.jpg')])
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
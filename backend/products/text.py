@@ -0,0 +1,75 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+# Palabras vacías del español (ya sin acentos, tal como quedan tras fold_accents)
+SPANISH_STOPWORDS = frozenset("""
+    a al algo algunas algunos ante antes como con contra cual cuando de del desde donde
+    durante e el ella ellas ellos en entre era es esa esas ese eso esos esta estas este
+    esto estos fue ha hasta hay la las le les lo los mas me mi mis mucho muchos muy ni
+    no nos o otra otras otro otros para pero poco por porque que quien se sea ser si sin
+    sobre su sus tambien te tiene todo todos tu tus un una uno unos y ya yo
+""".split())
+
+# Sufijos derivativos, del más largo al más corto
+_DERIVATIONAL_SUFFIXES = (
+    'amientos', 'imientos', 'aciones', 'uciones', 'amiento', 'imiento',
+    'adoras', 'adores', 'ancias', 'mente', 'acion', 'ucion', 'adora', 'ador',
+    'ancia', 'anzas', 'anza', 'ismos', 'istas', 'ables', 'ibles', 'idades',
+    'idad', 'ismo', 'ista', 'able', 'ible', 'osos', 'osas', 'oso', 'osa',
+)
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def fold_accents(text):
+    """Pasa a minúsculas y elimina tildes y diéresis (camión -> camion, ñ -> n)"""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+@lru_cache(maxsize=200_000)
+def stem(token):
+    """
+    Stemmer ligero para español
+
+    Unifica plural/singular y masculino/femenino y recorta los sufijos
+    derivativos más comunes. No pretende ser lingüísticamente exacto: solo
+    debe aplicarse igual a documentos y consultas.
+    """
+    if len(token) <= 3 or token.isdigit():
+        return token
+
+    for suffix in _DERIVATIONAL_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            break
+    else:
+        # Plurales: botones -> boton, zapatos -> zapato
+        if token.endswith('es') and len(token) > 4 and token[-3] not in 'aeiou':
+            token = token[:-2]
+        elif token.endswith('s') and len(token) > 3:
+            token = token[:-1]
+
+    # Género / vocal temática: zapato, zapata -> zapat
+    if len(token) > 3 and token[-1] in 'aeo':
+        token = token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Texto -> lista de raíces, sin tildes ni palabras vacías"""
+    if not text:
+        return []
+    return [
+        stem(token) for token in _TOKEN_RE.findall(fold_accents(text))
+        if len(token) > 1 and token not in SPANISH_STOPWORDS
+    ]
+
+
+def trigrams(term):
+    """Trigramas de caracteres con bordes marcados ('bota' -> {'$bo', 'bot', 'ota', 'ta$'})"""
+    padded = f'${term}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet, ProductViewSet, ProductImageViewSet
+from .views import CategoryViewSet, ProductViewSet, ProductImageViewSet, resize_image
 
 app_name = 'products'
 
@@ -10,5 +10,6 @@ router.register(r'products', ProductViewSet, basename='product')
 router.register(r'images', ProductImageViewSet, basename='productimage')
 
 urlpatterns = [
+    path('images/resize/<path:key>', resize_image, name='image-resize'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
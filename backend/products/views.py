@@ -2,23 +2,60 @@ from rest_framework import viewsets, status, permissions, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
-from .models import Category, Product, ProductImage
+import logging
+import re
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from .models import Category, CategoryRelatedProduct, Product, ProductImage, RelatedProduct
+from .related import related_cards
+from .filters import ProductSearchFilter, SearchRankOrderingFilter
+from .search import search_products, is_ranked
+from .facets import compute_product_facets, facets_cache_key, parse_price_edges
+from .cache import cache_catalog_response, get_versioned, set_versioned
+from .compound import PRODUCT_INCLUDES, product_document
+from .bulk import bulk_create_products, bulk_update_products
 from core.permissions import IsAdminOrReadOnly
+from core.pagination import KeysetPagination
+from core.conditional import build_validators, conditional_response, not_modified_response
+from core.image_cache import ImageDiskCache, get_image_cache
+from core.imaging import VARIANT_FORMATS, build_variants, parse_resize_params
+from core.exceptions import StorageObjectNotFound
+from core.services import storage_service
+from core.compound import parse_include
+from core.serializers import requested_relations
+from core.views import ValuesListMixin
 from .serializers import (
     CategorySerializer,
+    CategoryValuesSerializer,
     ProductSerializer,
+    ProductValuesSerializer,
     ProductDetailSerializer,
     ProductCreateSerializer,
+    ProductResourceSerializer,
     ProductImageSerializer,
     ImageUploadSerializer,
+    ImageBatchUploadSerializer,
+    ImageReorderSerializer,
     ProductImageCreateSerializer
 )
 
+logger = logging.getLogger(__name__)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+# Rutas del bucket que se pueden redimensionar: carpeta/archivo.ext, sin '..'
+RESIZE_KEY_PATTERN = re.compile(r'^[\w-]+(/[\w-]+)*\.(jpe?g|png|webp)$', re.IGNORECASE)
+# Cambiarla invalida las variantes ya guardadas en la caché en disco
+RESIZE_RENDER_VERSION = 1
+
+
+class CategoryViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Category.objects.filter(is_active=True)
     serializer_class = CategorySerializer
+    values_serializer_class = CategoryValuesSerializer
     lookup_field = 'slug'
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
@@ -27,14 +64,39 @@ class CategoryViewSet(viewsets.ModelViewSet):
     
     permission_classes = [IsAdminOrReadOnly]
     
-    @action(detail=True, methods=['get'])
+    @cache_catalog_response
+    @conditional_response('get_list_validators')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @conditional_response('get_detail_validators')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    def get_list_validators(self, request, *args, **kwargs):
+        # El contador de productos también actualiza updated_at
+        summary = self.filter_queryset(self.get_queryset()).order_by().aggregate(
+            count=Count('id'),
+            last_modified=Max('updated_at')
+        )
+        return build_validators('categories', summary['count'], summary['last_modified'])
+    
+    def get_detail_validators(self, request, slug=None):
+        category = self.get_queryset().filter(slug=slug).values_list('id', 'updated_at').first()
+        if category is None:
+            return None
+        return build_validators('category', *category)
+    
+    @action(detail=True, methods=['get'], pagination_class=KeysetPagination)
     def products(self, request, slug=None):
         """Obtener productos de una categoría"""
-        category = self.get_object()
+        # ?search= aplica a los productos, no al listado de categorías (no usar get_object)
+        category = get_object_or_404(self.get_queryset(), slug=slug)
+        self.check_object_permissions(request, category)
         products = Product.objects.filter(
             category=category,
             is_active=True
-        ).order_by('-created_at')
+        ).with_card_data(requested_relations(ProductSerializer, request)).order_by('-created_at')
         
         # Aplicar filtros
         min_price = request.query_params.get('min_price')
@@ -46,9 +108,12 @@ class CategoryViewSet(viewsets.ModelViewSet):
         if max_price:
             products = products.filter(price__lte=max_price)
         if search:
-            products = products.filter(
-                Q(name__icontains=search) | Q(description__icontains=search)
-            )
+            products = search_products(products, search)
+            if is_ranked(products):
+                products = products.order_by('-search_rank', '-created_at')
+        
+        if settings.FAST_LIST_SERIALIZATION:
+            return self.values_list_response(products, ProductValuesSerializer)
         
         page = self.paginate_queryset(products)
         if page is not None:
@@ -59,16 +124,20 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.filter(is_active=True)
+    values_serializer_class = ProductValuesSerializer
     lookup_field = 'slug'
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, SearchRankOrderingFilter]
     filterset_fields = ['category', 'is_featured']
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'price', 'created_at']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
+        if self.get_includes() is not None:
+            return ProductResourceSerializer
         if self.action == 'retrieve':
             return ProductDetailSerializer
         elif self.action in ['create', 'update', 'partial_update']:
@@ -77,8 +146,79 @@ class ProductViewSet(viewsets.ModelViewSet):
     
     permission_classes = [IsAdminOrReadOnly]
     
+    def get_includes(self):
+        """
+        Relaciones de ?include= en listado y detalle, o None si la petición no
+        es compuesta (se responde con el formato anidado de siempre)
+        """
+        if self.action not in ('list', 'retrieve'):
+            return None
+        return parse_include(self.request, PRODUCT_INCLUDES)
+    
+    def list(self, request, *args, **kwargs):
+        includes = self.get_includes()
+        if includes is None:
+            return super().list(request, *args, **kwargs)
+        
+        # Documento compuesto: una consulta por tipo de relación incluida
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows, included = product_document(page if page is not None else queryset, includes, self.get_serializer_context())
+        if page is None:
+            return Response({'results': rows, 'included': included})
+        response = self.get_paginated_response(rows)
+        response.data['included'] = included
+        return response
+    
+    @conditional_response('get_detail_validators')
+    def retrieve(self, request, *args, **kwargs):
+        includes = self.get_includes()
+        if includes is None:
+            return super().retrieve(request, *args, **kwargs)
+        rows, included = product_document([self.get_object()], includes, self.get_serializer_context())
+        return Response({'data': rows[0], 'included': included})
+    
+    def get_detail_validators(self, request, slug=None):
+        """
+        El detalle incluye la categoría y los relacionados por categoría, que
+        salen de la lista de su categoría (CategoryRelatedProduct, a lo sumo
+        RELATED_PRODUCTS_LIMIT + 1 filas): bastan el producto, la categoría y
+        esa lista (al cambiar, sus filas se recrean con otro id). Las imágenes
+        actualizan el updated_at de su producto. Los similares se cubren con
+        los enlaces del producto y el updated_at de los productos enlazados.
+        """
+        category_links = CategoryRelatedProduct.objects.filter(
+            category=OuterRef('category'),
+            product__is_active=True
+        ).order_by().values('category')
+        links = RelatedProduct.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        similar = links.filter(kind=RelatedProduct.KIND_SIMILAR)
+        summary = Product.objects.filter(slug=slug, is_active=True).annotate(
+            category_modified=F('category__updated_at'),
+            related_count=Subquery(category_links.annotate(total=Count('id')).values('total')),
+            related_last=Subquery(category_links.annotate(last=Max('id')).values('last')),
+            related_modified=Subquery(category_links.annotate(last=Max('product__updated_at')).values('last')),
+            links=Subquery(links.annotate(total=Count('id')).values('total')),
+            last_link=Subquery(links.annotate(last=Max('id')).values('last')),
+            similar_modified=Subquery(similar.annotate(last=Max('related__updated_at')).values('last'))
+        ).values_list(
+            'id', 'updated_at', 'category_modified', 'related_count', 'related_last',
+            'related_modified', 'links', 'last_link', 'similar_modified'
+        ).first()
+        if summary is None:
+            return None
+        return build_validators('product', slug, *summary)
+    
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # Categoría e imágenes se cargan en bloque para evitar consultas por
+        # fila, salvo las que ?fields= / ?omit= dejan fuera de la respuesta
+        relations = requested_relations(self.get_serializer_class(), self.request)
+        queryset = super().get_queryset().with_card_data(relations)
+        if self.action == 'retrieve':
+            if relations is None or 'category_links' in relations:
+                queryset = queryset.with_category_cards()
+            if relations is None or 'similar_links' in relations:
+                queryset = queryset.with_related_cards(RelatedProduct.KIND_SIMILAR)
         
         # Filtros personalizados
         min_price = self.request.query_params.get('min_price')
@@ -95,6 +235,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         return queryset
     
     @action(detail=False, methods=['get'])
+    @cache_catalog_response
     def featured(self, request):
         """Obtener productos destacados"""
         featured_products = self.get_queryset().filter(is_featured=True)[:8]
@@ -102,12 +243,64 @@ class ProductViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
+    @cache_catalog_response
     def latest(self, request):
         """Obtener productos más recientes"""
         latest_products = self.get_queryset().order_by('-created_at')[:8]
         serializer = self.get_serializer(latest_products, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def frequently_bought_with(self, request, slug=None):
+        """Productos que se suelen comprar junto a este (ver orders.recommendations)"""
+        # Una sola búsqueda por el índice (product, kind, rank), más las imágenes;
+        # sin enlaces se distingue un producto sin compras conjuntas de uno inexistente
+        links = list(related_cards(RelatedProduct.KIND_BOUGHT_TOGETHER).filter(
+            product__slug=slug,
+            product__is_active=True
+        ))
+        if not links:
+            get_object_or_404(Product.objects.filter(is_active=True).only('id'), slug=slug)
+        serializer = ProductSerializer([link.related for link in links], many=True, context={'request': request})
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Conteos para la barra de filtros: categorías, rangos de precio y stock"""
+        edges = parse_price_edges(request.query_params.get('price_buckets'))
+        cache_key = facets_cache_key(request.query_params, edges)
+        version, data = get_versioned(cache_key)
+        if data is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            data = compute_product_facets(queryset, edges)
+            set_versioned(cache_key, version, data, settings.PRODUCT_FACETS_CACHE_TIMEOUT)
+        return Response(data)
+    
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def bulk(self, request):
+        """
+        Crear productos en bloque (lista de productos con la categoría por id)
+        
+        Los items válidos se crean aunque otros fallen; los errores se
+        devuelven con la posición del item en la lista.
+        """
+        result = bulk_create_products(request.data)
+        return self.bulk_response(result, 'created', status.HTTP_201_CREATED)
+    
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        """Actualizar en bloque por slug solo los campos enviados (p. ej. precio y stock)"""
+        result = bulk_update_products(request.data)
+        return self.bulk_response(result, 'updated', status.HTTP_200_OK)
+    
+    def bulk_response(self, result, key, success_status):
+        # Éxito parcial: solo es 400 si no se aplicó ningún item
+        failed = result.errors and not result.applied
+        return Response(
+            {key: result.applied, 'errors': result.errors},
+            status=status.HTTP_400_BAD_REQUEST if failed else success_status
+        )
+    
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def upload_image(self, request):
         """Subir imagen a Supabase Storage"""
@@ -116,6 +309,23 @@ class ProductViewSet(viewsets.ModelViewSet):
             result = serializer.save()
             return Response(result, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def upload_images(self, request):
+        """
+        Subir varias imágenes (campo `images` repetido) en paralelo; con
+        `product`, crear también sus ProductImage
+        """
+        serializer = ImageBatchUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        results = serializer.save()
+        # Éxito parcial: solo es 400 si no se subió ninguna
+        uploaded = sum('errors' not in result for result in results)
+        return Response(
+            {'uploaded': uploaded, 'results': results},
+            status=status.HTTP_201_CREATED if uploaded else status.HTTP_400_BAD_REQUEST
+        )
 
 
 class ProductImageViewSet(viewsets.ModelViewSet):
@@ -138,31 +348,65 @@ class ProductImageViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def reorder(self, request):
         """Reordenar imágenes de un producto"""
-        image_orders = request.data.get('image_orders', [])
-        
-        for item in image_orders:
-            try:
-                image = ProductImage.objects.get(id=item['id'])
-                image.order = item['order']
-                image.save()
-            except ProductImage.DoesNotExist:
-                continue
-        
-        return Response({'message': 'Imágenes reordenadas correctamente'})
+        serializer = ImageReorderSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response({'message': 'Imágenes reordenadas correctamente'})
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=True, methods=['post'])
     def set_main(self, request, pk=None):
         """Establecer imagen como principal"""
         image = self.get_object()
-        
-        # Desmarcar otras imágenes como principales
-        ProductImage.objects.filter(
-            product=image.product,
-            is_main=True
-        ).update(is_main=False)
-        
-        # Marcar esta imagen como principal
+        # save() desmarca la anterior y actualiza la imagen principal del producto
         image.is_main = True
-        image.save()
+        image.save(update_fields=['is_main'])
         
         return Response({'message': 'Imagen establecida como principal'})
+
+
+@require_safe
+def resize_image(request, key):
+    """
+    Imagen `key` del bucket redimensionada bajo demanda: ?w=320&fmt=webp&q=80
+
+    Complementa las variantes pregeneradas (cambiar el diseño no obliga a
+    reprocesar ProductImage). Cada variante se renderiza una sola vez, aunque
+    lleguen varias peticiones a la vez, y se sirve desde la caché en disco
+
+    Solo responde 404 si el archivo no existe en el bucket; un fallo pasajero
+    (Storage caído, imagen ilegible) es 502 y agotar IMAGE_VARIANT_TIMEOUT
+    es 504, sin Cache-Control para que nadie lo guarde.
+    """
+    if not RESIZE_KEY_PATTERN.match(key):
+        return JsonResponse({'error': 'Imagen no encontrada'}, status=404)
+    try:
+        width, image_format, quality = parse_resize_params(request.GET, request.META.get('HTTP_ACCEPT', ''))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    _, content_type, extension = VARIANT_FORMATS[image_format]
+    cache_key = ImageDiskCache.make_key(RESIZE_RENDER_VERSION, key, width, image_format, quality)
+    etag = f'"{cache_key}"'
+    
+    response = not_modified_response(request, etag, None)
+    if response is None:
+        def render():
+            content = storage_service.download_image(key)
+            return build_variants(content, [width], [image_format], quality)[0]['content']
+        try:
+            content, hit = get_image_cache().get_or_render(cache_key, extension, render)
+        except StorageObjectNotFound:
+            return JsonResponse({'error': 'Imagen no encontrada'}, status=404)
+        except FutureTimeoutError:
+            logger.warning('Redimensionar %s superó IMAGE_VARIANT_TIMEOUT', key)
+            return JsonResponse({'error': 'La imagen tardó demasiado en procesarse'}, status=504)
+        except Exception as error:
+            logger.warning('No se pudo redimensionar %s: %s', key, error)
+            return JsonResponse({'error': 'No se pudo obtener la imagen'}, status=502)
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+    response['ETag'] = etag
+    response['Cache-Control'] = settings.IMAGE_RESIZE_CACHE_CONTROL
+    if 'fmt' not in request.GET:
+        patch_vary_headers(response, ['Accept'])
+    return response